@@ -0,0 +1,213 @@
+#include <chrono>
+#include <cmath>
+#include <iostream>
+#include <unordered_map>
+
+#include <Eigen/Sparse>
+
+#include "mesh.h"
+#include "sparse_assembly.h"
+#include "subdivision.h"
+
+// flags
+double SUBDIVIDE_LENGTH = 2e-2;
+double NEIGHBOR_LENGTH = 1.5e-2;
+double GRAPH_LENGTH = 1e-2;
+int REPEAT = 5;
+
+static double Seconds(std::chrono::steady_clock::time_point start) {
+	return std::chrono::duration<double>(
+		std::chrono::steady_clock::now() - start).count();
+}
+
+// The matrix of LinearEstimation: the squared cell weights between the
+// vertices of every graph cell, 1e-6 on the diagonal and the Laplacian of
+// the face edges and neighbor pairs E.
+struct System {
+	int num_V;
+	const std::vector<Eigen::Vector3i>* F;
+	const std::vector<std::pair<int, int> >* E;
+	std::vector<std::vector<int> > cells;
+	std::vector<FT> edge_weights;
+};
+
+template<class Func>
+static void ForEachEdge(const System& system, Func func) {
+	int e = 0;
+	for (auto& f : *system.F) {
+		for (int j = 0; j < 3; ++j)
+			func(f[j], f[(j + 1) % 3], system.edge_weights[e++]);
+	}
+	for (auto& edge : *system.E)
+		func(edge.first, edge.second, system.edge_weights[e++]);
+}
+
+// The accumulation LinearEstimation used before SparseAssembly: one hash
+// lookup per entry, then a triplet per distinct entry.
+static SpMat AssembleHashMap(const System& system) {
+	long long n = system.num_V;
+	std::unordered_map<long long, FT> entries;
+	auto add_entry_A = [&](int x, int y, FT w) {
+		long long key = x * n + y;
+		auto it = entries.find(key);
+		if (it == entries.end())
+			entries[key] = w;
+		else
+			it->second += w;
+	};
+	for (auto& cell : system.cells) {
+		double weight2 = 1.0 / (cell.size() * cell.size());
+		for (auto j : cell) {
+			for (auto k : cell)
+				add_entry_A(j, k, weight2);
+		}
+	}
+	for (int i = 0; i < n; ++i)
+		add_entry_A(i, i, 1e-6);
+	ForEachEdge(system, [&](int v0, int v1, FT w) {
+		add_entry_A(v0, v0, w);
+		add_entry_A(v0, v1, -w);
+		add_entry_A(v1, v0, -w);
+		add_entry_A(v1, v1, w);
+	});
+	std::vector<T> trips;
+	trips.reserve(entries.size());
+	for (auto& m : entries)
+		trips.push_back(T(m.first / n, m.first % n, m.second));
+	SpMat A(n, n);
+	A.setFromTriplets(trips.begin(), trips.end());
+	return A;
+}
+
+// Every term as a triplet, with the duplicates summed by setFromTriplets.
+static SpMat AssembleTriplets(const System& system) {
+	std::vector<T> trips;
+	for (auto& cell : system.cells) {
+		double weight2 = 1.0 / (cell.size() * cell.size());
+		for (auto j : cell) {
+			for (auto k : cell)
+				trips.push_back(T(j, k, weight2));
+		}
+	}
+	for (int i = 0; i < system.num_V; ++i)
+		trips.push_back(T(i, i, 1e-6));
+	ForEachEdge(system, [&](int v0, int v1, FT w) {
+		trips.push_back(T(v0, v0, w));
+		trips.push_back(T(v0, v1, -w));
+		trips.push_back(T(v1, v0, -w));
+		trips.push_back(T(v1, v1, w));
+	});
+	SpMat A(system.num_V, system.num_V);
+	A.setFromTriplets(trips.begin(), trips.end());
+	return A;
+}
+
+// The pattern compressed from the topology and the values accumulated in
+// place, as LinearSolver does.
+static SpMat AssemblePattern(const System& system) {
+	SparseAssembly assembly(system.num_V);
+	for (auto& cell : system.cells)
+		assembly.AddClique(cell);
+	assembly.AddFaceEdges(*system.F);
+	for (auto& e : *system.E)
+		assembly.AddEdge(e.first, e.second);
+	assembly.Compress();
+	for (auto& cell : system.cells) {
+		double weight2 = 1.0 / (cell.size() * cell.size());
+		for (auto j : cell) {
+			for (auto k : cell)
+				assembly.Entry(j, k) += weight2;
+		}
+	}
+	for (int i = 0; i < system.num_V; ++i)
+		assembly.Entry(i, i) += 1e-6;
+	ForEachEdge(system, [&](int v0, int v1, FT w) {
+		assembly.AddLaplacian(v0, v1, w);
+	});
+	return assembly.Matrix();
+}
+
+template<class Func>
+static double Time(Func func, SpMat* A) {
+	auto start = std::chrono::steady_clock::now();
+	for (int i = 0; i < REPEAT; ++i)
+		*A = func();
+	return Seconds(start) / REPEAT;
+}
+
+// Assembly time of the LinearEstimation system of a subdivided CAD mesh
+// through a hash map, through triplets and through SparseAssembly, against
+// the time of its factorization.
+int main(int argc, char** argv) {
+	if (argc < 2) {
+		printf("./assembly_benchmark cad.obj [SUBDIVIDE_LENGTH=2e-2] "
+			"[NEIGHBOR_LENGTH=1.5e-2] [GRAPH_LENGTH=1e-2] [REPEAT=5]\n");
+		return 0;
+	}
+	if (argc > 2)
+		sscanf(argv[2], "%lf", &SUBDIVIDE_LENGTH);
+	if (argc > 3)
+		sscanf(argv[3], "%lf", &NEIGHBOR_LENGTH);
+	if (argc > 4)
+		sscanf(argv[4], "%lf", &GRAPH_LENGTH);
+	if (argc > 5)
+		sscanf(argv[5], "%d", &REPEAT);
+
+	Mesh cad;
+	cad.ReadOBJ(argv[1]);
+	cad.RemoveDegenerated();
+	cad.MergeDuplex();
+
+	Subdivision sub;
+	sub.Subdivide(cad, SUBDIVIDE_LENGTH);
+	sub.ComputeGeometryNeighbors(NEIGHBOR_LENGTH);
+	sub.ComputeRepresentativeGraph(GRAPH_LENGTH);
+
+	auto& V = sub.GetMesh().GetV();
+	System system;
+	system.num_V = V.size();
+	system.F = &sub.GetMesh().GetF();
+	system.E = &sub.Neighbors();
+	for (int i = 0; i < V.size(); ++i) {
+		int r = sub.Vertex2Graph()[i];
+		if (r >= system.cells.size())
+			system.cells.resize(r + 1);
+		system.cells[r].push_back(i);
+	}
+	ForEachEdge(system, [&](int v0, int v1, FT) {
+		double reg = 2e-2 / ((V[v0] - V[v1]).norm() + 1e-8);
+		system.edge_weights.push_back(reg * reg);
+	});
+
+	SpMat hash_map, triplets, pattern;
+	double hash_map_time = Time([&]() {
+		return AssembleHashMap(system); }, &hash_map);
+	double triplets_time = Time([&]() {
+		return AssembleTriplets(system); }, &triplets);
+	double pattern_time = Time([&]() {
+		return AssemblePattern(system); }, &pattern);
+
+	Eigen::SimplicialLDLT<SpMat> solver;
+	auto start = std::chrono::steady_clock::now();
+	for (int i = 0; i < REPEAT; ++i) {
+		solver.analyzePattern(pattern);
+		solver.factorize(pattern);
+	}
+	double factorize_time = Seconds(start) / REPEAT;
+
+	std::cout << "vertices: " << system.num_V
+		<< "\tfaces: " << system.F->size()
+		<< "\tneighbor pairs: " << system.E->size()
+		<< "\tgraph cells: " << system.cells.size()
+		<< "\tnonzeros: " << pattern.nonZeros() << std::endl;
+	printf("hash map + triplets:\t%.4lf s\n", hash_map_time);
+	printf("triplets:\t%.4lf s (%.2lfx)\n", triplets_time,
+		hash_map_time / triplets_time);
+	printf("SparseAssembly:\t%.4lf s (%.2lfx)\n", pattern_time,
+		hash_map_time / pattern_time);
+	printf("factorization:\t%.4lf s\n", factorize_time);
+	printf("max difference:\t%g (hash map) %g (triplets)\n",
+		SpMat(pattern - hash_map).coeffs().cwiseAbs().maxCoeff(),
+		SpMat(pattern - triplets).coeffs().cwiseAbs().maxCoeff());
+	return 0;
+}
@@ -19,12 +19,22 @@ void callback()
 }
 // main function
 int main(int argc, char** argv) {	
+	DeformerOptions options;
+	argc = ParseDeformerOptions(argc, argv, &options);
 	if (argc < 5) {
 		printf("./cad_deform cad.obj reference.obj output.obj "
 			"[GRID_RESOLUTION=64] [MESH_RESOLUTION=5000] "
-			"[lambda=1] [symmetry=0] [flow_output=filename]\n");
+			"[lambda=1] [symmetry=0] [flow_output=filename]\n"
+			"[--num_threads=0] [--linear_solver=SPARSE_NORMAL_CHOLESKY] "
+			"[--preconditioner=JACOBI] [--max_num_iterations=100] "
+			"[--progress=1] [--analytic=1] [--levels=1]\n");
 		return 0;
 	}
+	// the flow is recorded from DeformSubdivision, which has no levels
+	if (argc > 8 && options.multiresolution_levels > 1) {
+		printf("--levels is not supported with flow_output\n");
+		return 1;
+	}
 	//Deform source to fit the reference
 
 
@@ -82,13 +92,19 @@ int main(int argc, char** argv) {
 
 	if (!need_callback) {
 		
-		Deformer deformer(lambda);
+		Deformer deformer(lambda, 0, options);
 		//deformer.DeformSubdivision(grid, &sub);
-		deformer.DeformGraph(grid, &sub);
-		sub.LinearSolve();
+		if (options.multiresolution_levels > 1) {
+			// the graph resolution above, in the normalized frame
+			deformer.DeformMultiresolution(ref, grid, 1e-2 / ref.GetScale(),
+				&sub);
+		} else {
+			deformer.DeformGraph(grid, &sub);
+			sub.LinearSolve();
+		}
 		
 	} else {
-		Deformer deformer(lambda, callback);
+		Deformer deformer(lambda, callback, options);
 
 		vertex_pointer = &subdivide_mesh.GetV();
 		deformer.DeformSubdivision(grid, &sub);
@@ -0,0 +1,95 @@
+#include <chrono>
+#include <cmath>
+#include <iostream>
+
+#include "mesh.h"
+#include "uniformgrid.h"
+
+// flags
+int GRID_RESOLUTION = 64;
+int NUM_THREADS = 0;
+
+static double Seconds(std::chrono::steady_clock::time_point start) {
+	return std::chrono::duration<double>(
+		std::chrono::steady_clock::now() - start).count();
+}
+
+// Compares the jump flooding distance field against the igl closest point
+// construction: wall time of both, and the error over all voxels and over
+// the voxels closer than 0.2, which are the only ones the losses read.
+// Also floods a narrow-band grid and reports its time, memory and error.
+int main(int argc, char** argv) {
+	if (argc < 2) {
+		printf("./distance_benchmark reference.obj "
+			"[GRID_RESOLUTION=64] [NUM_THREADS=0]\n");
+		return 0;
+	}
+
+	Mesh ref;
+	ref.ReadOBJ(argv[1]);
+	ref.Normalize();
+
+	if (argc > 2)
+		sscanf(argv[2], "%d", &GRID_RESOLUTION);
+	if (argc > 3)
+		sscanf(argv[3], "%d", &NUM_THREADS);
+
+	std::cout << "Reference:\t" << "Num vertices: " << ref.GetV().size()
+		<< "\tNum faces: " << ref.GetF().size() << std::endl;
+
+	UniformGrid exact(GRID_RESOLUTION);
+	auto start = std::chrono::steady_clock::now();
+	ref.ConstructDistanceField(exact, Mesh::AABB_DISTANCE);
+	double aabb_time = Seconds(start);
+
+	UniformGrid flooded(GRID_RESOLUTION);
+	start = std::chrono::steady_clock::now();
+	ref.ConstructDistanceField(flooded, Mesh::JUMP_FLOODING, NUM_THREADS);
+	double flooding_time = Seconds(start);
+
+	// the narrow band that gives the same lookups as the dense grid
+	UniformGrid banded(GRID_RESOLUTION, 0.2 + 2 * sqrt(3.0) / GRID_RESOLUTION);
+	start = std::chrono::steady_clock::now();
+	ref.ConstructDistanceField(banded, Mesh::JUMP_FLOODING, NUM_THREADS);
+	double banded_time = Seconds(start);
+
+	int grid_n = GRID_RESOLUTION;
+	double max_error = 0, sum_error = 0, max_band_error = 0;
+	double max_banded_error = 0;
+	long long num_wrong = 0, num_band = 0;
+	for (int i = 0; i < grid_n; ++i) {
+		for (int j = 0; j < grid_n; ++j) {
+			for (int k = 0; k < grid_n; ++k) {
+				double d0 = exact.GetDistance(i, j, k);
+				double error = std::abs(flooded.GetDistance(i, j, k) - d0);
+				max_error = std::max(max_error, error);
+				sum_error += error;
+				if (error > 1e-6)
+					num_wrong += 1;
+				if (d0 < 0.2) {
+					num_band += 1;
+					max_band_error = std::max(max_band_error, error);
+				}
+				if (banded.HasVoxel(i, j, k)) {
+					max_banded_error = std::max(max_banded_error,
+						std::abs(banded.GetDistance(i, j, k) - d0));
+				}
+			}
+		}
+	}
+	long long num_voxels = (long long)grid_n * grid_n * grid_n;
+
+	printf("igl AABB:\t%.3lf s\n", aabb_time);
+	printf("jump flooding:\t%.3lf s (%.2lfx)\n", flooding_time,
+		aabb_time / flooding_time);
+	printf("max error:\t%g (%g voxels)\n", max_error, max_error * grid_n);
+	printf("mean error:\t%g\n", sum_error / num_voxels);
+	printf("inexact voxels:\t%lld / %lld\n", num_wrong, num_voxels);
+	printf("max error below 0.2:\t%g over %lld voxels\n",
+		max_band_error, num_band);
+	printf("narrow band:\t%.3lf s, %.1lf MB instead of %.1lf MB, "
+		"max error %g\n", banded_time, banded.MemoryUsage() / 1e6,
+		flooded.MemoryUsage() / 1e6, max_banded_error);
+
+	return 0;
+}
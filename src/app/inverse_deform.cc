@@ -12,10 +12,15 @@ int MESH_RESOLUTION = 5000;
 // main function
 int main(int argc, char** argv) {	
 
+	DeformerOptions options;
+	argc = ParseDeformerOptions(argc, argv, &options);
 	if (argc < 5) {
 		printf("./inverse_deform source.obj reference.obj output.obj "
 			"[GRID_RESOLUTION=64] [MESH_RESOLUTION=5000] "
-			"[lambda=1] [symmetry=0]\n");
+			"[lambda=1] [symmetry=0]\n"
+			"[--num_threads=0] [--linear_solver=SPARSE_NORMAL_CHOLESKY] "
+			"[--preconditioner=JACOBI] [--max_num_iterations=100] "
+			"[--progress=1] [--analytic=1]\n");
 		return 0;
 	}
 
@@ -53,7 +58,7 @@ int main(int argc, char** argv) {
 	//src.ApplyTransform(ref);
 
 	printf("Reverse !\n");
-	Deformer deform(lambda);
+	Deformer deform(lambda, 0, options);
 	deform.ReverseDeform(ref, &src);
 
 	std::cout<<"Deformed"<<std::endl;
@@ -10,10 +10,15 @@ int MESH_RESOLUTION = 5000;
 
 // main function
 int main(int argc, char** argv) {	
+	DeformerOptions options;
+	argc = ParseDeformerOptions(argc, argv, &options);
 	if (argc < 5) {
 		printf("./rigid_deform source.obj reference.obj output.obj "
 			"[GRID_RESOLUTION=64] [MESH_RESOLUTION=5000] "
-			"[lambda=1] [symmetry=0]\n");
+			"[lambda=1] [symmetry=0]\n"
+			"[--num_threads=0] [--linear_solver=SPARSE_NORMAL_CHOLESKY] "
+			"[--preconditioner=JACOBI] [--max_num_iterations=100] "
+			"[--progress=1] [--analytic=1]\n");
 		return 0;
 	}
 
@@ -52,7 +57,7 @@ int main(int argc, char** argv) {
 	ref.ConstructDistanceField(grid);
 	
 	src.ApplyTransform(ref);
-	Deformer deformer(lambda);
+	Deformer deformer(lambda, 0, options);
 
 	deformer.Deform(grid, &src);
 
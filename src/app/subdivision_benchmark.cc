@@ -0,0 +1,124 @@
+#include <atomic>
+#include <chrono>
+#include <cstdlib>
+#include <iostream>
+#include <new>
+
+#include "mesh.h"
+#include "subdivision.h"
+
+// Heap usage of the whole process, tracked through operator new/delete.
+// Every allocation carries a small header with its size.
+static std::atomic<long long> g_heap_bytes(0);
+static std::atomic<long long> g_heap_peak(0);
+static std::atomic<long long> g_heap_allocations(0);
+
+static const size_t kHeader = 16;
+
+void* operator new(size_t size) {
+	char* p = (char*)malloc(size + kHeader);
+	if (!p)
+		throw std::bad_alloc();
+	*(size_t*)p = size;
+	long long bytes = g_heap_bytes += size;
+	g_heap_allocations += 1;
+	long long peak = g_heap_peak;
+	while (bytes > peak && !g_heap_peak.compare_exchange_weak(peak, bytes)) {
+	}
+	return p + kHeader;
+}
+
+void operator delete(void* ptr) noexcept {
+	if (!ptr)
+		return;
+	char* p = (char*)ptr - kHeader;
+	g_heap_bytes -= *(size_t*)p;
+	free(p);
+}
+
+void* operator new[](size_t size) {
+	return operator new(size);
+}
+
+void operator delete[](void* ptr) noexcept {
+	operator delete(ptr);
+}
+
+void operator delete(void* ptr, size_t) noexcept {
+	operator delete(ptr);
+}
+
+void operator delete[](void* ptr, size_t) noexcept {
+	operator delete(ptr);
+}
+
+struct Stage {
+	std::chrono::steady_clock::time_point start;
+	long long bytes;
+	long long allocations;
+};
+
+static Stage Begin() {
+	g_heap_peak = g_heap_bytes.load();
+	return {std::chrono::steady_clock::now(), g_heap_bytes.load(),
+		g_heap_allocations.load()};
+}
+
+static void End(const char* name, const Stage& stage, int num_vertices) {
+	double seconds = std::chrono::duration<double>(
+		std::chrono::steady_clock::now() - stage.start).count();
+	long long allocations = g_heap_allocations - stage.allocations;
+	printf("%-28s %8.3lf s %8.3lf us/vertex %10lld allocs %8.1lf allocs/vertex "
+		"%8.1lf peak B/vertex %8.1lf kept B/vertex\n",
+		name, seconds, seconds * 1e6 / num_vertices, allocations,
+		(double)allocations / num_vertices,
+		(double)(g_heap_peak - stage.bytes) / num_vertices,
+		(double)(g_heap_bytes - stage.bytes) / num_vertices);
+}
+
+// Time and heap usage of the LoadCadMesh preprocessing stages, per vertex
+// of the subdivided mesh.
+int main(int argc, char** argv) {
+	if (argc < 2) {
+		printf("./subdivision_benchmark cad.obj [SUBDIVIDE_LENGTH=2e-2] "
+			"[NEIGHBOR_LENGTH=1.5e-2] [GRAPH_LENGTH=1e-2] [NUM_THREADS=0]\n");
+		return 0;
+	}
+	double subdivide_length = 2e-2;
+	double neighbor_length = 1.5e-2;
+	double graph_length = 1e-2;
+	int num_threads = 0;
+	if (argc > 2)
+		sscanf(argv[2], "%lf", &subdivide_length);
+	if (argc > 3)
+		sscanf(argv[3], "%lf", &neighbor_length);
+	if (argc > 4)
+		sscanf(argv[4], "%lf", &graph_length);
+	if (argc > 5)
+		sscanf(argv[5], "%d", &num_threads);
+
+	Mesh cad;
+	cad.ReadOBJ(argv[1]);
+	cad.RemoveDegenerated();
+	cad.MergeDuplex();
+
+	Subdivision sub;
+	Stage stage = Begin();
+	sub.Subdivide(cad, subdivide_length, num_threads);
+	int num_vertices = sub.GetMesh().GetV().size();
+	End("Subdivide", stage, num_vertices);
+
+	stage = Begin();
+	sub.ComputeGeometryNeighbors(neighbor_length, num_threads);
+	End("ComputeGeometryNeighbors", stage, num_vertices);
+
+	stage = Begin();
+	sub.ComputeRepresentativeGraph(graph_length);
+	End("ComputeRepresentativeGraph", stage, num_vertices);
+
+	std::cout << "vertices: " << num_vertices
+		<< "\tneighbor pairs: " << sub.Neighbors().size()
+		<< "\tgraph vertices: " << sub.GraphV().size()
+		<< "\tgraph edges: " << sub.GraphE().size() << std::endl;
+	return 0;
+}
@@ -16,12 +16,14 @@ torch::Tensor CadEdgeLoss_forward(
 	torch::Tensor tensorV,
 	torch::Tensor tensorF,
 	torch::Tensor tensorE,
-	int param_id);
+	int param_id,
+	c10::optional<torch::Tensor> out = c10::nullopt);
 
 torch::Tensor CadEdgeLoss_backward(
 	torch::Tensor tensorV,
 	torch::Tensor tensorF,
 	torch::Tensor tensorE,
-	int param_id);
+	int param_id,
+	c10::optional<torch::Tensor> out = c10::nullopt);
 
 #endif
\ No newline at end of file
@@ -0,0 +1,33 @@
+#include "coverage_layer.h"
+
+#include "mesh_tensor.h"
+
+static void CheckFaces(const Mesh& mesh, const char* name) {
+	for (auto& f : mesh.GetF()) {
+		TORCH_CHECK(f.minCoeff() >= 0 && f.maxCoeff() < mesh.GetV().size(),
+			name, " refers to vertices outside its V");
+	}
+}
+
+torch::Tensor CoverageDeform(
+	torch::Tensor src_V,
+	torch::Tensor src_F,
+	torch::Tensor ref_V,
+	torch::Tensor ref_F,
+	double rigidity,
+	int num_threads)
+{
+	Mesh src, ref;
+	CopyTensorToMesh(src_V, src_F, &src, 1);
+	CopyTensorToMesh(ref_V, ref_F, &ref);
+	CheckFaces(src, "src_F");
+	CheckFaces(ref, "ref_F");
+	ref.ApplyTransform(src);
+
+	CoverageDeformer deformer(ref, rigidity, num_threads);
+	deformer.Deform(&src);
+
+	torch::Tensor V, F;
+	CopyMeshToTensor(src, &V, &F, 1);
+	return V;
+}
@@ -0,0 +1,20 @@
+#ifndef SHAPEDEFORM_INTERFACE_COVERAGE_LAYER_H_
+#define SHAPEDEFORM_INTERFACE_COVERAGE_LAYER_H_
+
+#include <torch/extension.h>
+
+#include <coverage.h>
+
+// The coverage_deform app on tensors: deforms the mesh (src_V, src_F) to
+// cover (ref_V, ref_F) and returns the new source vertices as a [N, 3]
+// tensor in the frame of src_V. Both meshes are normalized by the bounding
+// box of the source for the solve, as in the app.
+torch::Tensor CoverageDeform(
+	torch::Tensor src_V,
+	torch::Tensor src_F,
+	torch::Tensor ref_V,
+	torch::Tensor ref_F,
+	double rigidity = 1.0,
+	int num_threads = 0);
+
+#endif
@@ -1,23 +1,149 @@
 #include "deform_params.h"
 
+#include <mutex>
+#include <stdexcept>
+#include <string>
+#include <unordered_map>
 #include <vector>
 
+#include "grid_cache.h"
 #include "mesh_tensor.h"
 
-std::vector<DeformParams> g_params;
+struct ParamsEntry
+{
+	std::unique_ptr<DeformParams> params;
+	int references;
+};
+
+struct ParamsRegistry
+{
+	ParamsRegistry()
+	: next_id(0), released(0)
+	{}
+	std::mutex mutex;
+	std::unordered_map<int, ParamsEntry> entries;
+	int next_id;
+	long long released;
+};
+
+static ParamsRegistry g_params;
+
+static ParamsEntry& FindEntry(int param_id) {
+	auto it = g_params.entries.find(param_id);
+	if (it == g_params.entries.end())
+		throw std::out_of_range("invalid DeformParams id "
+			+ std::to_string(param_id));
+	return it->second;
+}
+
+long long DeformParams::MemoryUsage() const {
+	long long bytes = grid.MemoryUsage();
+	bytes += ref.GetV().size() * sizeof(Vector3);
+	bytes += ref.GetF().size() * sizeof(Eigen::Vector3i);
+	bytes += (ref.GetNF().size() + ref.GetNV().size())
+		* sizeof(Eigen::Vector3d);
+	bytes += edge_offset.size() * sizeof(edge_offset[0]);
+	bytes += edge_lambda.size() * sizeof(edge_lambda[0]);
+	bytes += (edge_vertex.size() + vertex_edge_offset.size()
+		+ vertex_edge.size()) * sizeof(int);
+	return bytes;
+}
+
 int CreateParams() {
-	g_params.push_back(DeformParams());
-	return (int)g_params.size() - 1;
+	std::lock_guard<std::mutex> lock(g_params.mutex);
+	int param_id = g_params.next_id++;
+	ParamsEntry& entry = g_params.entries[param_id];
+	entry.params.reset(new DeformParams());
+	entry.references = 1;
+	return param_id;
 }
+
 DeformParams& GetParams(int param_id) {
-	return g_params[param_id];
+	std::lock_guard<std::mutex> lock(g_params.mutex);
+	return *FindEntry(param_id).params;
+}
+
+void RetainParams(int param_id) {
+	std::lock_guard<std::mutex> lock(g_params.mutex);
+	FindEntry(param_id).references += 1;
+}
+
+void ReleaseParams(int param_id) {
+	std::unique_ptr<DeformParams> params;
+	{
+		std::lock_guard<std::mutex> lock(g_params.mutex);
+		ParamsEntry& entry = FindEntry(param_id);
+		if (--entry.references > 0)
+			return;
+		params = std::move(entry.params);
+		g_params.entries.erase(param_id);
+		g_params.released += 1;
+	}
+	// params (and its grid mapping) are freed here, outside the lock
+}
+
+long long ParamsMemoryUsage(int param_id) {
+	std::lock_guard<std::mutex> lock(g_params.mutex);
+	return FindEntry(param_id).params->MemoryUsage();
+}
+
+std::map<std::string, long long> ParamsStatistics() {
+	std::lock_guard<std::mutex> lock(g_params.mutex);
+	long long bytes = 0;
+	for (auto& entry : g_params.entries)
+		bytes += entry.second.params->MemoryUsage();
+	std::map<std::string, long long> stats;
+	stats["live"] = g_params.entries.size();
+	stats["created"] = g_params.next_id;
+	stats["released"] = g_params.released;
+	stats["bytes"] = bytes;
+	return stats;
+}
+
+DeformTemplate::DeformTemplate(int param_id)
+: param_id_(param_id)
+{}
+
+DeformTemplate::DeformTemplate(const DeformTemplate& other)
+: param_id_(other.param_id_)
+{
+	if (param_id_ >= 0)
+		RetainParams(param_id_);
+}
+
+DeformTemplate::~DeformTemplate() {
+	// the id may already have been dropped through ReleaseParams
+	try {
+		Release();
+	} catch (const std::out_of_range&) {
+	}
+}
+
+int DeformTemplate::Id() const {
+	if (param_id_ < 0)
+		throw std::out_of_range("DeformTemplate has been released");
+	return param_id_;
+}
+
+void DeformTemplate::Release() {
+	if (param_id_ < 0)
+		return;
+	ReleaseParams(param_id_);
+	param_id_ = -1;
+}
+
+long long DeformTemplate::MemoryUsage() const {
+	return ParamsMemoryUsage(Id());
 }
 
 int InitializeDeformTemplate(
 	torch::Tensor tensorV,
 	torch::Tensor tensorF,
 	int symmetry,
-	int grid_resolution) {
+	int grid_resolution,
+	const char* grid_cache,
+	double narrow_band,
+	int distance_method) {
 
 	int param_id = CreateParams();
 	auto& params = GetParams(param_id);
@@ -28,13 +154,50 @@ int InitializeDeformTemplate(
 	if (symmetry)
 		params.ref.ReflectionSymmetrize();
 
-	params.grid = UniformGrid(grid_resolution);
-
 	CopyTensorToMesh(tensorV, tensorF, &params.ref, 1);
-	params.ref.ConstructDistanceField(params.grid);
+
+	// an explicit grid file wins over the content-addressed cache
+	std::string cache_path = grid_cache ? grid_cache : "";
+	bool content_addressed = false;
+	if (cache_path.empty()) {
+		cache_path = GridCachePath(tensorV, tensorF, symmetry,
+			grid_resolution, narrow_band, distance_method);
+		content_addressed = !cache_path.empty();
+	}
+
+	if (!cache_path.empty()) {
+		UniformGrid cached;
+		FT scale;
+		Vector3 trans;
+		if (cached.Load(cache_path.c_str(), &scale, &trans)
+			&& cached.Dimension() == grid_resolution
+			&& cached.IsSparse() == (narrow_band > 0)
+			&& (narrow_band <= 0 || cached.Band() == FT(narrow_band))) {
+			params.grid = cached;
+			params.scale = scale;
+			params.trans = trans;
+			if (content_addressed)
+				RecordGridCacheAccess(cache_path, true);
+			return param_id;
+		}
+		if (content_addressed)
+			RecordGridCacheAccess(cache_path, false);
+	}
+
+	if (narrow_band > 0)
+		params.grid = UniformGrid(grid_resolution, narrow_band);
+	else
+		params.grid = UniformGrid(grid_resolution);
+	params.ref.ConstructDistanceField(params.grid, distance_method);
 
 	params.scale = params.ref.GetScale();
 	params.trans = params.ref.GetTranslation();
 
+	if (!cache_path.empty()) {
+		params.grid.Save(cache_path.c_str(), params.scale, params.trans);
+		if (content_addressed)
+			EvictGridCache();
+	}
+
 	return param_id;
 }
\ No newline at end of file
@@ -1,6 +1,9 @@
 #ifndef SHAPEDEFORM_INTERFACE_DEFORM_PARAMS_H_
 #define SHAPEDEFORM_INTERFACE_DEFORM_PARAMS_H_
 
+#include <map>
+#include <string>
+
 #include <mesh.h>
 #include <torch/extension.h>
 
@@ -22,15 +25,69 @@ struct DeformParams
 	std::vector<Eigen::Vector3d> edge_offset;
 	std::vector<double> edge_lambda;
 #endif
+
+	// (v0, v1) of every edge term in loss order, and the CSR index of the
+	// terms incident to each vertex: vertex v owns the entries
+	// vertex_edge[vertex_edge_offset[v] .. vertex_edge_offset[v + 1]),
+	// each stored as 2 * edge + (v is the edge's second vertex).
+	std::vector<int> edge_vertex;
+	std::vector<int> vertex_edge_offset;
+	std::vector<int> vertex_edge;
+
+	// Bytes held by the template mesh, the grid and the edge buffers.
+	long long MemoryUsage() const;
 };
 
+// Registry of DeformParams by id. CreateParams returns an id holding one
+// reference; the params are freed once ReleaseParams has dropped the last
+// one. GetParams throws std::out_of_range (IndexError in Python) for ids
+// that were never created or are already freed, and the reference it
+// returns stays valid until then.
 int CreateParams();
 DeformParams& GetParams(int param_id);
+void RetainParams(int param_id);
+void ReleaseParams(int param_id);
+long long ParamsMemoryUsage(int param_id);
+
+// live, created and released counts, and bytes held by the live params.
+std::map<std::string, long long> ParamsStatistics();
+
+// Owns one reference to a registered DeformParams, dropped on Release or
+// destruction. Exposed to Python as pyDeform.DeformTemplate, a context
+// manager that converts to its id wherever a param_id is expected.
+class DeformTemplate
+{
+public:
+	explicit DeformTemplate(int param_id);
+	DeformTemplate(const DeformTemplate& other);
+	DeformTemplate& operator=(const DeformTemplate& other) = delete;
+	~DeformTemplate();
+
+	// Throws std::out_of_range once released.
+	int Id() const;
+	bool Released() const { return param_id_ < 0; }
+	void Release();
+	long long MemoryUsage() const;
+
+private:
+	int param_id_;
+};
 
+// If grid_cache names a valid grid file of the requested resolution, the
+// distance field is memory-mapped from it; otherwise it is constructed and
+// written there for the next call on the same target. Without grid_cache
+// the content-addressed cache set by SetGridCache is used, if any.
+// A positive narrow_band stores only the voxels within that distance of
+// the surface (in normalized units); lookups further away read as far.
+// distance_method selects how the field is built (Mesh::DistanceMethod):
+// 0 queries every voxel with igl, 1 uses multithreaded jump flooding.
 int InitializeDeformTemplate(
 	torch::Tensor tensorV,
 	torch::Tensor tensorF,
 	int symmetry,
-	int grid_resolution);
+	int grid_resolution,
+	const char* grid_cache = "",
+	double narrow_band = 0,
+	int distance_method = 0);
 
 #endif
\ No newline at end of file
@@ -0,0 +1,23 @@
+#include "deformer_layer.h"
+
+#include "deform_params.h"
+#include "mesh_tensor.h"
+
+torch::Tensor CeresDeform(
+	torch::Tensor tensorV,
+	torch::Tensor tensorF,
+	int param_id,
+	double rigidity,
+	const DeformerOptions& options)
+{
+	Mesh mesh;
+	CopyTensorToMesh(tensorV, tensorF, &mesh);
+	const UniformGrid& grid = GetParams(param_id).grid;
+
+	Deformer deformer(rigidity, 0, options);
+	deformer.Deform(grid, &mesh);
+
+	torch::Tensor V, F;
+	CopyMeshToTensor(mesh, &V, &F);
+	return V;
+}
@@ -0,0 +1,19 @@
+#ifndef SHAPEDEFORM_INTERFACE_DEFORMER_LAYER_H_
+#define SHAPEDEFORM_INTERFACE_DEFORMER_LAYER_H_
+
+#include <torch/extension.h>
+
+#include <deformer.h>
+
+// Fits the mesh (V, F), normalized by the template (see
+// NormalizeByTemplate), to the template's distance field with the ceres
+// Deformer as the rigid_deform app does, and returns the deformed vertices
+// as a new [N, 3] tensor. Raises ValueError for unknown solver names.
+torch::Tensor CeresDeform(
+	torch::Tensor tensorV,
+	torch::Tensor tensorF,
+	int param_id,
+	double rigidity = 1.0,
+	const DeformerOptions& options = DeformerOptions());
+
+#endif
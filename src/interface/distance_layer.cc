@@ -1,28 +1,30 @@
 #include "distance_layer.h"
 
 #include <ATen/ATen.h>
+#include <ATen/Parallel.h>
 #include <ceres/jet.h>
 #include <torch/extension.h>
 
+#include "tensor_util.h"
+
 
 torch::Tensor DistanceFieldLoss_forward(
-	torch::Tensor tensorV, int param_id) {
+	torch::Tensor tensorV, int param_id,
+	c10::optional<torch::Tensor> out) {
 
 	auto& params = GetParams(param_id);
 #ifndef USE_DOUBLE
 	typedef float T;
-	auto float_options = torch::TensorOptions().dtype(torch::kFloat32);
 #else
 	typedef double T;
-	auto float_options = torch::TensorOptions().dtype(torch::kFloat64);
 #endif
 
+	auto dataV = TensorData<T>(tensorV, "V", 3);
 	int v_size = tensorV.size(0);
-	auto dataV = static_cast<const T*>(tensorV.storage().data());
 
-	torch::Tensor loss = torch::full({v_size}, /*value=*/0, float_options);
+	torch::Tensor loss = OutputTensor<T>(out, {v_size}, "out");
 
-	auto dataL = static_cast<T*>(loss.storage().data());
+	auto dataL = loss.data_ptr<T>();
 
 	for (int i = 0; i < v_size; ++i) {
 #ifndef USE_DOUBLE
@@ -37,24 +39,23 @@ torch::Tensor DistanceFieldLoss_forward(
 }
 
 torch::Tensor DistanceFieldLoss_backward(
-	torch::Tensor tensorV, int param_id) {
+	torch::Tensor tensorV, int param_id,
+	c10::optional<torch::Tensor> out) {
 
 	auto& params = GetParams(param_id);
-	int v_size = tensorV.size(0);
 #ifndef USE_DOUBLE
 	typedef float T;
 	typedef Eigen::Vector3f V3;
-	auto float_options = torch::TensorOptions().dtype(torch::kFloat32);
 #else
 	typedef double T;
 	typedef Eigen::Vector3d V3;
-	auto float_options = torch::TensorOptions().dtype(torch::kFloat64);
 #endif
-	const T* dataV = static_cast<const T*>(tensorV.storage().data());
+	const T* dataV = TensorData<T>(tensorV, "V", 3);
+	int v_size = tensorV.size(0);
 
-	torch::Tensor loss = torch::full({v_size, 3}, /*value=*/0, float_options);
+	torch::Tensor loss = OutputTensor<T>(out, {v_size, 3}, "out");
 
-	T* dataL = static_cast<T*>(loss.storage().data());
+	T* dataL = loss.data_ptr<T>();
 	for (int i = 0; i < v_size; ++i) {
 		const T* v = dataV + i * 3;
 		T* l = dataL + i * 3;
@@ -78,4 +79,80 @@ torch::Tensor DistanceFieldLoss_backward(
 	}
 
 	return loss;
-}
\ No newline at end of file
+}
+
+std::vector<torch::Tensor> DistanceFieldLoss_forward_backward(
+	torch::Tensor tensorV, int param_id,
+	c10::optional<torch::Tensor> loss_out,
+	c10::optional<torch::Tensor> gradient_out) {
+
+	auto& params = GetParams(param_id);
+#ifndef USE_DOUBLE
+	typedef float T;
+#else
+	typedef double T;
+#endif
+	const T* dataV = TensorData<T>(tensorV, "V");
+	TORCH_CHECK(tensorV.dim() >= 1 && tensorV.size(-1) == 3,
+		"V must have shape [..., 3], got ", tensorV.sizes());
+
+	// all leading dimensions are treated as a flat batch of vertices
+	auto loss_sizes = tensorV.sizes().vec();
+	loss_sizes.pop_back();
+	int64_t v_size = tensorV.numel() / 3;
+
+	torch::Tensor loss = OutputTensor<T>(loss_out, loss_sizes, "loss_out");
+	torch::Tensor gradient = OutputTensor<T>(gradient_out, tensorV.sizes(),
+		"gradient_out");
+
+	T* dataL = loss.data_ptr<T>();
+	T* dataG = gradient.data_ptr<T>();
+
+	const UniformGrid& grid = params.grid;
+	at::parallel_for(0, v_size, 2048, [&](int64_t begin, int64_t end) {
+		for (int64_t i = begin; i < end; ++i) {
+			T* g = dataG + i * 3;
+			T d = grid.DistanceWithGradient(dataV + i * 3, g);
+			dataL[i] = d * d;
+			g[0] *= d;
+			g[1] *= d;
+			g[2] *= d;
+		}
+	});
+
+	return {loss, gradient};
+}
+
+// Largest narrow-band grid DistanceFieldGrid expands: 128^3 floats are 8 MB,
+// while 256^3 would cost again the 64 MB the band saves, on every device.
+static const int kMaxSparseGridExport = 128;
+
+torch::Tensor DistanceFieldGrid(int param_id) {
+	auto& params = GetParams(param_id);
+#ifndef USE_DOUBLE
+	typedef float T;
+#else
+	typedef double T;
+#endif
+	const UniformGrid& grid = params.grid;
+	int n = grid.Dimension();
+	TORCH_CHECK(!grid.IsSparse() || n <= kMaxSparseGridExport,
+		"DistanceFieldGrid would expand the narrow-band grid to a dense ", n,
+		"^3 tensor; use the pyDeform losses (--backend cpp) or at most a ",
+		kMaxSparseGridExport, "^3 grid");
+	torch::Tensor voxels = torch::empty({n, n, n},
+		torch::TensorOptions().dtype(c10::CppTypeToScalarType<T>::value));
+	T* data = voxels.data_ptr<T>();
+
+	at::parallel_for(0, n, 1, [&](int64_t begin, int64_t end) {
+		for (int64_t i = begin; i < end; ++i) {
+			T* slice = data + i * n * n;
+			for (int j = 0; j < n; ++j) {
+				for (int k = 0; k < n; ++k)
+					slice[j * n + k] = grid.GetDistance(i, j, k);
+			}
+		}
+	});
+
+	return voxels;
+}
@@ -5,12 +5,30 @@
 #include "mesh_tensor.h"
 #include "normalize.h"
 
+// The losses accept any contiguous CPU tensor of the configured float type
+// without copying it, and write into out when given instead of allocating.
 torch::Tensor DistanceFieldLoss_forward(
 	torch::Tensor tensorV,
-	int param_id);
+	int param_id,
+	c10::optional<torch::Tensor> out = c10::nullopt);
 
 torch::Tensor DistanceFieldLoss_backward(
 	torch::Tensor tensorV,
-	int param_id);
+	int param_id,
+	c10::optional<torch::Tensor> out = c10::nullopt);
+
+// Fused forward and backward over a [N, 3] or [B, N, 3] tensor.
+// Returns {loss, gradient} with the same values as the separate calls.
+std::vector<torch::Tensor> DistanceFieldLoss_forward_backward(
+	torch::Tensor tensorV,
+	int param_id,
+	c10::optional<torch::Tensor> loss_out = c10::nullopt,
+	c10::optional<torch::Tensor> gradient_out = c10::nullopt);
+
+// Copy of the distance field as a dense [n, n, n] tensor indexed (z, y, x),
+// for losses evaluated outside pyDeform. Voxels a narrow-band grid does not
+// store read as UniformGrid::kFarDistance; narrow-band grids above 128^3 are
+// refused, since the copy would take the dense memory the band avoids.
+torch::Tensor DistanceFieldGrid(int param_id);
 
 #endif
\ No newline at end of file
@@ -0,0 +1,168 @@
+#include "edge_layer.h"
+
+#include <algorithm>
+
+#include <ATen/ATen.h>
+#include <ATen/Parallel.h>
+#include <torch/extension.h>
+
+#include "tensor_util.h"
+
+void StoreEdgeIndex(
+	const std::vector<int>& edge_vertex,
+	int v_size,
+	DeformParams* params) {
+	int e_size = edge_vertex.size() / 2;
+	params->edge_vertex = edge_vertex;
+
+	// counting sort of the edge ends by vertex, keeping edge order
+	params->vertex_edge_offset.assign(v_size + 1, 0);
+	for (int i = 0; i < e_size * 2; ++i)
+		params->vertex_edge_offset[edge_vertex[i] + 1] += 1;
+	for (int i = 0; i < v_size; ++i)
+		params->vertex_edge_offset[i + 1] += params->vertex_edge_offset[i];
+
+	std::vector<int> top(params->vertex_edge_offset.begin(),
+		params->vertex_edge_offset.end() - 1);
+	params->vertex_edge.resize(e_size * 2);
+	for (int i = 0; i < e_size * 2; ++i)
+		params->vertex_edge[top[edge_vertex[i]]++] = i;
+}
+
+void CheckStoredEdges(
+	const DeformParams& params,
+	const torch::Tensor& tensorE,
+	const torch::Tensor& tensorF) {
+	int e_size = tensorE.defined() ? tensorE.size(0) : 0;
+	int f_size = tensorF.defined() ? tensorF.size(0) : 0;
+	int stored_size = params.edge_vertex.size() / 2;
+	TORCH_CHECK(e_size + f_size * 3 == stored_size, "got ", e_size,
+		" edges and ", f_size, " faces but ", stored_size,
+		" edge terms were stored for this param_id");
+	const int* stored = params.edge_vertex.data();
+	bool same = true;
+	if (e_size > 0) {
+		auto dataE = TensorData<int>(tensorE, "E", 2);
+		same = std::equal(dataE, dataE + e_size * 2, stored);
+		stored += e_size * 2;
+	}
+	if (same && f_size > 0) {
+		auto dataF = TensorData<int>(tensorF, "F", 3);
+		for (int i = 0; i < f_size * 3 && same; ++i) {
+			int face = i / 3;
+			same = stored[i * 2] == dataF[i]
+				&& stored[i * 2 + 1] == dataF[face * 3 + (i + 1) % 3];
+		}
+	}
+	TORCH_CHECK(same, "the edges passed differ from the ones stored for "
+		"this param_id");
+}
+
+torch::Tensor EdgeLoss_forward(
+	torch::Tensor tensorV,
+	const DeformParams& params,
+	bool weighted,
+	c10::optional<torch::Tensor> out) {
+#ifndef USE_DOUBLE
+	typedef float T;
+#else
+	typedef double T;
+#endif
+	int e_size = params.edge_vertex.size() / 2;
+	const T* dataV = TensorData<T>(tensorV, "V", 3);
+	auto dataE = params.edge_vertex.data();
+
+	torch::Tensor loss = OutputTensor<T>(out, {e_size, 3}, "out");
+	auto dataL = loss.data_ptr<T>();
+
+	at::parallel_for(0, e_size, 2048, [&](int64_t begin, int64_t end) {
+		for (int64_t i = begin; i < end; ++i) {
+			const T* v0_data = dataV + dataE[i * 2] * 3;
+			const T* v1_data = dataV + dataE[i * 2 + 1] * 3;
+			T lambda = weighted ? params.edge_lambda[i] : (T)1;
+			T* l = dataL + i * 3;
+			for (int k = 0; k < 3; ++k) {
+				l[k] = (v1_data[k] - v0_data[k] - params.edge_offset[i][k])
+					* lambda;
+				l[k] *= l[k];
+			}
+		}
+	});
+
+	return loss;
+}
+
+torch::Tensor EdgeLoss_backward(
+	torch::Tensor tensorV,
+	const DeformParams& params,
+	bool weighted,
+	c10::optional<torch::Tensor> out) {
+#ifndef USE_DOUBLE
+	typedef float T;
+#else
+	typedef double T;
+#endif
+	const T* dataV = TensorData<T>(tensorV, "V", 3);
+	int v_size = tensorV.size(0);
+	TORCH_CHECK(v_size + 1 == (int)params.vertex_edge_offset.size(),
+		"V has ", v_size, " vertices but the stored edges index ",
+		(int)params.vertex_edge_offset.size() - 1);
+	auto dataE = params.edge_vertex.data();
+
+	torch::Tensor loss = OutputTensor<T>(out, {v_size, 3}, "out");
+	auto dataL = loss.data_ptr<T>();
+
+	at::parallel_for(0, v_size, 1024, [&](int64_t begin, int64_t end) {
+		for (int64_t v = begin; v < end; ++v) {
+			T l[3] = {0, 0, 0};
+			for (int j = params.vertex_edge_offset[v];
+				j < params.vertex_edge_offset[v + 1]; ++j) {
+				int i = params.vertex_edge[j] / 2;
+				T sign = (params.vertex_edge[j] % 2) ? (T)1 : (T)-1;
+				const T* v0_data = dataV + dataE[i * 2] * 3;
+				const T* v1_data = dataV + dataE[i * 2 + 1] * 3;
+				T lambda = weighted ? params.edge_lambda[i] : (T)1;
+				lambda *= lambda;
+				for (int k = 0; k < 3; ++k) {
+					l[k] += sign * (v1_data[k] - v0_data[k]
+						- params.edge_offset[i][k]) * lambda;
+				}
+			}
+			for (int k = 0; k < 3; ++k)
+				dataL[v * 3 + k] = l[k];
+		}
+	});
+
+	return loss;
+}
+
+std::vector<torch::Tensor> EdgeTerms(int param_id) {
+	auto& params = GetParams(param_id);
+#ifndef USE_DOUBLE
+	typedef float T;
+#else
+	typedef double T;
+#endif
+	int e_size = params.edge_vertex.size() / 2;
+	auto options = torch::TensorOptions().dtype(
+		c10::CppTypeToScalarType<T>::value);
+
+	torch::Tensor edge_vertex = torch::empty({e_size, 2},
+		torch::TensorOptions().dtype(torch::kInt32));
+	std::copy(params.edge_vertex.begin(), params.edge_vertex.end(),
+		edge_vertex.data_ptr<int>());
+
+	torch::Tensor edge_offset = torch::empty({e_size, 3}, options);
+	T* offset = edge_offset.data_ptr<T>();
+	for (int i = 0; i < e_size; ++i) {
+		for (int k = 0; k < 3; ++k)
+			offset[i * 3 + k] = params.edge_offset[i][k];
+	}
+
+	int lambda_size = params.edge_lambda.size();
+	torch::Tensor edge_lambda = torch::empty({lambda_size}, options);
+	std::copy(params.edge_lambda.begin(), params.edge_lambda.end(),
+		edge_lambda.data_ptr<T>());
+
+	return {edge_vertex, edge_offset, edge_lambda};
+}
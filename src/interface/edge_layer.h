@@ -0,0 +1,47 @@
+#ifndef SHAPEDEFORM_INTERFACE_EDGE_LAYER_H_
+#define SHAPEDEFORM_INTERFACE_EDGE_LAYER_H_
+
+#include <vector>
+
+#include "deform_params.h"
+
+// Records the edge terms (flattened (v0, v1) pairs in loss order) and
+// builds the vertex to incident edge index used by EdgeLoss_backward.
+void StoreEdgeIndex(
+	const std::vector<int>& edge_vertex,
+	int v_size,
+	DeformParams* params);
+
+// Checks that the edges of tensorE followed by the face edges of tensorF
+// (either may be undefined) are exactly the stored edge terms, so that a
+// loss is never evaluated on other edges than the ones its offsets and
+// index were built for.
+void CheckStoredEdges(
+	const DeformParams& params,
+	const torch::Tensor& tensorE,
+	const torch::Tensor& tensorF);
+
+// Squared residuals (v1 - v0 - edge_offset) * edge_lambda, one row per
+// edge term; edge_lambda is only applied if weighted. Both kernels write
+// into out when given (see OutputTensor).
+torch::Tensor EdgeLoss_forward(
+	torch::Tensor tensorV,
+	const DeformParams& params,
+	bool weighted,
+	c10::optional<torch::Tensor> out);
+
+// Gradient of EdgeLoss_forward (up to the factor 2 the layers drop),
+// gathered per vertex from its incident edges. Runs in parallel over
+// vertices and sums every vertex in a fixed order, so it is deterministic.
+torch::Tensor EdgeLoss_backward(
+	torch::Tensor tensorV,
+	const DeformParams& params,
+	bool weighted,
+	c10::optional<torch::Tensor> out);
+
+// The stored edge terms as tensors: {edge_vertex [E, 2] int32,
+// edge_offset [E, 3], edge_lambda [E]}. edge_lambda is empty unless the
+// terms were stored with weights (StoreCadInformation).
+std::vector<torch::Tensor> EdgeTerms(int param_id);
+
+#endif
@@ -14,11 +14,13 @@ void StoreGraphInformation(
 torch::Tensor GraphEdgeLoss_forward(
 	torch::Tensor tensorV,
 	torch::Tensor tensorE,
-	int param_id);
+	int param_id,
+	c10::optional<torch::Tensor> out = c10::nullopt);
 
 torch::Tensor GraphEdgeLoss_backward(
 	torch::Tensor tensorV,
 	torch::Tensor tensorE,
-	int param_id);
+	int param_id,
+	c10::optional<torch::Tensor> out = c10::nullopt);
 
 #endif
\ No newline at end of file
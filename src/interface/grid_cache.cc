@@ -0,0 +1,163 @@
+#include "grid_cache.h"
+
+#include <dirent.h>
+#include <sys/stat.h>
+#include <sys/time.h>
+#include <unistd.h>
+
+#include <algorithm>
+#include <mutex>
+#include <vector>
+
+struct GridCacheState {
+	GridCacheState()
+	: max_bytes(0), hits(0), misses(0), evictions(0)
+	{}
+	std::string directory;
+	long long max_bytes;
+	long long hits;
+	long long misses;
+	long long evictions;
+	std::mutex mutex;
+};
+
+static GridCacheState g_grid_cache;
+
+// bump when the grid construction or the file layout changes
+static const int kGridCacheVersion = 2;
+
+struct GridCacheEntry {
+	std::string path;
+	long long bytes;
+	time_t last_access;
+};
+
+static void ListGridCache(const std::string& directory,
+	std::vector<GridCacheEntry>* entries) {
+	DIR* dir = opendir(directory.c_str());
+	if (!dir)
+		return;
+	while (auto ent = readdir(dir)) {
+		std::string name = ent->d_name;
+		if (name.size() < 5 || name.compare(name.size() - 5, 5, ".grid") != 0)
+			continue;
+		GridCacheEntry entry;
+		entry.path = directory + "/" + name;
+		struct stat st;
+		if (stat(entry.path.c_str(), &st) != 0)
+			continue;
+		entry.bytes = st.st_size;
+		entry.last_access = st.st_mtime;
+		entries->push_back(entry);
+	}
+	closedir(dir);
+}
+
+unsigned long long HashBytes(const void* data, size_t bytes,
+	unsigned long long h) {
+	// FNV-1a
+	auto p = static_cast<const unsigned char*>(data);
+	for (size_t i = 0; i < bytes; ++i) {
+		h ^= p[i];
+		h *= 1099511628211ULL;
+	}
+	return h;
+}
+
+void SetGridCache(const char* directory, long long max_bytes) {
+	std::lock_guard<std::mutex> lock(g_grid_cache.mutex);
+	g_grid_cache.directory = directory ? directory : "";
+	g_grid_cache.max_bytes = max_bytes;
+	if (!g_grid_cache.directory.empty())
+		mkdir(g_grid_cache.directory.c_str(), 0755);
+}
+
+std::string GridCachePath(
+	const torch::Tensor& tensorV,
+	const torch::Tensor& tensorF,
+	int symmetry,
+	int grid_resolution,
+	double narrow_band,
+	int distance_method) {
+	std::string directory;
+	{
+		std::lock_guard<std::mutex> lock(g_grid_cache.mutex);
+		directory = g_grid_cache.directory;
+	}
+	if (directory.empty())
+		return "";
+
+	auto V = tensorV.contiguous();
+	auto F = tensorF.contiguous();
+	unsigned long long h = HashBytes(V.data_ptr(),
+		V.numel() * V.element_size());
+	h = HashBytes(F.data_ptr(), F.numel() * F.element_size(), h);
+	int key[4] = {symmetry, grid_resolution, distance_method,
+		kGridCacheVersion};
+	h = HashBytes(key, sizeof(key), h);
+	h = HashBytes(&narrow_band, sizeof(narrow_band), h);
+
+	char name[64];
+	snprintf(name, sizeof(name), "/%016llx-%d.grid", h, grid_resolution);
+	return directory + name;
+}
+
+void RecordGridCacheAccess(const std::string& path, bool hit) {
+	std::lock_guard<std::mutex> lock(g_grid_cache.mutex);
+	if (hit) {
+		g_grid_cache.hits += 1;
+		// the modification time doubles as the LRU timestamp
+		utimes(path.c_str(), 0);
+	} else {
+		g_grid_cache.misses += 1;
+	}
+}
+
+void EvictGridCache() {
+	std::lock_guard<std::mutex> lock(g_grid_cache.mutex);
+	if (g_grid_cache.directory.empty() || g_grid_cache.max_bytes <= 0)
+		return;
+
+	std::vector<GridCacheEntry> entries;
+	ListGridCache(g_grid_cache.directory, &entries);
+	long long total = 0;
+	for (auto& e : entries)
+		total += e.bytes;
+	if (total <= g_grid_cache.max_bytes)
+		return;
+
+	std::sort(entries.begin(), entries.end(),
+		[](const GridCacheEntry& a, const GridCacheEntry& b) {
+			if (a.last_access != b.last_access)
+				return a.last_access < b.last_access;
+			return a.path < b.path;
+		});
+	// mapped grids stay valid after unlink, so no entry is pinned
+	for (auto& e : entries) {
+		if (total <= g_grid_cache.max_bytes)
+			break;
+		if (unlink(e.path.c_str()) == 0) {
+			total -= e.bytes;
+			g_grid_cache.evictions += 1;
+		}
+	}
+}
+
+std::map<std::string, long long> GridCacheStatistics() {
+	std::lock_guard<std::mutex> lock(g_grid_cache.mutex);
+	std::vector<GridCacheEntry> entries;
+	if (!g_grid_cache.directory.empty())
+		ListGridCache(g_grid_cache.directory, &entries);
+	long long total = 0;
+	for (auto& e : entries)
+		total += e.bytes;
+
+	std::map<std::string, long long> stats;
+	stats["hits"] = g_grid_cache.hits;
+	stats["misses"] = g_grid_cache.misses;
+	stats["evictions"] = g_grid_cache.evictions;
+	stats["entries"] = entries.size();
+	stats["bytes"] = total;
+	stats["max_bytes"] = g_grid_cache.max_bytes;
+	return stats;
+}
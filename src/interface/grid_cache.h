@@ -0,0 +1,36 @@
+#ifndef SHAPEDEFORM_INTERFACE_GRID_CACHE_H_
+#define SHAPEDEFORM_INTERFACE_GRID_CACHE_H_
+
+#include <map>
+#include <string>
+
+#include <torch/extension.h>
+
+// Persistent cache of target distance fields. Files are named by a hash of
+// the target and every grid construction argument, and evicted least
+// recently used first once the directory grows beyond max_bytes (no limit
+// if max_bytes <= 0).
+void SetGridCache(const char* directory, long long max_bytes = 0);
+
+// Empty if no cache directory is set.
+std::string GridCachePath(
+	const torch::Tensor& tensorV,
+	const torch::Tensor& tensorF,
+	int symmetry,
+	int grid_resolution,
+	double narrow_band = 0,
+	int distance_method = 0);
+
+void RecordGridCacheAccess(const std::string& path, bool hit);
+
+// Drops the least recently used files until the cache fits its budget.
+void EvictGridCache();
+
+// hits, misses, evictions, entries and bytes of the current cache.
+std::map<std::string, long long> GridCacheStatistics();
+
+// 64-bit FNV-1a of the bytes, continuing from h; used for cache keys.
+unsigned long long HashBytes(const void* data, size_t bytes,
+	unsigned long long h = 14695981039346656037ULL);
+
+#endif
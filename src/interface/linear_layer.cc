@@ -1,80 +1,133 @@
 #include "linear_layer.h"
 
-#include <linear.h>
-
-void SolveLinear(
-	torch::Tensor tensorV,
-	torch::Tensor tensorF,
-	torch::Tensor tensorE,
-	torch::Tensor tensorRef,
-	torch::Tensor tensorGraphV,
-	double rigidity,
-	int with_rot) {
-
-	std::vector<Vector3> V;
-	std::vector<Eigen::Vector3i> F;
-	std::vector<std::pair<int, int> > E;
-
-	std::vector<int> references;
-	std::vector<Vector3> graphV;
+#include "tensor_util.h"
 
 #ifndef USE_DOUBLE
-	typedef float T;
+typedef float TensorFT;
 #else
-	typedef double T;
+typedef double TensorFT;
 #endif
-	int v_size = tensorV.size(0);
-	auto dataV = static_cast<T*>(tensorV.storage().data());
-	V.resize(v_size);
-	for (int i = 0; i < v_size; ++i) {
+
+static std::vector<Vector3> TensorToPoints(const torch::Tensor& tensor,
+	const char* name) {
+	int size = tensor.size(0);
+	auto data = TensorData<TensorFT>(tensor, name, 3);
+	std::vector<Vector3> points(size);
+	for (int i = 0; i < size; ++i) {
 		for (int j = 0; j < 3; ++j) {
-			V[i][j] = dataV[i * 3 + j];
+			points[i][j] = data[i * 3 + j];
 		}
 	}
+	return points;
+}
 
+static std::vector<Eigen::Vector3i> TensorToFaces(const torch::Tensor& tensorF) {
 	int f_size = tensorF.size(0);
-	auto dataF = static_cast<int*>(tensorF.storage().data());
-	F.resize(f_size);
+	auto dataF = TensorData<int>(tensorF, "F", 3);
+	std::vector<Eigen::Vector3i> F(f_size);
 	for (int i = 0; i < f_size; ++i) {
 		for (int j = 0; j < 3; ++j) {
 			F[i][j] = dataF[i * 3 + j];
 		}
 	}
+	return F;
+}
 
+static std::vector<std::pair<int, int> > TensorToEdges(
+	const torch::Tensor& tensorE) {
 	int e_size = tensorE.size(0);
-	auto dataE = static_cast<int*>(tensorE.storage().data());
-	E.resize(e_size);
+	auto dataE = TensorData<int>(tensorE, "E", 2);
+	std::vector<std::pair<int, int> > E(e_size);
 	for (int i = 0; i < e_size; ++i) {
 		E[i].first = dataE[i * 2];
 		E[i].second = dataE[i * 2 + 1];
 	}
+	return E;
+}
 
+static std::vector<int> TensorToReferences(const torch::Tensor& tensorRef) {
 	int r_size = tensorRef.size(0);
-	auto dataRef = static_cast<int*>(tensorRef.storage().data());
-	references.resize(r_size);
-	for (int i = 0; i < r_size; ++i) {
-		references[i] = dataRef[i];
-	}
+	auto dataRef = TensorData<int>(tensorRef, "Ref");
+	return std::vector<int>(dataRef, dataRef + r_size);
+}
 
-	int graphV_size = tensorGraphV.size(0);
-	auto dataGraphV = static_cast<T*>(tensorGraphV.storage().data());
-	graphV.resize(graphV_size);
-	for (int i = 0; i < graphV_size; ++i) {
-		for (int j = 0; j < 3; ++j) {
-			graphV[i][j] = dataGraphV[i * 3 + j];
-		}
-	}
+void SolveLinear(
+	torch::Tensor tensorV,
+	torch::Tensor tensorF,
+	torch::Tensor tensorE,
+	torch::Tensor tensorRef,
+	torch::Tensor tensorGraphV,
+	double rigidity,
+	int with_rot,
+	int iterations,
+	int num_threads) {
+
+	std::vector<Vector3> V = TensorToPoints(tensorV, "V");
+	std::vector<Eigen::Vector3i> F = TensorToFaces(tensorF);
+	std::vector<std::pair<int, int> > E = TensorToEdges(tensorE);
+	std::vector<int> references = TensorToReferences(tensorRef);
+	std::vector<Vector3> graphV = TensorToPoints(tensorGraphV, "GraphV");
 
 	if (!with_rot)
 		LinearEstimation(V, F, E.begin(), E.end(),
 			references, graphV, rigidity);
 	else
 		LinearEstimationWithRot((double*)V.data(), (int*)F.data(),
-			(double*)graphV.data(), V.size(), F.size(), rigidity);
-	for (int i = 0; i < v_size; ++i) {
+			(double*)graphV.data(), V.size(), F.size(), rigidity,
+			iterations, num_threads);
+
+	auto dataV = tensorV.data_ptr<TensorFT>();
+	for (int i = 0; i < V.size(); ++i) {
 		for (int j = 0; j < 3; ++j) {
 			dataV[i * 3 + j] = V[i][j];
 		}
 	}
 }
 
+LinearSolver* CreateLinearSolver(
+	torch::Tensor tensorV,
+	torch::Tensor tensorF,
+	torch::Tensor tensorE,
+	torch::Tensor tensorRef,
+	double rigidity,
+	int with_rot) {
+	std::vector<Vector3> V = TensorToPoints(tensorV, "V");
+	std::vector<Eigen::Vector3i> F = TensorToFaces(tensorF);
+	std::vector<std::pair<int, int> > E;
+	std::vector<int> references;
+	if (!with_rot) {
+		E = TensorToEdges(tensorE);
+		references = TensorToReferences(tensorRef);
+		TORCH_CHECK(references.size() == V.size(), "Ref must have one entry "
+			"per vertex, got ", references.size(), " for ", V.size());
+	}
+	for (auto& f : F) {
+		TORCH_CHECK(f.minCoeff() >= 0 && f.maxCoeff() < V.size(),
+			"F refers to vertices outside V");
+	}
+	return new LinearSolver(V, F, E, references, rigidity, with_rot);
+}
+
+torch::Tensor LinearSolver_solve(
+	const LinearSolver& solver,
+	torch::Tensor tensorGraphV,
+	c10::optional<torch::Tensor> out,
+	int iterations,
+	int num_threads) {
+	std::vector<Vector3> graphV = TensorToPoints(tensorGraphV, "GraphV");
+	TORCH_CHECK(graphV.size() >= solver.NumTargets(), "GraphV must have ",
+		solver.NumTargets(), " rows, got ", graphV.size());
+
+	std::vector<Vector3> V;
+	solver.Solve(graphV, &V, iterations, num_threads);
+
+	int v_size = V.size();
+	torch::Tensor tensorV = OutputTensor<TensorFT>(out, {v_size, 3}, "out");
+	auto dataV = tensorV.data_ptr<TensorFT>();
+	for (int i = 0; i < v_size; ++i) {
+		for (int j = 0; j < 3; ++j) {
+			dataV[i * 3 + j] = V[i][j];
+		}
+	}
+	return tensorV;
+}
@@ -3,6 +3,8 @@
 
 #include <torch/extension.h>
 
+#include <linear.h>
+
 void SolveLinear(
 	torch::Tensor tensorV,
 	torch::Tensor tensorF,
@@ -10,6 +12,30 @@ void SolveLinear(
 	torch::Tensor tensorRef,
 	torch::Tensor tensorGraphV,
 	double rigidity,
+	int with_rot = 0,
+	int iterations = 1,
+	int num_threads = 0);
+
+// The system SolveLinear builds for the rest positions V, factorized once
+// so that new targets only need back-substitution. E and Ref are ignored
+// with rotations.
+LinearSolver* CreateLinearSolver(
+	torch::Tensor tensorV,
+	torch::Tensor tensorF,
+	torch::Tensor tensorE,
+	torch::Tensor tensorRef,
+	double rigidity,
 	int with_rot = 0);
 
+// Deformed positions for the graph vertices (without rotations) or the
+// per-vertex targets (with rotations) in GraphV, as a new [N, 3] tensor
+// or written into out. iterations and num_threads are those of
+// LinearSolver::Solve.
+torch::Tensor LinearSolver_solve(
+	const LinearSolver& solver,
+	torch::Tensor tensorGraphV,
+	c10::optional<torch::Tensor> out = c10::nullopt,
+	int iterations = 1,
+	int num_threads = 0);
+
 #endif
\ No newline at end of file
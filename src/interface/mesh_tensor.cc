@@ -1,7 +1,17 @@
 #include "mesh_tensor.h"
 
+#include <sys/stat.h>
+
+#include <fstream>
+#include <iterator>
+#include <string>
+
 #include <subdivision.h>
 
+#include "grid_cache.h"
+#include "tensor_file.h"
+#include "tensor_util.h"
+
 void CopyMeshToTensor(const Mesh& m,
 	torch::Tensor* ptensorV,
 	torch::Tensor* ptensorF,
@@ -23,8 +33,8 @@ void CopyMeshToTensor(const Mesh& m,
 	tensorV = torch::full({(long long)V.size(), 3}, /*value=*/0, float_options);
 	tensorF = torch::full({(long long)F.size(), 3}, /*value=*/0, int_options);
 
-	auto dataV = static_cast<T*>(tensorV.storage().data());
-	auto dataF = static_cast<int*>(tensorF.storage().data());
+	auto dataV = TensorData<T>(tensorV, "V", 3);
+	auto dataF = TensorData<int>(tensorF, "F", 3);
 
 	auto trans = m.GetTranslation();
 	auto scale = m.GetScale();
@@ -59,8 +69,8 @@ void CopyTensorToMesh(const torch::Tensor& tensorV,
 #else
 	typedef double T;
 #endif
-	auto dataV = static_cast<const T*>(tensorV.storage().data());
-	auto dataF = static_cast<const int*>(tensorF.storage().data());
+	auto dataV = TensorData<T>(tensorV, "V", 3);
+	auto dataF = TensorData<int>(tensorF, "F", 3);
 
 	int v_size = tensorV.size(0);
 	int f_size = tensorF.size(0);
@@ -84,8 +94,52 @@ void CopyTensorToMesh(const torch::Tensor& tensorV,
 	}
 }
 
+// V and F of a binary mesh file, checked like any other input. V is
+// float64 when converted from an OBJ file, so that the mesh reads back
+// exactly as parsed, or the configured float type.
+static std::vector<torch::Tensor> LoadBinaryMesh(const char* filename) {
+	auto tensors = LoadTensorFile(filename);
+	TORCH_CHECK(tensors.size() == 2, filename, " is not a valid mesh file");
+	if (tensors[0].scalar_type() == torch::kFloat64)
+		TensorData<double>(tensors[0], "V", 3);
+	else
+		TensorData<float>(tensors[0], "V", 3);
+	TensorData<int>(tensors[1], "F", 3);
+	return tensors;
+}
+
+static void ReadMesh(const char* filename, Mesh* pm) {
+	if (!IsTensorFile(filename)) {
+		pm->ReadOBJ(filename);
+		return;
+	}
+	auto tensors = LoadBinaryMesh(filename);
+	auto tensorV = tensors[0].to(torch::kFloat64);
+	const double* dataV = tensorV.data_ptr<double>();
+	const int* dataF = tensors[1].data_ptr<int>();
+	auto& V = pm->GetV();
+	auto& F = pm->GetF();
+	V.resize(tensorV.size(0));
+	F.resize(tensors[1].size(0));
+	for (int i = 0; i < (int)V.size(); ++i)
+		V[i] = Vector3(dataV[i * 3], dataV[i * 3 + 1], dataV[i * 3 + 2]);
+	for (int i = 0; i < (int)F.size(); ++i)
+		F[i] = Eigen::Vector3i(dataF[i * 3], dataF[i * 3 + 1], dataF[i * 3 + 2]);
+}
+
 std::vector<torch::Tensor> LoadMesh(
 	const char* filename) {
+#ifndef USE_DOUBLE
+	auto float_type = torch::kFloat32;
+#else
+	auto float_type = torch::kFloat64;
+#endif
+	if (IsTensorFile(filename)) {
+		// F is a view of the mapping, V too unless it has to be converted
+		auto tensors = LoadBinaryMesh(filename);
+		return {tensors[0].to(float_type), tensors[1]};
+	}
+
 	Mesh src;
 	src.ReadOBJ(filename);
 
@@ -99,19 +153,85 @@ std::vector<torch::Tensor> LoadMesh(
 	return {tensorV, tensorF};
 }
 
+// bump when the preprocessing or the output layout changes
+static const int kCadCacheVersion = 1;
+
+// Cache file for the preprocessed mesh, named by a hash of the file content
+// and the thresholds; empty if it cannot be read or no directory is given.
+static std::string CadCachePath(const char* filename,
+	double subdivide_length,
+	double neighbor_length,
+	double graph_length,
+	const char* cache) {
+#ifndef USE_DOUBLE
+	typedef float T;
+#else
+	typedef double T;
+#endif
+	if (!cache || !cache[0])
+		return "";
+	std::ifstream is(filename, std::ios::binary);
+	if (!is)
+		return "";
+	std::string content((std::istreambuf_iterator<char>(is)),
+		std::istreambuf_iterator<char>());
+
+	unsigned long long h = HashBytes(content.data(), content.size());
+	double thresholds[3] = {subdivide_length, neighbor_length, graph_length};
+	h = HashBytes(thresholds, sizeof(thresholds), h);
+	int key[2] = {kCadCacheVersion, (int)sizeof(T)};
+	h = HashBytes(key, sizeof(key), h);
+
+	char name[64];
+	snprintf(name, sizeof(name), "/%016llx.cad", h);
+	return std::string(cache) + name;
+}
+
+// The six tensors of a cache file if it holds a valid LoadCadMesh result.
+static std::vector<torch::Tensor> LoadCadCache(const std::string& path) {
+#ifndef USE_DOUBLE
+	typedef float T;
+#else
+	typedef double T;
+#endif
+	auto tensors = LoadTensorFile(path.c_str());
+	if (tensors.size() != 6)
+		return {};
+	const int cols[6] = {3, 3, 2, 1, 3, 2};
+	for (int i = 0; i < 6; ++i) {
+		auto type = (i == 0 || i == 4) ? c10::CppTypeToScalarType<T>::value
+			: torch::kInt32;
+		if (tensors[i].scalar_type() != type || tensors[i].dim() != 2
+			|| tensors[i].size(1) != cols[i])
+			return {};
+	}
+	return tensors;
+}
+
 std::vector<torch::Tensor> LoadCadMesh(
-	const char* filename) {
+	const char* filename,
+	double subdivide_length,
+	double neighbor_length,
+	double graph_length,
+	const char* cache) {
+	std::string cache_path = CadCachePath(filename, subdivide_length,
+		neighbor_length, graph_length, cache);
+	if (!cache_path.empty()) {
+		auto tensors = LoadCadCache(cache_path);
+		if (!tensors.empty())
+			return tensors;
+	}
 
 	Mesh cad;
-	cad.ReadOBJ(filename);
+	ReadMesh(filename, &cad);
 	cad.RemoveDegenerated();
 	cad.MergeDuplex();
 
 	Subdivision sub;
-	sub.Subdivide(cad, 2e-2);
+	sub.Subdivide(cad, subdivide_length);
 
-	sub.ComputeGeometryNeighbors(1.5e-2);
-	sub.ComputeRepresentativeGraph(1e-2);
+	sub.ComputeGeometryNeighbors(neighbor_length);
+	sub.ComputeRepresentativeGraph(graph_length);
 
 	auto& subdivide_mesh = sub.GetMesh();
 	auto& neighbors = sub.Neighbors();
@@ -144,10 +264,10 @@ std::vector<torch::Tensor> LoadCadMesh(
 	tensorGraphE = torch::full({(long long)graph_edges.size(), 2},
 		0, int_options);
 
-	auto dataE = static_cast<int*>(tensorE.storage().data());
-	auto dataSrc2Graph = static_cast<int*>(tensorSrc2Graph.storage().data());
-	auto dataGraphV = static_cast<T*>(tensorGraphV.storage().data());
-	auto dataGraphE = static_cast<int*>(tensorGraphE.storage().data());
+	auto dataE = TensorData<int>(tensorE, "E", 2);
+	auto dataSrc2Graph = TensorData<int>(tensorSrc2Graph, "Src2Graph");
+	auto dataGraphV = TensorData<T>(tensorGraphV, "GraphV", 3);
+	auto dataGraphE = TensorData<int>(tensorGraphE, "GraphE", 2);
 
 	int top = 0;
 	for (auto& n : neighbors) {
@@ -173,8 +293,14 @@ std::vector<torch::Tensor> LoadCadMesh(
 		top += 2;
 	}
 
-	return {tensorV, tensorF, tensorE, tensorSrc2Graph,
-		tensorGraphV, tensorGraphE};
+	std::vector<torch::Tensor> tensors = {tensorV, tensorF, tensorE,
+		tensorSrc2Graph, tensorGraphV, tensorGraphE};
+	if (!cache_path.empty()) {
+		// a failed write only costs the next run the preprocessing
+		mkdir(cache, 0755);
+		SaveTensorFile(cache_path.c_str(), tensors);
+	}
+	return tensors;
 }
 
 void SaveMesh(const char* filename,
@@ -184,3 +310,42 @@ void SaveMesh(const char* filename,
 	CopyTensorToMesh(tensorV, tensorF, &src);
 	src.WriteOBJ(filename);
 }
+
+void SaveBinaryMesh(const char* filename,
+	const torch::Tensor& tensorV,
+	const torch::Tensor& tensorF) {
+	TORCH_CHECK(tensorV.scalar_type() == torch::kFloat64
+		|| tensorV.scalar_type() == torch::kFloat32,
+		"V must be a float tensor, got ", tensorV.scalar_type());
+	TORCH_CHECK(tensorV.dim() == 2 && tensorV.size(1) == 3,
+		"V must have shape [N, 3], got ", tensorV.sizes());
+	TensorData<int>(tensorF, "F", 3);
+	TORCH_CHECK(SaveTensorFile(filename, {tensorV, tensorF}),
+		"cannot write ", filename);
+}
+
+void ConvertToBinaryMesh(const char* obj_filename, const char* filename) {
+	Mesh mesh;
+	mesh.ReadOBJ(obj_filename);
+	auto& V = mesh.GetV();
+	auto& F = mesh.GetF();
+	// ReadOBJ leaves the mesh empty for a missing or unreadable file; an
+	// empty binary mesh would shadow the OBJ from then on
+	TORCH_CHECK(V.size() > 0 && F.size() > 0, "cannot read a mesh from ",
+		obj_filename);
+	torch::Tensor tensorV = torch::empty({(long long)V.size(), 3},
+		torch::TensorOptions().dtype(torch::kFloat64));
+	torch::Tensor tensorF = torch::empty({(long long)F.size(), 3},
+		torch::TensorOptions().dtype(torch::kInt32));
+	double* dataV = tensorV.data_ptr<double>();
+	int* dataF = tensorF.data_ptr<int>();
+	for (int i = 0; i < (int)V.size(); ++i) {
+		for (int j = 0; j < 3; ++j)
+			dataV[i * 3 + j] = V[i][j];
+	}
+	for (int i = 0; i < (int)F.size(); ++i) {
+		for (int j = 0; j < 3; ++j)
+			dataF[i * 3 + j] = F[i][j];
+	}
+	SaveBinaryMesh(filename, tensorV, tensorF);
+}
@@ -15,14 +15,37 @@ void CopyTensorToMesh(const torch::Tensor& tensorV,
 	Mesh* pm,
 	int normalize = 0);
 
+// LoadMesh and LoadCadMesh read OBJ files or binary mesh files written by
+// SaveBinaryMesh or ConvertToBinaryMesh, told apart by their content. A
+// binary mesh is memory-mapped and LoadMesh returns views of the mapping
+// where the stored type matches.
 std::vector<torch::Tensor> LoadMesh(
 	const char* filename);
 
+// Returns {V, F, E, V2G, GV, GE}: the mesh subdivided to edges shorter than
+// subdivide_length, the pairs of its vertices closer than neighbor_length,
+// the map of its vertices to the representative graph of resolution
+// graph_length, and that graph. If cache names a directory, the result is
+// stored there under a hash of the file content and the thresholds, and
+// later calls with the same arguments map it instead of recomputing it.
 std::vector<torch::Tensor> LoadCadMesh(
-	const char* filename);
+	const char* filename,
+	double subdivide_length = 2e-2,
+	double neighbor_length = 1.5e-2,
+	double graph_length = 1e-2,
+	const char* cache = "");
 
 void SaveMesh(const char* filename,
 	const torch::Tensor& tensorV,
 	const torch::Tensor& tensorF);
 
+// Writes V (float32 or float64) and F to a binary mesh file.
+void SaveBinaryMesh(const char* filename,
+	const torch::Tensor& tensorV,
+	const torch::Tensor& tensorF);
+
+// Parses an OBJ file and stores it as a binary mesh with float64 vertices,
+// which LoadCadMesh reads back exactly as it would parse the OBJ file.
+void ConvertToBinaryMesh(const char* obj_filename, const char* filename);
+
 #endif
\ No newline at end of file
@@ -2,6 +2,8 @@
 
 #include <torch/extension.h>
 
+#include "tensor_util.h"
+
 void NormalizeByTemplate(
 	torch::Tensor tensorV,
 	int param_id)
@@ -13,7 +15,7 @@ void NormalizeByTemplate(
 	typedef double T;
 #endif
 	int v_size = tensorV.size(0);
-	auto dataV = static_cast<T*>(tensorV.storage().data());
+	auto dataV = TensorData<T>(tensorV, "V", 3);
 	auto& trans = params.trans;
 	auto& scale = params.scale;
 	for (int i = 0; i < v_size; ++i) {
@@ -34,7 +36,7 @@ void DenormalizeByTemplate(
 	typedef double T;
 #endif
 	int v_size = tensorV.size(0);
-	auto dataV = static_cast<T*>(tensorV.storage().data());
+	auto dataV = TensorData<T>(tensorV, "V", 3);
 	auto& trans = params.trans;
 	auto& scale = params.scale;
 	for (int i = 0; i < v_size; ++i) {
@@ -2,39 +2,168 @@
 #include <pybind11/eigen.h>
 #include <pybind11/stl.h>
 
+#include <ATen/Parallel.h>
+#include <parallel.h>
+
 #include "cad_layer.h"
+#include "coverage_layer.h"
+#include "deformer_layer.h"
 #include "distance_layer.h"
+#include "edge_layer.h"
 #include "graph_layer.h"
+#include "grid_cache.h"
 #include "linear_layer.h"
+#include "reverse_layer.h"
 #include "rigid_layer.h"
 
 namespace py = pybind11;
 //#define USE_DOUBLE
 
 PYBIND11_MODULE(pyDeform, m) {
+	// num_threads = 0 follows torch.set_num_threads, so pool workers that
+	// limit torch do not each run one thread per core in pyDeform
+	DefaultNumThreads() = []() { return (int)at::get_num_threads(); };
+
 	m.def("LoadMesh", &LoadMesh);
-	m.def("LoadCadMesh", &LoadCadMesh);
+	m.def("LoadCadMesh", &LoadCadMesh,
+		py::arg("filename"), py::arg("subdivide_length") = 2e-2,
+		py::arg("neighbor_length") = 1.5e-2, py::arg("graph_length") = 1e-2,
+		py::arg("cache") = "");
 	m.def("SaveMesh", &SaveMesh);
+	m.def("SaveBinaryMesh", &SaveBinaryMesh);
+	m.def("ConvertToBinaryMesh", &ConvertToBinaryMesh);
+
+	m.def("InitializeDeformTemplate", &InitializeDeformTemplate,
+		py::arg("V"), py::arg("F"), py::arg("symmetry"),
+		py::arg("grid_resolution"), py::arg("grid_cache") = "",
+		py::arg("narrow_band") = 0.0, py::arg("distance_method") = 0);
+	m.def("RetainParams", &RetainParams);
+	m.def("ReleaseParams", &ReleaseParams);
+	m.def("ParamsMemoryUsage", &ParamsMemoryUsage);
+	m.def("ParamsStatistics", &ParamsStatistics);
+
+	py::class_<DeformTemplate>(m, "DeformTemplate")
+		.def(py::init([](torch::Tensor V, torch::Tensor F, int symmetry,
+				int grid_resolution, const char* grid_cache,
+				double narrow_band, int distance_method) {
+			return new DeformTemplate(InitializeDeformTemplate(V, F,
+				symmetry, grid_resolution, grid_cache, narrow_band,
+				distance_method));
+			}),
+			py::arg("V"), py::arg("F"), py::arg("symmetry"),
+			py::arg("grid_resolution"), py::arg("grid_cache") = "",
+			py::arg("narrow_band") = 0.0, py::arg("distance_method") = 0)
+		.def_property_readonly("param_id", &DeformTemplate::Id)
+		.def_property_readonly("released", &DeformTemplate::Released)
+		.def("release", &DeformTemplate::Release)
+		.def("memory_usage", &DeformTemplate::MemoryUsage)
+		.def("__int__", &DeformTemplate::Id)
+		.def("__index__", &DeformTemplate::Id)
+		.def("__enter__", [](DeformTemplate& t) -> DeformTemplate& {
+			return t;
+		}, py::return_value_policy::reference)
+		.def("__exit__", [](DeformTemplate& t, py::args) {
+			t.Release();
+		});
 
-	m.def("InitializeDeformTemplate", &InitializeDeformTemplate);
+	m.def("SetGridCache", &SetGridCache,
+		py::arg("directory"), py::arg("max_bytes") = 0);
+	m.def("GridCacheStatistics", &GridCacheStatistics);
 	m.def("NormalizeByTemplate", &NormalizeByTemplate);
 	m.def("DenormalizeByTemplate", &DenormalizeByTemplate);
-	m.def("SolveLinear", &SolveLinear);
+	m.def("SolveLinear", &SolveLinear,
+		py::arg("V"), py::arg("F"), py::arg("E"), py::arg("Ref"),
+		py::arg("GraphV"), py::arg("rigidity"), py::arg("with_rot") = 0,
+		py::arg("iterations") = 1, py::arg("num_threads") = 0);
 
-	m.def("DistanceFieldLoss_forward", &DistanceFieldLoss_forward);
-	m.def("DistanceFieldLoss_backward", &DistanceFieldLoss_backward);
+	py::class_<LinearSolver>(m, "LinearSolver")
+		.def(py::init(&CreateLinearSolver),
+			py::arg("V"), py::arg("F"), py::arg("E"), py::arg("Ref"),
+			py::arg("rigidity"), py::arg("with_rot") = 0)
+		.def("solve", &LinearSolver_solve,
+			py::arg("GraphV"), py::arg("out") = py::none(),
+			py::arg("iterations") = 1, py::arg("num_threads") = 0)
+		.def("set_rigidity", &LinearSolver::SetRigidity, py::arg("rigidity"))
+		.def_property_readonly("rigidity", &LinearSolver::Rigidity)
+		.def_property_readonly("num_vertices", &LinearSolver::NumVertices);
 
-	m.def("RigidEdgeLoss_forward", &RigidEdgeLoss_forward);
-	m.def("RigidEdgeLoss_backward", &RigidEdgeLoss_backward);
+	m.def("DistanceFieldLoss_forward", &DistanceFieldLoss_forward,
+		py::arg("V"), py::arg("param_id"), py::arg("out") = py::none());
+	m.def("DistanceFieldLoss_backward", &DistanceFieldLoss_backward,
+		py::arg("V"), py::arg("param_id"), py::arg("out") = py::none());
+	m.def("DistanceFieldLoss_forward_backward",
+		&DistanceFieldLoss_forward_backward,
+		py::arg("V"), py::arg("param_id"),
+		py::arg("loss_out") = py::none(),
+		py::arg("gradient_out") = py::none());
+	m.def("DistanceFieldGrid", &DistanceFieldGrid, py::arg("param_id"));
+
+	m.def("RigidEdgeLoss_forward", &RigidEdgeLoss_forward,
+		py::arg("V"), py::arg("F"), py::arg("param_id"),
+		py::arg("out") = py::none());
+	m.def("RigidEdgeLoss_backward", &RigidEdgeLoss_backward,
+		py::arg("V"), py::arg("F"), py::arg("param_id"),
+		py::arg("out") = py::none());
 	m.def("StoreRigidityInformation", &StoreRigidityInformation);
 
-	m.def("CadEdgeLoss_forward", &CadEdgeLoss_forward);
-	m.def("CadEdgeLoss_backward", &CadEdgeLoss_backward);
+	m.def("CadEdgeLoss_forward", &CadEdgeLoss_forward,
+		py::arg("V"), py::arg("F"), py::arg("E"), py::arg("param_id"),
+		py::arg("out") = py::none());
+	m.def("CadEdgeLoss_backward", &CadEdgeLoss_backward,
+		py::arg("V"), py::arg("F"), py::arg("E"), py::arg("param_id"),
+		py::arg("out") = py::none());
 	m.def("StoreCadInformation", &StoreCadInformation);
 
-	m.def("GraphEdgeLoss_forward", &GraphEdgeLoss_forward);
-	m.def("GraphEdgeLoss_backward", &GraphEdgeLoss_backward);
+	m.def("GraphEdgeLoss_forward", &GraphEdgeLoss_forward,
+		py::arg("V"), py::arg("E"), py::arg("param_id"),
+		py::arg("out") = py::none());
+	m.def("GraphEdgeLoss_backward", &GraphEdgeLoss_backward,
+		py::arg("V"), py::arg("E"), py::arg("param_id"),
+		py::arg("out") = py::none());
 	m.def("StoreGraphInformation", &StoreGraphInformation);
+	m.def("EdgeTerms", &EdgeTerms, py::arg("param_id"));
+
+	py::class_<PointIndex>(m, "PointIndex")
+		.def(py::init(&CreatePointIndex),
+			py::arg("V"), py::arg("max_displacement") = 0.0)
+		.def("refit", &RefitPointIndex, py::arg("V"))
+		.def("query", &QueryPointIndex,
+			py::arg("Q"), py::arg("num_threads") = 0,
+			py::arg("index_out") = py::none(),
+			py::arg("distance_out") = py::none(),
+			py::call_guard<py::gil_scoped_release>())
+		.def_property_readonly("num_points", &PointIndex::NumPoints)
+		.def_property_readonly("num_builds", &PointIndex::NumBuilds)
+		.def_property_readonly("num_refits", &PointIndex::NumRefits)
+		.def_property_readonly("cell_size", &PointIndex::CellSize);
+	m.def("ReverseLoss_forward_backward", &ReverseLoss_forward_backward,
+		py::arg("index"), py::arg("src_V"), py::arg("tar_V"),
+		py::arg("target_index") = py::none(), py::arg("num_threads") = 0,
+		py::arg("gradient_out") = py::none());
+
+	py::class_<DeformerOptions>(m, "DeformerOptions")
+		.def(py::init<>())
+		.def_readwrite("num_threads", &DeformerOptions::num_threads)
+		.def_readwrite("linear_solver", &DeformerOptions::linear_solver)
+		.def_readwrite("preconditioner", &DeformerOptions::preconditioner)
+		.def_readwrite("max_num_iterations",
+			&DeformerOptions::max_num_iterations)
+		.def_readwrite("max_linear_solver_iterations",
+			&DeformerOptions::max_linear_solver_iterations)
+		.def_readwrite("minimizer_progress_to_stdout",
+			&DeformerOptions::minimizer_progress_to_stdout)
+		.def_readwrite("report_costs", &DeformerOptions::report_costs)
+		.def_readwrite("analytic_derivatives",
+			&DeformerOptions::analytic_derivatives);
+	m.def("CeresDeform", &CeresDeform,
+		py::arg("V"), py::arg("F"), py::arg("param_id"),
+		py::arg("rigidity") = 1.0, py::arg("options") = DeformerOptions(),
+		py::call_guard<py::gil_scoped_release>());
+
+	m.def("CoverageDeform", &CoverageDeform,
+		py::arg("src_V"), py::arg("src_F"), py::arg("ref_V"), py::arg("ref_F"),
+		py::arg("rigidity") = 1.0, py::arg("num_threads") = 0,
+		py::call_guard<py::gil_scoped_release>());
 
 }
 
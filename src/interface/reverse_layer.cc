@@ -0,0 +1,116 @@
+#include "reverse_layer.h"
+
+#include <algorithm>
+
+#include "tensor_util.h"
+
+PointIndex* CreatePointIndex(torch::Tensor tensorV, double max_displacement) {
+#ifndef USE_DOUBLE
+	typedef float T;
+#else
+	typedef double T;
+#endif
+	const T* dataV = TensorData<T>(tensorV, "V", 3);
+	PointIndex* index = new PointIndex(max_displacement);
+	index->Build(dataV, tensorV.size(0));
+	return index;
+}
+
+bool RefitPointIndex(PointIndex& index, torch::Tensor tensorV) {
+#ifndef USE_DOUBLE
+	typedef float T;
+#else
+	typedef double T;
+#endif
+	const T* dataV = TensorData<T>(tensorV, "V", 3);
+	return index.Refit(dataV, tensorV.size(0));
+}
+
+std::vector<torch::Tensor> QueryPointIndex(
+	const PointIndex& index, torch::Tensor tensorQ, int num_threads,
+	c10::optional<torch::Tensor> index_out,
+	c10::optional<torch::Tensor> distance_out) {
+#ifndef USE_DOUBLE
+	typedef float T;
+#else
+	typedef double T;
+#endif
+	const T* dataQ = TensorData<T>(tensorQ, "Q", 3);
+	int q_size = tensorQ.size(0);
+
+	torch::Tensor indices = OutputTensor<int>(index_out, {q_size},
+		"index_out");
+	torch::Tensor distances = OutputTensor<T>(distance_out, {q_size},
+		"distance_out");
+
+	index.Query(dataQ, q_size, indices.data_ptr<int>(),
+		distances.data_ptr<T>(), num_threads);
+	return {indices, distances};
+}
+
+std::vector<torch::Tensor> ReverseLoss_forward_backward(
+	PointIndex& index, torch::Tensor tensorSrc, torch::Tensor tensorTar,
+	const PointIndex* target_index, int num_threads,
+	c10::optional<torch::Tensor> gradient_out) {
+#ifndef USE_DOUBLE
+	typedef float T;
+#else
+	typedef double T;
+#endif
+	const T* dataSrc = TensorData<T>(tensorSrc, "src_V", 3);
+	const T* dataTar = TensorData<T>(tensorTar, "tar_V", 3);
+	int src_size = tensorSrc.size(0);
+	int tar_size = tensorTar.size(0);
+	TORCH_CHECK(src_size > 0 || tar_size == 0,
+		"src_V is empty but tar_V is not");
+	TORCH_CHECK(!target_index || target_index->NumPoints() == tar_size,
+		"target_index has ", target_index ? target_index->NumPoints() : 0,
+		" points, tar_V has ", tar_size);
+
+	index.Refit(dataSrc, src_size);
+
+	torch::Tensor gradient = OutputTensor<T>(gradient_out, {src_size, 3},
+		"gradient_out");
+	T* dataG = gradient.data_ptr<T>();
+	std::fill(dataG, dataG + src_size * 3, T(0));
+
+	// The nearest neighbors are the expensive part and run in parallel;
+	// the sums are taken in order so the result does not depend on the
+	// number of threads.
+	std::vector<int> nearest(tar_size);
+	std::vector<T> distances(tar_size);
+	index.Query(dataTar, tar_size, nearest.data(), distances.data(),
+		num_threads);
+	double loss = 0;
+	for (int i = 0; i < tar_size; ++i) {
+		const T* t = dataTar + i * 3;
+		const T* s = dataSrc + nearest[i] * 3;
+		T* g = dataG + nearest[i] * 3;
+		for (int j = 0; j < 3; ++j) {
+			T d = s[j] - t[j];
+			loss += d * d;
+			g[j] += d;
+		}
+	}
+
+	if (target_index) {
+		nearest.resize(src_size);
+		distances.resize(src_size);
+		target_index->Query(dataSrc, src_size, nearest.data(),
+			distances.data(), num_threads);
+		for (int i = 0; i < src_size; ++i) {
+			const T* s = dataSrc + i * 3;
+			const T* t = dataTar + nearest[i] * 3;
+			T* g = dataG + i * 3;
+			for (int j = 0; j < 3; ++j) {
+				T d = s[j] - t[j];
+				loss += d * d;
+				g[j] += d;
+			}
+		}
+	}
+
+	torch::Tensor tensorLoss = torch::full({}, loss * 0.5,
+		torch::TensorOptions().dtype(c10::CppTypeToScalarType<T>::value));
+	return {tensorLoss, gradient};
+}
@@ -0,0 +1,41 @@
+#ifndef SHAPEDEFORM_INTERFACE_REVERSE_LAYER_H_
+#define SHAPEDEFORM_INTERFACE_REVERSE_LAYER_H_
+
+#include <torch/extension.h>
+
+#include <point_index.h>
+
+// Nearest neighbor index over the [N, 3] points V, kept across iterations
+// by ReverseLossLayer and refit as the points move.
+PointIndex* CreatePointIndex(
+	torch::Tensor tensorV,
+	double max_displacement = 0);
+
+// Returns true if the index had to be rebuilt.
+bool RefitPointIndex(
+	PointIndex& index,
+	torch::Tensor tensorV);
+
+// Returns {indices, squared_distances} of the nearest indexed point of
+// each row of the [M, 3] tensor Q, as int32 [M] and float [M] tensors.
+std::vector<torch::Tensor> QueryPointIndex(
+	const PointIndex& index,
+	torch::Tensor tensorQ,
+	int num_threads = 0,
+	c10::optional<torch::Tensor> index_out = c10::nullopt,
+	c10::optional<torch::Tensor> distance_out = c10::nullopt);
+
+// Refits index to the [N, 3] source and returns {loss, gradient}: the 0-dim
+// loss 0.5 * sum |src[nn(t)] - t|^2 over the rows t of the [M, 3] target
+// and its [N, 3] gradient with respect to the source. With target_index
+// (built over the target) the source to target term is added as well,
+// giving a symmetric Chamfer loss.
+std::vector<torch::Tensor> ReverseLoss_forward_backward(
+	PointIndex& index,
+	torch::Tensor tensorSrc,
+	torch::Tensor tensorTar,
+	const PointIndex* target_index = nullptr,
+	int num_threads = 0,
+	c10::optional<torch::Tensor> gradient_out = c10::nullopt);
+
+#endif
@@ -8,6 +8,9 @@
 
 #include <uniformgrid.h>
 
+#include "edge_layer.h"
+#include "tensor_util.h"
+
 void StoreRigidityInformation(
 	torch::Tensor tensorV,
 	torch::Tensor tensorF,
@@ -21,12 +24,16 @@ void StoreRigidityInformation(
 	typedef double T;
 	typedef Eigen::Vector3d V3;
 #endif
-	const T* dataV = static_cast<const T*>(tensorV.storage().data());
-	auto dataF = static_cast<const int*>(tensorF.storage().data());
+	const T* dataV = TensorData<T>(tensorV, "V", 3);
+	auto dataF = TensorData<int>(tensorF, "F", 3);
 
 	int f_size = tensorF.size(0);
 
 	params.edge_offset.resize(f_size * 3);
+	// unweighted terms; a lambda left by StoreCadInformation would
+	// make the torch backend weight them (EdgeTerms)
+	params.edge_lambda.clear();
+	std::vector<int> edge_vertex(f_size * 6);
 	
 	int offset = 0;
 	for (int i = 0; i < f_size; ++i) {
@@ -40,94 +47,30 @@ void StoreRigidityInformation(
 				v1_data[0] - v0_data[0],
 				v1_data[1] - v0_data[1],
 				v1_data[2] - v0_data[2]);
+			edge_vertex[offset * 2] = v0;
+			edge_vertex[offset * 2 + 1] = v1;
 			offset += 1;
 		}
 	}
+	StoreEdgeIndex(edge_vertex, tensorV.size(0), &params);
 }
 
 torch::Tensor RigidEdgeLoss_forward(
 	torch::Tensor tensorV,
 	torch::Tensor tensorF,
-	int param_id) {
-
+	int param_id,
+	c10::optional<torch::Tensor> out) {
 	auto& params = GetParams(param_id);
-#ifndef USE_DOUBLE
-	typedef float T;
-#else
-	typedef double T;
-#endif
-	int f_size = tensorF.size(0);
-
-	auto dataV = static_cast<const T*>(tensorV.storage().data());
-	auto dataF = static_cast<const int*>(tensorF.storage().data());
-
-#ifndef USE_DOUBLE
-	auto float_options = torch::TensorOptions().dtype(torch::kFloat32);
-#else
-	auto float_options = torch::TensorOptions().dtype(torch::kFloat64);
-#endif
-	torch::Tensor loss = torch::full({f_size * 3, 3}, 0, float_options);
-	auto dataL = static_cast<T*>(loss.storage().data());
-
-	for (int i = 0; i < f_size; ++i) {
-		for (int j = 0; j < 3; ++j) {
-			int v0 = dataF[(i * 3 + j)];
-			int v1 = dataF[(i * 3 + (j + 1) % 3)];
-			const T* v0_data = dataV + v0 * 3;
-			const T* v1_data = dataV + v1 * 3;
-			T* l = dataL + (i * 3 + j) * 3;
-			l[0] = (v1_data[0] - v0_data[0] - params.edge_offset[i * 3 + j][0]);
-			l[1] = (v1_data[1] - v0_data[1] - params.edge_offset[i * 3 + j][1]);
-			l[2] = (v1_data[2] - v0_data[2] - params.edge_offset[i * 3 + j][2]);
-			l[0] *= l[0];
-			l[1] *= l[1];
-			l[2] *= l[2];
-		}
-	}
-
-	return loss;
+	CheckStoredEdges(params, torch::Tensor(), tensorF);
+	return EdgeLoss_forward(tensorV, params, false, out);
 }
 
 torch::Tensor RigidEdgeLoss_backward(
 	torch::Tensor tensorV,
 	torch::Tensor tensorF,
-	int param_id) {
-
+	int param_id,
+	c10::optional<torch::Tensor> out) {
 	auto& params = GetParams(param_id);
-#ifndef USE_DOUBLE
-	typedef float T;
-	auto float_options = torch::TensorOptions().dtype(torch::kFloat32);
-#else
-	typedef double T;
-	auto float_options = torch::TensorOptions().dtype(torch::kFloat64);
-#endif
-	int v_size = tensorV.size(0);
-	int f_size = tensorF.size(0);
-
-	auto dataV = static_cast<const T*>(tensorV.storage().data());
-	auto dataF = static_cast<const int*>(tensorF.storage().data());
-
-	torch::Tensor loss = torch::full({v_size, 3}, /*value=*/0, float_options);
-	auto dataL = static_cast<T*>(loss.storage().data());
-
-	for (int i = 0; i < f_size; ++i) {
-		for (int j = 0; j < 3; ++j) {
-			int v0 = dataF[(i * 3 + j)];
-			int v1 = dataF[(i * 3 + (j + 1) % 3)];
-			const T* v0_data = dataV + v0 * 3;
-			const T* v1_data = dataV + v1 * 3;
-
-			T* l_v0 = dataL + v0 * 3;
-			T* l_v1 = dataL + v1 * 3;
-
-			for (int k = 0; k < 3; ++k) {
-				l_v0[k] -= (v1_data[k] - v0_data[k]
-					- params.edge_offset[i * 3 + j][k]);
-				l_v1[k] += (v1_data[k] - v0_data[k]
-					- params.edge_offset[i * 3 + j][k]);
-			}
-		}
-	}
-
-	return loss;	
+	CheckStoredEdges(params, torch::Tensor(), tensorF);
+	return EdgeLoss_backward(tensorV, params, false, out);
 }
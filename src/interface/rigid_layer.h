@@ -14,11 +14,13 @@ void StoreRigidityInformation(
 torch::Tensor RigidEdgeLoss_forward(
 	torch::Tensor tensorV,
 	torch::Tensor tensorF,
-	int param_id);
+	int param_id,
+	c10::optional<torch::Tensor> out = c10::nullopt);
 
 torch::Tensor RigidEdgeLoss_backward(
 	torch::Tensor tensorV,
 	torch::Tensor tensorF,
-	int param_id);
+	int param_id,
+	c10::optional<torch::Tensor> out = c10::nullopt);
 
 #endif
\ No newline at end of file
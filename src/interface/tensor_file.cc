@@ -0,0 +1,182 @@
+#include "tensor_file.h"
+
+#include <fcntl.h>
+#include <sys/mman.h>
+#include <sys/stat.h>
+#include <unistd.h>
+
+#include <cstring>
+#include <fstream>
+#include <memory>
+#include <string>
+
+#include <file_util.h>
+
+struct TensorFileHeader {
+	char magic[8];
+	int version;
+	int num_tensors;
+};
+
+struct TensorRecord {
+	int dtype;
+	int dim;
+	long long sizes[4];
+	long long offset;
+	long long bytes;
+};
+
+static const char kTensorMagic[8] = {'M','O','D','E','T','N','S','R'};
+static const int kTensorVersion = 1;
+static const long long kTensorAlignment = 64;
+
+enum TensorFileType {
+	INT32_TENSOR = 0,
+	FLOAT32_TENSOR = 1,
+	FLOAT64_TENSOR = 2
+};
+
+static int FileType(c10::ScalarType type) {
+	switch (type) {
+	case torch::kInt32:
+		return INT32_TENSOR;
+	case torch::kFloat32:
+		return FLOAT32_TENSOR;
+	case torch::kFloat64:
+		return FLOAT64_TENSOR;
+	default:
+		return -1;
+	}
+}
+
+static c10::ScalarType ScalarType(int type) {
+	if (type == INT32_TENSOR)
+		return torch::kInt32;
+	if (type == FLOAT32_TENSOR)
+		return torch::kFloat32;
+	return torch::kFloat64;
+}
+
+static long long Align(long long offset) {
+	return (offset + kTensorAlignment - 1) / kTensorAlignment
+		* kTensorAlignment;
+}
+
+bool SaveTensorFile(const char* filename,
+	const std::vector<torch::Tensor>& tensors) {
+	TensorFileHeader header;
+	memset(&header, 0, sizeof(header));
+	memcpy(header.magic, kTensorMagic, sizeof(kTensorMagic));
+	header.version = kTensorVersion;
+	header.num_tensors = tensors.size();
+
+	std::vector<torch::Tensor> data(tensors.size());
+	std::vector<TensorRecord> records(tensors.size());
+	long long offset = Align(sizeof(header)
+		+ tensors.size() * sizeof(TensorRecord));
+	for (int i = 0; i < (int)tensors.size(); ++i) {
+		data[i] = tensors[i].cpu().contiguous();
+		TensorRecord& record = records[i];
+		memset(&record, 0, sizeof(record));
+		record.dtype = FileType(data[i].scalar_type());
+		record.dim = data[i].dim();
+		if (record.dtype < 0 || record.dim > 4)
+			return false;
+		for (int j = 0; j < record.dim; ++j)
+			record.sizes[j] = data[i].size(j);
+		record.offset = offset;
+		record.bytes = data[i].numel() * data[i].element_size();
+		offset = Align(offset + record.bytes);
+	}
+
+	// a temporary of our own, so that concurrent writers of the same file
+	// never interleave and readers only see complete files
+	std::string tmp_filename;
+	if (!CreateTempFile(filename, &tmp_filename))
+		return false;
+	std::ofstream os(tmp_filename, std::ios::binary);
+	if (!os) {
+		unlink(tmp_filename.c_str());
+		return false;
+	}
+	os.write((const char*)&header, sizeof(header));
+	os.write((const char*)records.data(),
+		records.size() * sizeof(TensorRecord));
+	long long position = sizeof(header) + records.size() * sizeof(TensorRecord);
+	static const char padding[kTensorAlignment] = {0};
+	for (int i = 0; i < (int)data.size(); ++i) {
+		os.write(padding, records[i].offset - position);
+		os.write((const char*)data[i].data_ptr(), records[i].bytes);
+		position = records[i].offset + records[i].bytes;
+	}
+	os.write(padding, Align(position) - position);
+	os.close();
+	if (!os) {
+		unlink(tmp_filename.c_str());
+		return false;
+	}
+	if (rename(tmp_filename.c_str(), filename) != 0) {
+		unlink(tmp_filename.c_str());
+		return false;
+	}
+	return true;
+}
+
+std::vector<torch::Tensor> LoadTensorFile(const char* filename) {
+	int fd = open(filename, O_RDONLY);
+	if (fd < 0)
+		return {};
+
+	struct stat st;
+	if (fstat(fd, &st) != 0 || st.st_size < (off_t)sizeof(TensorFileHeader)) {
+		close(fd);
+		return {};
+	}
+
+	size_t length = st.st_size;
+	void* base = mmap(0, length, PROT_READ | PROT_WRITE, MAP_PRIVATE, fd, 0);
+	close(fd);
+	if (base == MAP_FAILED)
+		return {};
+	std::shared_ptr<char> mapped((char*)base, [length](char* p) {
+		munmap(p, length);
+	});
+
+	const TensorFileHeader* header = (const TensorFileHeader*)base;
+	long long records_end = sizeof(TensorFileHeader)
+		+ (long long)header->num_tensors * sizeof(TensorRecord);
+	if (memcmp(header->magic, kTensorMagic, sizeof(kTensorMagic)) != 0
+		|| header->version != kTensorVersion
+		|| header->num_tensors < 0
+		|| records_end > (long long)length)
+		return {};
+
+	const TensorRecord* records = (const TensorRecord*)(header + 1);
+	std::vector<torch::Tensor> tensors;
+	for (int i = 0; i < header->num_tensors; ++i) {
+		const TensorRecord& record = records[i];
+		if (record.dtype < INT32_TENSOR || record.dtype > FLOAT64_TENSOR
+			|| record.dim < 0 || record.dim > 4
+			|| record.offset < records_end
+			|| record.offset + record.bytes > (long long)length)
+			return {};
+		std::vector<int64_t> sizes(record.sizes, record.sizes + record.dim);
+		auto options = torch::TensorOptions().dtype(ScalarType(record.dtype));
+		long long numel = 1;
+		for (auto size : sizes)
+			numel *= size;
+		if (numel * c10::elementSize(ScalarType(record.dtype)) != record.bytes)
+			return {};
+		// every tensor holds a reference to the mapping
+		tensors.push_back(torch::from_blob(mapped.get() + record.offset, sizes,
+			[mapped](void*) {}, options));
+	}
+	return tensors;
+}
+
+bool IsTensorFile(const char* filename) {
+	char magic[sizeof(kTensorMagic)];
+	std::ifstream is(filename, std::ios::binary);
+	return is.read(magic, sizeof(magic))
+		&& memcmp(magic, kTensorMagic, sizeof(kTensorMagic)) == 0;
+}
@@ -0,0 +1,27 @@
+#ifndef SHAPEDEFORM_INTERFACE_TENSOR_FILE_H_
+#define SHAPEDEFORM_INTERFACE_TENSOR_FILE_H_
+
+#include <vector>
+
+#include <torch/extension.h>
+
+// Binary container for a list of int32/float32/float64 tensors: a header,
+// one record per tensor (dtype, shape, offset) and the data, each tensor
+// aligned to 64 bytes. Used for meshes (V, F) so that they can be loaded
+// without parsing an OBJ file.
+
+// Writes the tensors (made contiguous if needed) to a temporary file that
+// is then renamed to filename. Returns false on failure.
+bool SaveTensorFile(const char* filename,
+	const std::vector<torch::Tensor>& tensors);
+
+// Memory-maps the file and returns tensors viewing the mapping, which is
+// private: writes to the tensors are copy-on-write and never reach the
+// file. Returns an empty list if the file is missing or not a valid
+// tensor file.
+std::vector<torch::Tensor> LoadTensorFile(const char* filename);
+
+// Whether the file starts with the tensor file magic.
+bool IsTensorFile(const char* filename);
+
+#endif
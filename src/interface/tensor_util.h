@@ -0,0 +1,41 @@
+#ifndef SHAPEDEFORM_INTERFACE_TENSOR_UTIL_H_
+#define SHAPEDEFORM_INTERFACE_TENSOR_UTIL_H_
+
+#include <torch/extension.h>
+
+// Pointer to the first element of a contiguous CPU tensor of element type
+// T. Views with a storage offset are read in place, without copying.
+// If cols >= 0 the tensor must also be a [N, cols] matrix.
+template <class T>
+T* TensorData(const torch::Tensor& tensor, const char* name,
+	int64_t cols = -1) {
+	const auto dtype = c10::CppTypeToScalarType<T>::value;
+	TORCH_CHECK(tensor.defined(), name, " is undefined");
+	TORCH_CHECK(tensor.device().is_cpu(), name, " must be a CPU tensor, got ",
+		tensor.device());
+	TORCH_CHECK(tensor.scalar_type() == dtype, name, " must have dtype ",
+		dtype, ", got ", tensor.scalar_type());
+	TORCH_CHECK(tensor.is_contiguous(), name, " must be contiguous");
+	if (cols >= 0) {
+		TORCH_CHECK(tensor.dim() == 2 && tensor.size(1) == cols,
+			name, " must have shape [N, ", cols, "], got ", tensor.sizes());
+	}
+	return tensor.data_ptr<T>();
+}
+
+// The caller-provided out tensor, checked like TensorData and against
+// sizes, or a new uninitialized tensor if out is None.
+template <class T>
+torch::Tensor OutputTensor(const c10::optional<torch::Tensor>& out,
+	at::IntArrayRef sizes, const char* name) {
+	if (!out.has_value() || !out->defined()) {
+		return torch::empty(sizes, torch::TensorOptions().dtype(
+			c10::CppTypeToScalarType<T>::value));
+	}
+	TensorData<T>(*out, name);
+	TORCH_CHECK(out->sizes() == sizes, name, " must have shape ", sizes,
+		", got ", out->sizes());
+	return *out;
+}
+
+#endif
@@ -0,0 +1,170 @@
+#include "coverage.h"
+
+#include <algorithm>
+#include <cmath>
+
+#include <Eigen/Sparse>
+#include <Eigen/SparseLU>
+
+#include "parallel.h"
+#include "sparse_assembly.h"
+
+static MatrixX PointsToMatrix(const std::vector<Vector3>& V) {
+	MatrixX M(V.size(), 3);
+	for (int i = 0; i < V.size(); ++i)
+		M.row(i) = V[i];
+	return M;
+}
+
+static Eigen::MatrixXi FacesToMatrix(const std::vector<Eigen::Vector3i>& F) {
+	Eigen::MatrixXi M(F.size(), 3);
+	for (int i = 0; i < F.size(); ++i)
+		M.row(i) = F[i];
+	return M;
+}
+
+MeshAABB::MeshAABB(const std::vector<Vector3>& V,
+	const std::vector<Eigen::Vector3i>& F)
+: V_(PointsToMatrix(V)), F_(FacesToMatrix(F))
+{
+	tree_.init(V_, F_);
+}
+
+void MeshAABB::SquaredDistance(const MatrixX& P, VectorX* sqrD,
+	Eigen::VectorXi* I, MatrixX* C, int num_threads) const {
+	const int kBlockSize = 1024;
+	int num_points = P.rows();
+	sqrD->resize(num_points);
+	I->resize(num_points);
+	C->resize(num_points, 3);
+	int num_blocks = (num_points + kBlockSize - 1) / kBlockSize;
+	ParallelFor(0, num_blocks, [&](int b) {
+		int begin = b * kBlockSize;
+		int size = std::min(kBlockSize, num_points - begin);
+		// a plain matrix, which every libigl signature of squared_distance
+		// accepts, unlike a block of P
+		MatrixX block_P = P.middleRows(begin, size);
+		VectorX block_sqrD;
+		Eigen::VectorXi block_I;
+		MatrixX block_C;
+		tree_.squared_distance(V_, F_, block_P, block_sqrD, block_I, block_C);
+		sqrD->segment(begin, size) = block_sqrD;
+		I->segment(begin, size) = block_I;
+		C->middleRows(begin, size) = block_C;
+	}, num_threads);
+}
+
+// Barycentric coordinates of p with respect to the triangle (a, b, c), as
+// computed by igl::barycentric_coordinates.
+static Vector3 Barycentric(const Vector3& p, const Vector3& a,
+	const Vector3& b, const Vector3& c) {
+	Vector3 v0 = b - a, v1 = c - a, v2 = p - a;
+	FT d00 = v0.dot(v0);
+	FT d01 = v0.dot(v1);
+	FT d11 = v1.dot(v1);
+	FT d20 = v2.dot(v0);
+	FT d21 = v2.dot(v1);
+	FT denom = d00 * d11 - d01 * d01;
+	FT w1 = (d11 * d20 - d01 * d21) / denom;
+	FT w2 = (d00 * d21 - d01 * d20) / denom;
+	return Vector3(1 - w1 - w2, w1, w2);
+}
+
+CoverageDeformer::CoverageDeformer(const Mesh& ref, FT lambda,
+	int num_threads)
+: ref_(ref), ref_tree_(ref.GetV(), ref.GetF()), lambda_(lambda),
+  num_threads_(num_threads)
+{
+	ref_.ComputeVertexNormals();
+}
+
+int CoverageDeformer::Deform(Mesh* psrc) const {
+	Mesh& src = *psrc;
+	auto& V = src.GetV();
+	auto& F = src.GetF();
+	auto& ref_V = ref_.GetV();
+	auto& ref_NV = ref_.GetNV();
+	int num_V = V.size();
+	int num_ref = ref_V.size();
+
+	MeshAABB src_tree(V, F);
+	src.ComputeFaceNormals();
+	auto& NF = src.GetNF();
+
+	VectorX sqrD1, sqrD2;
+	Eigen::VectorXi I1, I2;
+	MatrixX C1, C2;
+	src_tree.SquaredDistance(ref_tree_.V(), &sqrD1, &I1, &C1, num_threads_);
+	ref_tree_.SquaredDistance(src_tree.V(), &sqrD2, &I2, &C2, num_threads_);
+
+	// the barycentric coordinates of every accepted closest point on src
+	std::vector<Vector3> weights(num_ref);
+	std::vector<char> accepted(num_ref, 0);
+	ParallelFor(0, num_ref, [&](int i) {
+		if (std::sqrt(sqrD1[i]) >= 0.1)
+			return;
+		int find = I1[i];
+		for (int j = 0; j < 3; ++j) {
+			Vector3 v_s = C2.row(F[find][j]);
+			if ((v_s - ref_V[i]).norm() > 5e-2)
+				return;
+		}
+		Vector3 w = Barycentric(C1.row(i), V[F[find][0]], V[F[find][1]],
+			V[F[find][2]]);
+		Vector3 p0 = w[0] * V[F[find][0]] + w[1] * V[F[find][1]]
+			+ w[2] * V[F[find][2]];
+		Vector3 diff = p0 - ref_V[i];
+		diff /= diff.norm();
+		if (std::abs(diff.dot(NF[find])) < 0.5)
+			return;
+		if (std::abs(diff.dot(ref_NV[i])) < 0.5)
+			return;
+		weights[i] = w;
+		accepted[i] = 1;
+	}, num_threads_);
+
+	// every term couples vertices of one face
+	SparseAssembly A(num_V);
+	A.AddFaceEdges(F);
+	A.Compress();
+	MatrixX B = MatrixX::Zero(num_V, 3);
+	int count = 0;
+	for (int i = 0; i < num_ref; ++i) {
+		if (!accepted[i])
+			continue;
+		auto& face = F[I1[i]];
+		auto& w = weights[i];
+		for (int j = 0; j < 3; ++j) {
+			for (int k = 0; k < 3; ++k)
+				A.Entry(face[j], face[k]) += w[j] * w[k];
+			B.row(face[j]) += ref_V[i] * w[j];
+		}
+		count += 1;
+	}
+
+	for (int i = 0; i < num_V; ++i) {
+		A.Entry(i, i) += 1e-6;
+		B.row(i) += V[i] * 1e-6;
+	}
+
+	for (int i = 0; i < F.size(); ++i) {
+		for (int j = 0; j < 3; ++j) {
+			int v0 = F[i][j];
+			int v1 = F[i][(j + 1) % 3];
+			A.AddLaplacian(v0, v1, lambda_);
+			B.row(v0) += lambda_ * (V[v0] - V[v1]);
+			B.row(v1) += lambda_ * (V[v1] - V[v0]);
+		}
+	}
+
+	Eigen::SparseLU<SpMat> solver;
+	solver.analyzePattern(A.Matrix());
+	solver.factorize(A.Matrix());
+
+	for (int j = 0; j < 3; ++j) {
+		VectorX result = solver.solve(B.col(j));
+		for (int i = 0; i < num_V; ++i)
+			V[i][j] = result[i];
+	}
+	return count;
+}
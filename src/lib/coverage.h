@@ -0,0 +1,57 @@
+#ifndef SHAPEDEFORM_COVERAGE_H_
+#define SHAPEDEFORM_COVERAGE_H_
+
+#include <vector>
+
+#include <igl/AABB.h>
+
+#include "mesh.h"
+
+// Closest point queries against a fixed triangle mesh, through an igl::AABB
+// that is built once and shared by every query.
+class MeshAABB
+{
+public:
+	MeshAABB(const std::vector<Vector3>& V,
+		const std::vector<Eigen::Vector3i>& F);
+
+	// Squared distance to, index of and closest point on the nearest face
+	// for every row of P, in blocks on num_threads threads (all hardware
+	// threads if <= 0).
+	void SquaredDistance(const MatrixX& P, VectorX* sqrD,
+		Eigen::VectorXi* I, MatrixX* C, int num_threads = 0) const;
+
+	const MatrixX& V() const { return V_; }
+	const Eigen::MatrixXi& F() const { return F_; }
+
+private:
+	MatrixX V_;
+	Eigen::MatrixXi F_;
+	igl::AABB<MatrixX, 3> tree_;
+};
+
+// The deformation of the coverage_deform app, which moves src to cover
+// ref. Every vertex of ref within 0.1 of src pulls its closest point on
+// src towards itself, provided the vertices of that face also lie within
+// 5e-2 of it on ref and the offset is within 60 degrees of both the face
+// and the vertex normal. lambda keeps the edge vectors of src. Both meshes
+// are in the same frame; ref, its tree and its vertex normals are kept
+// across Deform calls.
+class CoverageDeformer
+{
+public:
+	explicit CoverageDeformer(const Mesh& ref, FT lambda = 1,
+		int num_threads = 0);
+
+	// Solves for the vertices of src in place and returns the number of
+	// ref vertices that pulled on it.
+	int Deform(Mesh* src) const;
+
+private:
+	Mesh ref_;
+	MeshAABB ref_tree_;
+	FT lambda_;
+	int num_threads_;
+};
+
+#endif
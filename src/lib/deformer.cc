@@ -1,13 +1,177 @@
 #include "deformer.h"
 
+#include <algorithm>
+#include <cstdlib>
+#include <cstring>
+#include <deque>
+#include <iostream>
+#include <stdexcept>
+
 #include <ceres/ceres.h>
 #include <igl/point_mesh_squared_distance.h>
 
 #include "distanceloss.h"
 #include "edgeloss.h"
+#include "parallel.h"
+
+int ParseDeformerOptions(int argc, char** argv, DeformerOptions* options) {
+	int kept = 0;
+	for (int i = 0; i < argc; ++i) {
+		const char* arg = argv[i];
+		const char* value = strchr(arg, '=');
+		if (i == 0 || strncmp(arg, "--", 2) != 0 || value == 0) {
+			argv[kept++] = argv[i];
+			continue;
+		}
+		std::string key(arg + 2, value - arg - 2);
+		value += 1;
+		if (key == "num_threads")
+			options->num_threads = atoi(value);
+		else if (key == "linear_solver")
+			options->linear_solver = value;
+		else if (key == "preconditioner")
+			options->preconditioner = value;
+		else if (key == "max_num_iterations")
+			options->max_num_iterations = atoi(value);
+		else if (key == "max_linear_solver_iterations")
+			options->max_linear_solver_iterations = atoi(value);
+		else if (key == "progress")
+			options->minimizer_progress_to_stdout = atoi(value);
+		else if (key == "report_costs")
+			options->report_costs = atoi(value);
+		else if (key == "analytic")
+			options->analytic_derivatives = atoi(value);
+		else if (key == "levels")
+			options->multiresolution_levels = atoi(value);
+		else
+			argv[kept++] = argv[i];
+	}
+	return kept;
+}
+
+static ceres::Solver::Options SolverOptions(const DeformerOptions& deformer) {
+	ceres::Solver::Options options;
+	if (!ceres::StringToLinearSolverType(deformer.linear_solver,
+		&options.linear_solver_type)) {
+		throw std::invalid_argument("unknown linear solver "
+			+ deformer.linear_solver);
+	}
+	if (!ceres::StringToPreconditionerType(deformer.preconditioner,
+		&options.preconditioner_type)) {
+		throw std::invalid_argument("unknown preconditioner "
+			+ deformer.preconditioner);
+	}
+	options.max_num_iterations = deformer.max_num_iterations;
+	options.max_linear_solver_iterations =
+		deformer.max_linear_solver_iterations;
+	options.minimizer_progress_to_stdout =
+		deformer.minimizer_progress_to_stdout != 0;
+	options.num_threads = NumThreads(deformer.num_threads);
+	std::string error;
+	if (!options.IsValid(&error))
+		throw std::invalid_argument(error);
+	return options;
+}
+
+// Problem options for problems whose cost functions live in CostFunctions.
+static ceres::Problem::Options ProblemOptions() {
+	ceres::Problem::Options options;
+	options.cost_function_ownership = ceres::DO_NOT_TAKE_OWNERSHIP;
+	return options;
+}
+
+// Cost functions of one problem, which must outlive it. The analytic costs
+// are stored in deques, a handful of allocations instead of one per
+// residual, and a single DistanceCost serves every vertex. The autodiff
+// losses are used instead when analytic derivatives are off.
+class CostFunctions {
+public:
+	explicit CostFunctions(int analytic)
+	: analytic_(analytic) {}
+
+	ceres::CostFunction* Distance(const UniformGrid* grid) {
+		if (!analytic_)
+			return Own(DistanceLoss::Create(grid));
+		if (!distance_ || distance_grid_ != grid) {
+			distance_.reset(new DistanceCost(grid));
+			distance_grid_ = grid;
+		}
+		return distance_.get();
+	}
+
+	ceres::CostFunction* Edge(const Vector3& v, FT lambda) {
+		if (!analytic_)
+			return Own(EdgeLoss::Create(v, lambda));
+		edges_.emplace_back(v, lambda);
+		return &edges_.back();
+	}
+
+	ceres::CostFunction* AdaptiveEdge(const Vector3& v, FT lambda) {
+		if (!analytic_)
+			return Own(AdaptiveEdgeLoss::Create(v, lambda));
+		adaptive_edges_.emplace_back(v, lambda);
+		return &adaptive_edges_.back();
+	}
+
+	ceres::CostFunction* Own(ceres::CostFunction* cost_function) {
+		owned_.emplace_back(cost_function);
+		return cost_function;
+	}
+
+private:
+	int analytic_;
+	const UniformGrid* distance_grid_ = 0;
+	std::unique_ptr<DistanceCost> distance_;
+	std::deque<EdgeCost> edges_;
+	std::deque<AdaptiveEdgeCost> adaptive_edges_;
+	std::vector<std::unique_ptr<ceres::CostFunction> > owned_;
+};
+
+// Solves once, or with a callback until the cost stops changing.
+static void RunSolver(const ceres::Solver::Options& solver_options,
+	TerminateWhenSuccessCallback* callback, ceres::Problem* problem) {
+	ceres::Solver::Options options = solver_options;
+	if (callback) {
+		double prev_cost = 1e30;
+		options.callbacks.push_back(callback);
+
+		while (true) {
+			ceres::Solver::Summary summary;
+			ceres::Solve(options, problem, &summary);
+			if (std::abs(prev_cost - summary.final_cost) < 1e-6)
+				break;
+			prev_cost = summary.final_cost;
+		}
+	} else {
+		ceres::Solver::Summary summary;
+		ceres::Solve(options, problem, &summary);
+	}
+}
 
-Deformer::Deformer(FT lambda, CallBackFunc func)
-: lambda_(lambda), callback_(0)
+static void ReportCosts(ceres::Problem* problem,
+	const std::vector<ceres::ResidualBlockId>& v_block_ids,
+	const std::vector<ceres::ResidualBlockId>& edge_block_ids) {
+	//V error
+	ceres::Problem::EvaluateOptions v_options;
+	v_options.residual_blocks = v_block_ids;
+	double v_cost;
+	problem->Evaluate(v_options, &v_cost, NULL, NULL, NULL);
+	std::cout<<"Vertices cost: "<<v_cost<<std::endl;
+
+	//E error
+	ceres::Problem::EvaluateOptions edge_options;
+	edge_options.residual_blocks = edge_block_ids;
+	FT edge_cost;
+	problem->Evaluate(edge_options, &edge_cost, NULL, NULL, NULL);
+	std::cout<<"Rigidity cost: "<<edge_cost<<std::endl;
+
+	FT final_cost = v_cost + edge_cost;
+	std::cout<<"Final cost: "<<final_cost<<std::endl;
+}
+
+Deformer::Deformer(FT lambda, CallBackFunc func,
+	const DeformerOptions& options)
+: lambda_(lambda), options_(options), callback_(0)
 {
 	if (func != 0)
 		callback_ = std::shared_ptr<TerminateWhenSuccessCallback>(
@@ -24,13 +188,14 @@ void Deformer::Deform(const UniformGrid& grid, Mesh* pmesh) {
 	auto& V = mesh.GetV();
 	auto& F = mesh.GetF();
 	
-	ceres::Problem problem;
+	CostFunctions costs(options_.analytic_derivatives);
+	ceres::Problem problem(ProblemOptions());
 
 	//Move vertices
 	std::vector<ceres::ResidualBlockId> v_block_ids;
 	v_block_ids.reserve(V.size());
 	for (int i = 0; i < V.size(); ++i) {
-		ceres::CostFunction* cost_function = DistanceLoss::Create(&grid);
+		ceres::CostFunction* cost_function = costs.Distance(&grid);
 		ceres::ResidualBlockId block_id = problem.AddResidualBlock(
 			cost_function, 0, V[i].data());
 		v_block_ids.push_back(block_id);			
@@ -42,7 +207,7 @@ void Deformer::Deform(const UniformGrid& grid, Mesh* pmesh) {
 	for (int i = 0; i < F.size(); ++i) {
 		for (int j = 0; j < 3; ++j) {
 			Vector3 v = (V[F[i][j]] - V[F[i][(j + 1) % 3]]);
-			ceres::CostFunction* cost_function = EdgeLoss::Create(v, lambda);
+			ceres::CostFunction* cost_function = costs.Edge(v, lambda);
 			ceres::ResidualBlockId block_id = problem.AddResidualBlock(
 				cost_function, 0,
 				V[F[i][j]].data(),
@@ -52,43 +217,9 @@ void Deformer::Deform(const UniformGrid& grid, Mesh* pmesh) {
 		}
 	}
 
-	ceres::Solver::Options options;
-	options.max_num_iterations = 100;
-	options.linear_solver_type = ceres::SPARSE_NORMAL_CHOLESKY;
-	options.minimizer_progress_to_stdout = true;
-	options.num_threads = 1;
-	if (callback) {
-		double prev_cost = 1e30;
-		options.callbacks.push_back(callback);
-
-		while (true) {
-			ceres::Solver::Summary summary;
-			ceres::Solve(options, &problem, &summary);
-			if (std::abs(prev_cost - summary.final_cost) < 1e-6)
-				break;
-			prev_cost = summary.final_cost;
-		}
-	} else {
-		ceres::Solver::Summary summary;
-		ceres::Solve(options, &problem, &summary);
-	}
-
-	//V error
-	ceres::Problem::EvaluateOptions v_options;
-	v_options.residual_blocks = v_block_ids;
-	double v_cost;
-	problem.Evaluate(v_options, &v_cost, NULL, NULL, NULL);
-	std::cout<<"Vertices cost: "<<v_cost<<std::endl;
-
-	//E error
-	ceres::Problem::EvaluateOptions edge_options;
-	edge_options.residual_blocks = edge_block_ids;
-	FT edge_cost;
-	problem.Evaluate(edge_options, &edge_cost, NULL, NULL, NULL);
-	std::cout<<"Rigidity cost: "<<edge_cost<<std::endl;
-
-	FT final_cost = v_cost + edge_cost;
-	std::cout<<"Final cost: "<<final_cost<<std::endl;
+	RunSolver(SolverOptions(options_), callback, &problem);
+	if (options_.report_costs)
+		ReportCosts(&problem, v_block_ids, edge_block_ids);
 }
 
 void Deformer::DeformWithRot(const UniformGrid& grid, Mesh* pmesh) {
@@ -100,13 +231,14 @@ void Deformer::DeformWithRot(const UniformGrid& grid, Mesh* pmesh) {
 	auto& V = mesh.GetV();
 	auto& F = mesh.GetF();
 	
-	ceres::Problem problem;
+	CostFunctions costs(options_.analytic_derivatives);
+	ceres::Problem problem(ProblemOptions());
 
 	//Move vertices
 	std::vector<ceres::ResidualBlockId> v_block_ids;
 	v_block_ids.reserve(V.size());
 	for (int i = 0; i < V.size(); ++i) {
-		ceres::CostFunction* cost_function = DistanceLoss::Create(&grid);
+		ceres::CostFunction* cost_function = costs.Distance(&grid);
 		ceres::ResidualBlockId block_id =
 			problem.AddResidualBlock(cost_function, 0, V[i].data());
 		v_block_ids.push_back(block_id);			
@@ -120,7 +252,7 @@ void Deformer::DeformWithRot(const UniformGrid& grid, Mesh* pmesh) {
 		for (int j = 0; j < 3; ++j) {
 			Vector3 v = (V[F[i][j]] - V[F[i][(j + 1) % 3]]);
 			ceres::CostFunction* cost_function =
-				EdgeLossWithRot::Create(v, lambda);
+				costs.Own(EdgeLossWithRot::Create(v, lambda));
 			ceres::ResidualBlockId block_id = problem.AddResidualBlock(
 				cost_function, 0,
 				V[F[i][j]].data(),
@@ -132,42 +264,9 @@ void Deformer::DeformWithRot(const UniformGrid& grid, Mesh* pmesh) {
 		}
 	}
 
-	ceres::Solver::Options options;
-	options.max_num_iterations = 100;
-	options.linear_solver_type = ceres::SPARSE_NORMAL_CHOLESKY;
-	options.minimizer_progress_to_stdout = true;
-	options.num_threads = 1;
-	if (callback) {
-		double prev_cost = 1e30;
-		options.callbacks.push_back(callback);
-
-		while (true) {
-			ceres::Solver::Summary summary;
-			ceres::Solve(options, &problem, &summary);
-			if (std::abs(prev_cost - summary.final_cost) < 1e-6)
-				break;
-			prev_cost = summary.final_cost;
-		}
-	} else {
-		ceres::Solver::Summary summary;
-		ceres::Solve(options, &problem, &summary);
-	}
-	//V error
-	ceres::Problem::EvaluateOptions v_options;
-	v_options.residual_blocks = v_block_ids;
-	double v_cost;
-	problem.Evaluate(v_options, &v_cost, NULL, NULL, NULL);
-	std::cout<<"Vertices cost: "<<v_cost<<std::endl;
-
-	//E error
-	ceres::Problem::EvaluateOptions edge_options;
-	edge_options.residual_blocks = edge_block_ids;
-	FT edge_cost;
-	problem.Evaluate(edge_options, &edge_cost, NULL, NULL, NULL);
-	std::cout<<"Rigidity cost: "<<edge_cost<<std::endl;
-
-	FT final_cost = v_cost + edge_cost;
-	std::cout<<"Final cost: "<<final_cost<<std::endl;
+	RunSolver(SolverOptions(options_), callback, &problem);
+	if (options_.report_costs)
+		ReportCosts(&problem, v_block_ids, edge_block_ids);
 }
 
 void Deformer::DeformSubdivision(const UniformGrid& grid, Subdivision* psub) {
@@ -180,13 +279,14 @@ void Deformer::DeformSubdivision(const UniformGrid& grid, Subdivision* psub) {
 	auto& V = mesh.GetV();
 	auto& F = mesh.GetF();
 	
-	ceres::Problem problem;
+	CostFunctions costs(options_.analytic_derivatives);
+	ceres::Problem problem(ProblemOptions());
 
 	//Move vertices 
 	std::vector<ceres::ResidualBlockId> v_block_ids;
 	v_block_ids.reserve(V.size());
 	for (int i = 0; i < V.size(); ++i) {
-		ceres::CostFunction* cost_function = DistanceLoss::Create(&grid);
+		ceres::CostFunction* cost_function = costs.Distance(&grid);
 		ceres::ResidualBlockId block_id = problem.AddResidualBlock(
 			cost_function, 0, V[i].data());
 		v_block_ids.push_back(block_id);			
@@ -201,7 +301,7 @@ void Deformer::DeformSubdivision(const UniformGrid& grid, Subdivision* psub) {
 		int v2 = p.second;
 		Vector3 v = (V[v1] - V[v2]);
 		ceres::CostFunction* cost_function =
-			AdaptiveEdgeLoss::Create(v, lambda);
+			costs.AdaptiveEdge(v, lambda);
 		ceres::ResidualBlockId block_id = problem.AddResidualBlock(
 			cost_function, 0, V[v1].data(), V[v2].data());
 		edge_block_ids.push_back(block_id);
@@ -212,7 +312,7 @@ void Deformer::DeformSubdivision(const UniformGrid& grid, Subdivision* psub) {
 			Vector3 v = (V[F[i][j]] - V[F[i][(j + 1) % 3]]);
 			
 			ceres::CostFunction* cost_function =
-				AdaptiveEdgeLoss::Create(v, lambda);
+				costs.AdaptiveEdge(v, lambda);
 			
 			ceres::ResidualBlockId block_id = problem.AddResidualBlock(
 				cost_function, 0,
@@ -223,43 +323,9 @@ void Deformer::DeformSubdivision(const UniformGrid& grid, Subdivision* psub) {
 		}
 	}
 
-	ceres::Solver::Options options;
-	options.max_num_iterations = 100;
-	options.linear_solver_type = ceres::SPARSE_NORMAL_CHOLESKY;
-	options.minimizer_progress_to_stdout = true;
-	options.num_threads = 1;
-	if (callback) {
-		double prev_cost = 1e30;
-		options.callbacks.push_back(callback);
-
-		while (true) {
-			ceres::Solver::Summary summary;
-			ceres::Solve(options, &problem, &summary);
-			if (std::abs(prev_cost - summary.final_cost) < 1e-6)
-				break;
-			prev_cost = summary.final_cost;
-		}
-	} else {
-		ceres::Solver::Summary summary;
-		ceres::Solve(options, &problem, &summary);
-	}
-
-	//V error
-	ceres::Problem::EvaluateOptions v_options;
-	v_options.residual_blocks = v_block_ids;
-	double v_cost;
-	problem.Evaluate(v_options, &v_cost, NULL, NULL, NULL);
-	std::cout<<"Vertices cost: "<<v_cost<<std::endl;
-
-	//E error
-	ceres::Problem::EvaluateOptions edge_options;
-	edge_options.residual_blocks = edge_block_ids;
-	FT edge_cost;
-	problem.Evaluate(edge_options, &edge_cost, NULL, NULL, NULL);
-	std::cout<<"Rigidity cost: "<<edge_cost<<std::endl;
-
-	FT final_cost = v_cost + edge_cost;
-	std::cout<<"Final cost: "<<final_cost<<std::endl;	
+	RunSolver(SolverOptions(options_), callback, &problem);
+	if (options_.report_costs)
+		ReportCosts(&problem, v_block_ids, edge_block_ids);
 }
 
 void Deformer::ReverseDeform(const Mesh& tar, Mesh* psrc) {
@@ -302,7 +368,8 @@ void Deformer::ReverseDeform(const Mesh& tar, Mesh* psrc) {
 
 		igl::point_mesh_squared_distance(V2,V1,F1,sqrD,I,C);
 
-		ceres::Problem problem;
+		CostFunctions costs(options_.analytic_derivatives);
+		ceres::Problem problem(ProblemOptions());
 
 		auto& V = V1;
 		auto& F = F1;
@@ -320,7 +387,7 @@ void Deformer::ReverseDeform(const Mesh& tar, Mesh* psrc) {
 
 			Vector3 w = weight.row(0);
 			ceres::CostFunction* cost_function =
-				BarycentricDistanceLoss::Create(w, V2.row(i));
+				costs.Own(BarycentricDistanceLoss::Create(w, V2.row(i)));
 
 			problem.AddResidualBlock(cost_function, 0,
 				&V1(F1(find, 0), 0),&V1(F1(find, 1), 0),&V1(F1(find, 2), 0));
@@ -329,7 +396,7 @@ void Deformer::ReverseDeform(const Mesh& tar, Mesh* psrc) {
 		//Enforce rigidity
 		for (int i = 0; i < V.rows(); ++i) {
 			ceres::CostFunction* cost_function =
-				PointRegularizerLoss::Create(1e-3, Vc.row(i));
+				costs.Own(PointRegularizerLoss::Create(1e-3, Vc.row(i)));
 			problem.AddResidualBlock(cost_function, 0, &(V(i,0)));
 		}
 
@@ -337,18 +404,15 @@ void Deformer::ReverseDeform(const Mesh& tar, Mesh* psrc) {
 			for (int j = 0; j < 3; ++j) {
 				Vector3 v = (Vc.row(F(i,j)) - Vc.row(F(i,(j + 1) % 3)));
 				ceres::CostFunction* cost_function =
-					EdgeLoss::Create(v, lambda);
+					costs.Edge(v, lambda);
 				problem.AddResidualBlock(cost_function, 0,
 					&V(F(i,j),0),
 					&V(F(i,(j + 1) % 3),0));
 			}
 		}
 
-		ceres::Solver::Options options;
-		options.max_num_iterations = 100;
-		options.linear_solver_type = ceres::SPARSE_NORMAL_CHOLESKY;
+		ceres::Solver::Options options = SolverOptions(options_);
 		options.minimizer_progress_to_stdout = false;
-		options.num_threads = 1;
 
 		options.callbacks.push_back(&callback);
 
@@ -368,6 +432,11 @@ void Deformer::ReverseDeform(const Mesh& tar, Mesh* psrc) {
 }
 
 void Deformer::DeformGraph(const UniformGrid& grid, Subdivision* sub) {
+	DeformGraph(grid, sub->GraphV(), sub);
+}
+
+void Deformer::DeformGraph(const UniformGrid& grid,
+	const std::vector<Vector3>& rest, Subdivision* sub) {
 	auto& V = sub->GraphV();
 	auto& E = sub->GraphE();
 
@@ -376,13 +445,14 @@ void Deformer::DeformGraph(const UniformGrid& grid, Subdivision* sub) {
 		callback_ == 0 ? 0 : &(*callback_);
 
 	
-	ceres::Problem problem;
+	CostFunctions costs(options_.analytic_derivatives);
+	ceres::Problem problem(ProblemOptions());
 
 	//Move vertices
 	std::vector<ceres::ResidualBlockId> v_block_ids;
 	v_block_ids.reserve(V.size());
 	for (int i = 0; i < V.size(); ++i) {
-		ceres::CostFunction* cost_function = DistanceLoss::Create(&grid);
+		ceres::CostFunction* cost_function = costs.Distance(&grid);
 		ceres::ResidualBlockId block_id = problem.AddResidualBlock(
 			cost_function, 0, V[i].data());
 		v_block_ids.push_back(block_id);			
@@ -392,8 +462,8 @@ void Deformer::DeformGraph(const UniformGrid& grid, Subdivision* sub) {
 	std::vector<ceres::ResidualBlockId> edge_block_ids;
 	edge_block_ids.reserve(E.size());
 	for (auto& info : E) {
-		Vector3 v = V[info.first] - V[info.second];
-		ceres::CostFunction* cost_function = EdgeLoss::Create(v, lambda);
+		Vector3 v = rest[info.first] - rest[info.second];
+		ceres::CostFunction* cost_function = costs.Edge(v, lambda);
 		ceres::ResidualBlockId block_id = problem.AddResidualBlock(
 			cost_function, 0,
 			V[info.first].data(),
@@ -402,41 +472,60 @@ void Deformer::DeformGraph(const UniformGrid& grid, Subdivision* sub) {
 		edge_block_ids.push_back(block_id);		
 	}
 
-	ceres::Solver::Options options;
-	options.max_num_iterations = 100;
-	options.linear_solver_type = ceres::SPARSE_NORMAL_CHOLESKY;
-	options.minimizer_progress_to_stdout = true;
-	options.num_threads = 1;
-	if (callback) {
-		double prev_cost = 1e30;
-		options.callbacks.push_back(callback);
+	RunSolver(SolverOptions(options_), callback, &problem);
+	if (options_.report_costs)
+		ReportCosts(&problem, v_block_ids, edge_block_ids);
+}
 
-		while (true) {
-			ceres::Solver::Summary summary;
-			ceres::Solve(options, &problem, &summary);
-			if (std::abs(prev_cost - summary.final_cost) < 1e-6)
-				break;
-			prev_cost = summary.final_cost;
+void Deformer::DeformMultiresolution(const Mesh& ref, const UniformGrid& grid,
+	double graph_length, Subdivision* sub) {
+	auto& V = sub->GetMesh().GetV();
+	const std::vector<Vector3> rest = V;
+	std::vector<Vector3> deformed;
+	Mesh target = ref;
+	// the caller's graph, for level 0; rebuilt here in the normalized frame
+	// its cells would no longer line up with the raw-frame ones
+	const std::vector<Vector3> graph_v = sub->GraphV();
+	const std::vector<std::pair<int, int> > graph_e = sub->GraphE();
+	const std::vector<int> graph_reference = sub->Vertex2Graph();
+
+	int levels = std::max(1, options_.multiresolution_levels);
+	for (int level = levels - 1; level >= 0; --level) {
+		std::unique_ptr<UniformGrid> coarse_grid;
+		const UniformGrid* level_grid = &grid;
+		if (level > 0) {
+			coarse_grid.reset(new UniformGrid(
+				std::max(8, grid.Dimension() >> level)));
+			target.ConstructDistanceField(*coarse_grid);
+			level_grid = coarse_grid.get();
 		}
-	} else {
-		ceres::Solver::Summary summary;
-		ceres::Solve(options, &problem, &summary);
-	}
 
-	//V error
-	ceres::Problem::EvaluateOptions v_options;
-	v_options.residual_blocks = v_block_ids;
-	double v_cost;
-	problem.Evaluate(v_options, &v_cost, NULL, NULL, NULL);
-	std::cout<<"Vertices cost: "<<v_cost<<std::endl;
-
-	//E error
-	ceres::Problem::EvaluateOptions edge_options;
-	edge_options.residual_blocks = edge_block_ids;
-	FT edge_cost;
-	problem.Evaluate(edge_options, &edge_cost, NULL, NULL, NULL);
-	std::cout<<"Rigidity cost: "<<edge_cost<<std::endl;
+		// the graph and the linear solve are built on the rest shape
+		V = rest;
+		if (level > 0) {
+			sub->ComputeRepresentativeGraph(graph_length * (1 << level));
+		} else {
+			sub->GraphV() = graph_v;
+			sub->GraphE() = graph_e;
+			sub->Vertex2Graph() = graph_reference;
+		}
+		auto& GV = sub->GraphV();
+		const std::vector<Vector3> graph_rest = GV;
+		if (!deformed.empty()) {
+			auto& reference = sub->Vertex2Graph();
+			std::vector<int> count(GV.size(), 0);
+			for (auto& v : GV)
+				v = Vector3::Zero();
+			for (int i = 0; i < reference.size(); ++i) {
+				GV[reference[i]] += deformed[i];
+				count[reference[i]] += 1;
+			}
+			for (int i = 0; i < GV.size(); ++i)
+				GV[i] /= count[i];
+		}
 
-	FT final_cost = v_cost + edge_cost;
-	std::cout<<"Final cost: "<<final_cost<<std::endl;
-}
\ No newline at end of file
+		DeformGraph(*level_grid, graph_rest, sub);
+		sub->LinearSolve();
+		deformed = V;
+	}
+}
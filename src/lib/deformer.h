@@ -2,17 +2,47 @@
 #define SHAPEDEFORM_DEFORMER_H_
 
 #include <memory>
+#include <string>
 
 #include "callback.h"
 #include "mesh.h"
 #include "subdivision.h"
 #include "uniformgrid.h"
 
+// Solver settings shared by every Deformer method. linear_solver and
+// preconditioner take the ceres names (SPARSE_NORMAL_CHOLESKY, CGNR,
+// ITERATIVE_SCHUR, ... and JACOBI, SCHUR_JACOBI, ...); the preconditioner
+// only matters for the iterative solvers. num_threads = 0 uses
+// NumThreads(0): every hardware thread, or torch's thread count from
+// Python. report_costs prints the distance and rigidity costs
+// after each solve. analytic_derivatives = 0 falls back to the autodiff
+// distance and edge losses. multiresolution_levels is the number of levels
+// DeformMultiresolution runs.
+struct DeformerOptions {
+	int num_threads = 0;
+	std::string linear_solver = "SPARSE_NORMAL_CHOLESKY";
+	std::string preconditioner = "JACOBI";
+	int max_num_iterations = 100;
+	int max_linear_solver_iterations = 500;
+	int minimizer_progress_to_stdout = 1;
+	int report_costs = 1;
+	int analytic_derivatives = 1;
+	int multiresolution_levels = 1;
+};
+
+// Consumes the --num_threads=, --linear_solver=, --preconditioner=,
+// --max_num_iterations=, --max_linear_solver_iterations=, --progress=,
+// --report_costs=, --analytic= and --levels= flags anywhere in argv, and
+// returns argc without them so the positional arguments of the apps keep
+// their indices.
+int ParseDeformerOptions(int argc, char** argv, DeformerOptions* options);
+
 class Deformer {
 public:
 	Deformer();
 
-	Deformer(FT lambda = (FT)1.0, CallBackFunc func = 0);
+	Deformer(FT lambda = (FT)1.0, CallBackFunc func = 0,
+		const DeformerOptions& options = DeformerOptions());
 
 	void Deform(const UniformGrid& grid, Mesh* mesh);
 
@@ -24,8 +54,30 @@ public:
 
 	void DeformGraph(const UniformGrid& grid, Subdivision* sub);
 
+	// Coarse-to-fine DeformGraph and LinearSolve over
+	// options.multiresolution_levels levels. Level k > 0 fits the
+	// representative graph of resolution graph_length * 2^k to the distance
+	// field of ref on a grid of grid.Dimension() / 2^k; level 0 fits the
+	// graph already on sub to grid, so the last solve is the one DeformGraph
+	// alone would make. Each graph vertex starts at the mean of its mesh
+	// vertices as the previous level left them. ref and the mesh of sub are
+	// normalized, and graph_length is in normalized units. The rigidity
+	// terms of every level refer to the undeformed mesh.
+	void DeformMultiresolution(const Mesh& ref, const UniformGrid& grid,
+		double graph_length, Subdivision* sub);
+
+	const DeformerOptions& Options() const {
+		return options_;
+	}
+
 private:
+	// DeformGraph with the rigidity terms taken from the graph vertices
+	// rest instead of the current GraphV.
+	void DeformGraph(const UniformGrid& grid,
+		const std::vector<Vector3>& rest, Subdivision* sub);
+
 	FT lambda_;
+	DeformerOptions options_;
 	std::shared_ptr<TerminateWhenSuccessCallback> callback_;
 };
-#endif
\ No newline at end of file
+#endif
@@ -1,6 +1,8 @@
 #ifndef SHAPEDEFORM_DISTANCELOSS_H_
 #define SHAPEDEFORM_DISTANCELOSS_H_
 
+#include <ceres/sized_cost_function.h>
+
 #include "uniformgrid.h"
 
 struct DistanceLoss {
@@ -24,6 +26,35 @@ struct DistanceLoss {
 	 const UniformGrid* grid;
 };
 
+// DistanceLoss with the jacobian from UniformGrid::DistanceWithGradient.
+// It holds no per-vertex state, so one instance serves every vertex.
+class DistanceCost : public ceres::SizedCostFunction<3, 3> {
+public:
+	explicit DistanceCost(const UniformGrid* grid)
+	: grid_(grid) {}
+
+	bool Evaluate(double const* const* parameters,
+		double* residuals,
+		double** jacobians) const override {
+		double gradient[3];
+		residuals[0] = grid_->DistanceWithGradient(parameters[0], gradient);
+		residuals[1] = 0;
+		residuals[2] = 0;
+		if (jacobians && jacobians[0]) {
+			double* J = jacobians[0];
+			for (int j = 0; j < 3; ++j) {
+				J[j] = gradient[j];
+				J[3 + j] = 0;
+				J[6 + j] = 0;
+			}
+		}
+		return true;
+	}
+
+private:
+	const UniformGrid* grid_;
+};
+
 struct BarycentricDistanceLoss {
 	BarycentricDistanceLoss(const Vector3& w_, const Vector3& tar_)
 	: w(w_), tar(tar_) {}
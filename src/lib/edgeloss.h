@@ -4,6 +4,7 @@
 #include "types.h"
 
 #include <ceres/rotation.h>
+#include <ceres/sized_cost_function.h>
 
 struct EdgeLoss {
 	EdgeLoss(const Vector3& v_, FT lambda_)
@@ -61,6 +62,46 @@ struct AdaptiveEdgeLoss {
 	 FT lambda;
 };
 
+// EdgeLoss with hand-written jacobians: the residual is linear in p1 - p2,
+// so they are +-lambda times the identity.
+class EdgeCost : public ceres::SizedCostFunction<3, 3, 3> {
+public:
+	EdgeCost(const Vector3& v, FT lambda)
+	: v_(v), lambda_(lambda) {}
+
+	bool Evaluate(double const* const* parameters,
+		double* residuals,
+		double** jacobians) const override {
+		const double* p1 = parameters[0];
+		const double* p2 = parameters[1];
+		for (int j = 0; j < 3; ++j)
+			residuals[j] = (p1[j] - p2[j] - v_[j]) * lambda_;
+		if (jacobians) {
+			for (int k = 0; k < 2; ++k) {
+				if (!jacobians[k])
+					continue;
+				double* J = jacobians[k];
+				for (int j = 0; j < 9; ++j)
+					J[j] = 0;
+				J[0] = J[4] = J[8] = k == 0 ? lambda_ : -lambda_;
+			}
+		}
+		return true;
+	}
+
+protected:
+	Vector3 v_;
+	FT lambda_;
+};
+
+// AdaptiveEdgeLoss with hand-written jacobians.
+class AdaptiveEdgeCost : public EdgeCost {
+public:
+	AdaptiveEdgeCost(const Vector3& v, FT lambda)
+	: EdgeCost(v, lambda * (2e-2 / (v.norm() + 1e-8)))
+	{}
+};
+
 struct EdgeLossWithRot {
 	EdgeLossWithRot(const Vector3& v_, FT lambda_)
 	: v(v_), lambda(lambda_) {}
@@ -0,0 +1,29 @@
+#ifndef SHAPEDEFORM_FILE_UTIL_H_
+#define SHAPEDEFORM_FILE_UTIL_H_
+
+#include <stdlib.h>
+#include <sys/stat.h>
+#include <unistd.h>
+
+#include <string>
+#include <vector>
+
+// Creates an empty file with a unique name next to filename and returns
+// its name in tmp_filename. Writers fill it and rename it over filename,
+// so concurrent writers of the same file never share a temporary and a
+// reader only ever sees a complete file.
+inline bool CreateTempFile(const char* filename, std::string* tmp_filename) {
+	std::string pattern = std::string(filename) + ".XXXXXX";
+	std::vector<char> name(pattern.begin(), pattern.end());
+	name.push_back('\0');
+	int fd = mkstemp(name.data());
+	if (fd < 0)
+		return false;
+	// mkstemp creates the file readable by the owner only
+	fchmod(fd, 0644);
+	close(fd);
+	*tmp_filename = name.data();
+	return true;
+}
+
+#endif
@@ -1,232 +1,225 @@
 #include "linear.h"
 
+#include <algorithm>
 #include <set>
-#include <unordered_map>
 
 #include <Eigen/Core>
 #include <Eigen/Dense>
 #include <Eigen/Sparse>
 
-template<class Iter>
-void LinearEstimation(std::vector<Vector3>& V,
+#include "parallel.h"
+#include "sparse_assembly.h"
+
+LinearSolver::LinearSolver(const std::vector<Vector3>& V,
 	const std::vector<Eigen::Vector3i>& F,
-	const Iter& E_begin, const Iter& E_end,
+	const std::vector<std::pair<int, int> >& E,
 	const std::vector<int>& references,
-	const std::vector<Vector3>& graphV,
-	double rigidity)
+	double rigidity, bool with_rot)
+: with_rot_(with_rot), rigidity_(rigidity), rest_(V)
 {
-	std::unordered_map<long long, FT> trips;
-	
-	int num_entries = V.size();
-	MatrixX B = MatrixX::Zero(num_entries, 3);
-	auto add_entry_A = [&](int x, int y, FT w) {
-		long long key = (long long)x * (long long)num_entries + (long long)y;
-		auto it = trips.find(key);
-		if (it == trips.end())
-			trips[key] = w;
-		else
-			it->second += w;
-	};
-	auto add_entry_B = [&](int m, const Vector3& v) {
-		B.row(m) += v;
-	};
-
-	std::vector<std::vector<int> > grid_cell(graphV.size());
-	for (int i = 0; i < references.size(); ++i)
-		grid_cell[references[i]].push_back(i);
-
-
-	for (int i = 0; i < grid_cell.size(); ++i) {
-		double weight = 1.0 / grid_cell[i].size();
-		double weight2 = weight * weight;
-		for (int j = 0; j < grid_cell[i].size(); ++j) {
-			for (int k = 0; k < grid_cell[i].size(); ++k) {
-				add_entry_A(grid_cell[i][j], grid_cell[i][k], weight2);
+	int num_V = V.size();
+	SparseAssembly assembly(num_V);
+	assembly.AddFaceEdges(F);
+
+	if (!with_rot) {
+		references_ = references;
+		int num_cells = 0;
+		for (auto r : references)
+			num_cells = std::max(num_cells, r + 1);
+		std::vector<std::vector<int> > grid_cell(num_cells);
+		for (int i = 0; i < references.size(); ++i)
+			grid_cell[references[i]].push_back(i);
+		for (auto& cell : grid_cell)
+			assembly.AddClique(cell);
+		for (auto& e : E)
+			assembly.AddEdge(e.first, e.second);
+		assembly.Compress();
+		base_values_ = VectorX::Zero(assembly.Matrix().nonZeros());
+		edge_values_ = VectorX::Zero(assembly.Matrix().nonZeros());
+
+		cell_weight_.resize(num_cells);
+		for (int i = 0; i < num_cells; ++i) {
+			double weight = 1.0 / grid_cell[i].size();
+			double weight2 = weight * weight;
+			cell_weight_[i] = weight;
+			for (auto j : grid_cell[i]) {
+				for (auto k : grid_cell[i])
+					base_values_[assembly.Offset(j, k)] += weight2;
 			}
 		}
-		for (int j = 0; j < grid_cell[i].size(); ++j) {
-			add_entry_B(grid_cell[i][j], weight * graphV[i]);
-		}
-	}
+		for (int i = 0; i < num_V; ++i)
+			base_values_[assembly.Offset(i, i)] += 1e-6;
 
-	for (int i = 0; i < V.size(); ++i) {
-		double weight = 1e-6;
-		add_entry_A(i, i, weight);
-		add_entry_B(i, weight *
-			graphV[references[i]]);
-	}
-
-
-	FT regular = rigidity;
-
-	for (int i = 0; i < F.size(); ++i) {
-		for (int j = 0; j < 3; ++j) {
-			int v0 = F[i][j];
-			int v1 = F[i][(j + 1) % 3];
-			double reg = regular * 2e-2 / ((V[v0] - V[v1]).norm() + 1e-8);
+		// reg = (rigidity * 2e-2 / length)^2, so s = rigidity^2
+		edge_rhs_ = MatrixX::Zero(num_V, 3);
+		auto add_edge = [&](int v0, int v1) {
+			double reg = 2e-2 / ((V[v0] - V[v1]).norm() + 1e-8);
 			reg *= reg;
-			add_entry_A(v0, v0, reg);
-			add_entry_A(v0, v1, -reg);
-			add_entry_A(v1, v0, -reg);
-			add_entry_A(v1, v1, reg);
-			add_entry_B(v0, reg * (V[v0] - V[v1]));
-			add_entry_B(v1, reg * (V[v1] - V[v0]));
+			assembly.AddLaplacian(v0, v1, reg, edge_values_.data());
+			edge_rhs_.row(v0) += reg * (V[v0] - V[v1]);
+			edge_rhs_.row(v1) += reg * (V[v1] - V[v0]);
+		};
+		for (int i = 0; i < F.size(); ++i) {
+			for (int j = 0; j < 3; ++j)
+				add_edge(F[i][j], F[i][(j + 1) % 3]);
+		}
+		for (auto& e : E)
+			add_edge(e.first, e.second);
+	} else {
+		assembly.Compress();
+		base_values_ = VectorX::Zero(assembly.Matrix().nonZeros());
+		edge_values_ = VectorX::Zero(assembly.Matrix().nonZeros());
+
+		// the pattern holds exactly the one-ring of every vertex next to
+		// its diagonal entry
+		const SpMat& pattern = assembly.Matrix();
+		link_offset_.resize(num_V + 1, 0);
+		for (int i = 0; i < num_V; ++i) {
+			for (int k = pattern.outerIndexPtr()[i];
+				k < pattern.outerIndexPtr()[i + 1]; ++k) {
+				if (pattern.innerIndexPtr()[k] != i)
+					links_.push_back(pattern.innerIndexPtr()[k]);
+			}
+			link_offset_[i + 1] = links_.size();
 		}
-	}
-	for (auto it = E_begin; it != E_end; ++it) {
-		auto& info = *it;
-		int v0 = info.first;
-		int v1 = info.second;
-
-		double reg = regular * 2e-2 / ((V[v0] - V[v1]).norm() + 1e-8);
-		reg *= reg;
-		add_entry_A(v0, v0, reg);
-		add_entry_A(v0, v1, -reg);
-		add_entry_A(v1, v0, -reg);
-		add_entry_A(v1, v1, reg);
-		add_entry_B(v0, reg * (V[v0] - V[v1]));
-		add_entry_B(v1, reg * (V[v1] - V[v0]));
-	}
 
-	SpMat A(num_entries, num_entries);
-	std::vector<T> tripletList;
-	for (auto& m : trips) {
-		tripletList.push_back(T(m.first / num_entries,
-			m.first % num_entries, m.second));
+		for (int i = 0; i < num_V; ++i)
+			base_values_[assembly.Offset(i, i)] += 1;
+
+		// reg = 2e-2 / length * rigidity, added in both directions
+		for (int i = 0; i < F.size(); ++i) {
+			for (int j = 0; j < 3; ++j) {
+				int v1 = F[i][j];
+				int v2 = F[i][(j + 1) % 3];
+				double reg = 2e-2 / (V[v2] - V[v1]).norm();
+				edges_.push_back(std::make_pair(v1, v2));
+				edge_weight_.push_back(reg);
+				assembly.AddLaplacian(v1, v2, reg, edge_values_.data());
+				assembly.AddLaplacian(v2, v1, reg, edge_values_.data());
+			}
+		}
 	}
-	A.setFromTriplets(tripletList.begin(), tripletList.end());
 
-	Eigen::SimplicialLDLT<Eigen::SparseMatrix<FT>> solver;
-    solver.analyzePattern(A);
-
-    solver.factorize(A);
-
-    //std::vector<Vector3> NV(V.size());
-    for (int j = 0; j < 3; ++j) {
-        VectorX result = solver.solve(B.col(j));
+	A_ = assembly.Matrix();
+	solver_.analyzePattern(A_);
+	Factorize();
+}
 
-        for (int i = 0; i < result.rows(); ++i) {
-        	V[i][j] = result[i];
-        }
-    }
+void LinearSolver::SetRigidity(double rigidity) {
+	rigidity_ = rigidity;
+	Factorize();
 }
 
-void LinearEstimationWithRot(double* V, int* F, double* TV,
-	int num_V, int num_F, double rigidity) {
-	std::vector<int> E(num_F * 6);
-	int num_E = 0;
-	for (int i = 0; i < num_F; ++i) {
-		for (int j = 0; j < 3; ++j) {
-			E[num_E++] = F[i * 3 + j];
-			E[num_E++] = F[i * 3 + (j + 1) % 3];
-		}
-	}
-	num_E /= 2;
-	std::vector<std::set<int> > links(num_V);
-	std::vector<Eigen::Matrix3d> rotations(num_V);
-	std::vector<double> scales(num_V);
-
-	for (int i = 0; i < num_E; ++i) {
-		int v1 = E[i * 2];
-		int v2 = E[i * 2 + 1];
-		links[v1].insert(v2);
-		links[v2].insert(v1);
-	}
+void LinearSolver::Factorize() {
+	FT s = with_rot_ ? rigidity_ : rigidity_ * rigidity_;
+	Eigen::Map<VectorX>(A_.valuePtr(), A_.nonZeros()) =
+		base_values_ + s * edge_values_;
+	solver_.factorize(A_);
+}
 
-	for (int i = 0; i < num_V; ++i) {
+void LinearSolver::FitRotations(const std::vector<Vector3>& current,
+	std::vector<Eigen::Matrix3d>* rotations, std::vector<FT>* scales,
+	int num_threads) const {
+	int num_V = rest_.size();
+	rotations->resize(num_V);
+	scales->resize(num_V);
+	ParallelFor(0, num_V, [&](int i) {
 		Eigen::Matrix3d covariance = Eigen::Matrix3d::Zero();
-
-		double* current_v = V + i * 3;
-		double* current_tv = TV + i * 3;
-
 		double len_origin = 0, len_current = 0;
-		for (auto& p : links[i]) {
-			double* next_v = V + p * 3;
-			double* next_tv = TV + p * 3;
-
-			Eigen::Vector3d d1(next_v[0] - current_v[0],
-				next_v[1] - current_v[1],
-				next_v[2] - current_v[2]);
-			Eigen::Vector3d d2(next_tv[0] - current_tv[0],
-				next_tv[1] - current_tv[1],
-				next_tv[2] - current_tv[2]);
-
+		for (int k = link_offset_[i]; k < link_offset_[i + 1]; ++k) {
+			int p = links_[k];
+			Vector3 d1 = rest_[p] - rest_[i];
+			Vector3 d2 = current[p] - current[i];
 			len_origin += d1.norm();
 			len_current += d2.norm();
 			covariance += d2 * d1.transpose();
 		}
-		double scale = len_current / (len_origin + 1e-8);
-		Eigen::JacobiSVD<Eigen::MatrixXd> svd(covariance,
-			Eigen::ComputeThinU | Eigen::ComputeThinV);
-		Eigen::Matrix3d U = svd.matrixU();
-		Eigen::Matrix3d VT = svd.matrixV().transpose();
-		Eigen::Matrix3d R = U * VT;
-		rotations[i] = R;
-		scales[i] = scale;
-	}
-
-	std::unordered_map<long long, FT> trips;
-	
-	int num_entries = num_V;
-	Eigen::MatrixXd B = Eigen::MatrixXd::Zero(num_entries, 3);
-	auto add_entry_A = [&](int x, int y, FT w) {
-		long long key = (long long)x * (long long)num_entries + (long long)y;
-		auto it = trips.find(key);
-		if (it == trips.end())
-			trips[key] = w;
-		else
-			it->second += w;
-	};
-	auto add_entry_B = [&](int m, const Eigen::Vector3d& v) {
-		B.row(m) += v;
-	};
+		(*scales)[i] = len_current / (len_origin + 1e-8);
+		Eigen::JacobiSVD<Eigen::Matrix3d> svd(covariance,
+			Eigen::ComputeFullU | Eigen::ComputeFullV);
+		(*rotations)[i] = svd.matrixU() * svd.matrixV().transpose();
+	}, num_threads);
+}
 
-	for (int i = 0; i < num_V; ++i) {
-		add_entry_A(i, i, 1);
-		add_entry_B(i, Eigen::Vector3d(TV[i * 3],
-			TV[i * 3 + 1], TV[i * 3 + 2]));
-	}
+void LinearSolver::Solve(const std::vector<Vector3>& targets,
+	std::vector<Vector3>* V, int iterations, int num_threads) const {
+	int num_V = rest_.size();
+	MatrixX B = MatrixX::Zero(num_V, 3);
 
-	double regulation = 1.0;
-	for (int i = 0; i < num_E; ++i) {
-		for (int j = 0; j < 2; ++j) {
-			int v0 = E[i * 2 + j];
-			int v1 = E[i * 2 + 1 - j];
-			double* V0 = V + v0 * 3;
-			double* V1 = V + v1 * 3;
-			Eigen::Vector3d off1(V1[0] - V0[0], V1[1] - V0[1], V1[2] - V0[2]);
-			double reg = regulation * 2e-2 / off1.norm() * rigidity;
-			off1 = scales[v0] * rotations[v0] * off1;
-			add_entry_A(v0, v0, reg);
-			add_entry_A(v0, v1, -reg);
-			add_entry_A(v1, v0, -reg);
-			add_entry_A(v1, v1, reg);
-			add_entry_B(v0, -reg * off1);
-			add_entry_B(v1, reg * off1);			
+	if (!with_rot_) {
+		for (int i = 0; i < num_V; ++i) {
+			int r = references_[i];
+			B.row(i) += cell_weight_[r] * targets[r];
+			B.row(i) += 1e-6 * targets[r];
 		}
+		B += (rigidity_ * rigidity_) * edge_rhs_;
+		iterations = 1;
 	}
+	iterations = std::max(iterations, 1);
+
+	std::vector<Eigen::Matrix3d> rotations;
+	std::vector<FT> scales;
+	for (int iter = 0; iter < iterations; ++iter) {
+		if (with_rot_) {
+			FitRotations(iter == 0 ? targets : *V, &rotations, &scales,
+				num_threads);
+			for (int i = 0; i < num_V; ++i)
+				B.row(i) = targets[i];
+			for (int i = 0; i < edges_.size(); ++i) {
+				for (int j = 0; j < 2; ++j) {
+					int v0 = j == 0 ? edges_[i].first : edges_[i].second;
+					int v1 = j == 0 ? edges_[i].second : edges_[i].first;
+					double reg = edge_weight_[i] * rigidity_;
+					Vector3 off1 = scales[v0] * rotations[v0]
+						* (rest_[v1] - rest_[v0]);
+					B.row(v0) -= reg * off1;
+					B.row(v1) += reg * off1;
+				}
+			}
+		}
 
-	typedef Eigen::Triplet<double> T;
-	Eigen::SparseMatrix<double> A(num_entries, num_entries);
-	std::vector<T> tripletList;
-	for (auto& m : trips) {
-		tripletList.push_back(T(m.first / num_entries,
-			m.first % num_entries, m.second));
+		V->resize(num_V);
+		for (int j = 0; j < 3; ++j) {
+			VectorX result = solver_.solve(B.col(j));
+			for (int i = 0; i < num_V; ++i)
+				(*V)[i][j] = result[i];
+		}
 	}
-	A.setFromTriplets(tripletList.begin(), tripletList.end());
-
-	Eigen::SimplicialLDLT<Eigen::SparseMatrix<double>> solver;
-    solver.analyzePattern(A);
-
-    solver.factorize(A);
+}
 
-    for (int j = 0; j < 3; ++j) {
-        Eigen::VectorXd result = solver.solve(B.col(j));
+template<class Iter>
+void LinearEstimation(std::vector<Vector3>& V,
+	const std::vector<Eigen::Vector3i>& F,
+	const Iter& E_begin, const Iter& E_end,
+	const std::vector<int>& references,
+	const std::vector<Vector3>& graphV,
+	double rigidity)
+{
+	std::vector<std::pair<int, int> > E(E_begin, E_end);
+	LinearSolver solver(V, F, E, references, rigidity, false);
+	solver.Solve(graphV, &V);
+}
 
-        for (int i = 0; i < result.rows(); ++i) {
-        	V[i * 3 + j] = result[i];
-        }
-    }	
+void LinearEstimationWithRot(double* V, int* F, double* TV,
+	int num_V, int num_F, double rigidity, int iterations,
+	int num_threads) {
+	std::vector<Vector3> rest(num_V), targets(num_V);
+	for (int i = 0; i < num_V; ++i) {
+		rest[i] = Vector3(V[i * 3], V[i * 3 + 1], V[i * 3 + 2]);
+		targets[i] = Vector3(TV[i * 3], TV[i * 3 + 1], TV[i * 3 + 2]);
+	}
+	std::vector<Eigen::Vector3i> faces(num_F);
+	for (int i = 0; i < num_F; ++i)
+		faces[i] = Eigen::Vector3i(F[i * 3], F[i * 3 + 1], F[i * 3 + 2]);
+
+	LinearSolver solver(rest, faces, std::vector<std::pair<int, int> >(),
+		std::vector<int>(), rigidity, true);
+	std::vector<Vector3> result;
+	solver.Solve(targets, &result, iterations, num_threads);
+	for (int i = 0; i < num_V; ++i) {
+		for (int j = 0; j < 3; ++j)
+			V[i * 3 + j] = result[i][j];
+	}
 }
 
 typedef std::set<std::pair<int,int> >::iterator SIter;
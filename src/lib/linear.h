@@ -1,8 +1,82 @@
 #ifndef SHAPEDEFORM_LINEAR_H_
 #define SHAPEDEFORM_LINEAR_H_
 
+#include <vector>
+
+#include <Eigen/Dense>
+#include <Eigen/Sparse>
+
 #include "types.h"
 
+// The sparse system behind LinearEstimation (with_rot = false) and
+// LinearEstimationWithRot (with_rot = true) for fixed rest positions V and
+// connectivity, assembled and factorized once. The matrix does not depend
+// on the targets, so Solve only builds the right-hand side and
+// back-substitutes; SetRigidity refactorizes the values on the same
+// symbolic analysis.
+class LinearSolver
+{
+public:
+	// E and references are only used without rotations, as in
+	// LinearEstimation.
+	LinearSolver(const std::vector<Vector3>& V,
+		const std::vector<Eigen::Vector3i>& F,
+		const std::vector<std::pair<int, int> >& E,
+		const std::vector<int>& references,
+		double rigidity, bool with_rot);
+
+	void SetRigidity(double rigidity);
+	double Rigidity() const { return rigidity_; }
+	bool WithRot() const { return with_rot_; }
+	int NumVertices() const { return rest_.size(); }
+	// Number of graph vertices the references point into.
+	int NumTargets() const {
+		return with_rot_ ? rest_.size() : cell_weight_.size();
+	}
+
+	// Deformed positions for the graph vertices (without rotations) or the
+	// per-vertex target positions (with rotations) in targets. With
+	// rotations, each of the ARAP iterations fits the rotation and scale of
+	// every one-ring, to the targets first and then to the previous result,
+	// on num_threads threads (all hardware threads if <= 0), and solves on
+	// the same factorization. iterations is ignored without rotations.
+	void Solve(const std::vector<Vector3>& targets,
+		std::vector<Vector3>* V, int iterations = 1,
+		int num_threads = 0) const;
+
+private:
+	void Factorize();
+
+	// The rotation and scale best aligning each rest one-ring to current.
+	void FitRotations(const std::vector<Vector3>& current,
+		std::vector<Eigen::Matrix3d>* rotations,
+		std::vector<FT>* scales, int num_threads) const;
+
+	bool with_rot_;
+	double rigidity_;
+	std::vector<Vector3> rest_;
+
+	// A = base + s * edge with s = rigidity^2 without rotations and
+	// rigidity with them; all three share the sparsity pattern of A_.
+	SpMat A_;
+	VectorX base_values_;
+	VectorX edge_values_;
+	Eigen::SimplicialLDLT<SpMat> solver_;
+
+	// without rotations: the rest edge terms of the right-hand side,
+	// scaled by s, and the weight of each graph vertex on its vertices
+	MatrixX edge_rhs_;
+	std::vector<int> references_;
+	std::vector<FT> cell_weight_;
+
+	// with rotations: directed face edges with their weights, and the
+	// neighbors of vertex i in links_[link_offset_[i] .. link_offset_[i + 1])
+	std::vector<std::pair<int, int> > edges_;
+	std::vector<FT> edge_weight_;
+	std::vector<int> link_offset_;
+	std::vector<int> links_;
+};
+
 template<class Iter>
 void LinearEstimation(std::vector<Vector3>& V,
 	const std::vector<Eigen::Vector3i>& F,
@@ -12,6 +86,7 @@ void LinearEstimation(std::vector<Vector3>& V,
 	double rigidity = 2.0);
 
 void LinearEstimationWithRot(double* V, int* F, double* TV,
-	int num_V, int num_F, double rigidity);
+	int num_V, int num_F, double rigidity, int iterations = 1,
+	int num_threads = 0);
 
 #endif
\ No newline at end of file
@@ -1,66 +1,180 @@
 #include "mesh.h"
 
+#include <cmath>
+#include <cstdio>
+#include <cstdlib>
+#include <cstring>
 #include <fstream>
-#include <strstream>
+#include <iterator>
 #include <set>
+#include <string>
 
 #include <igl/copyleft/marching_cubes.h>
 #include <igl/point_mesh_squared_distance.h>
 
+#include "parallel.h"
+
 Mesh::Mesh()
 	: scale_(1.0), pos_(0, 0, 0)
 {}
 
-void Mesh::ReadOBJ(const char* filename) {
-	auto& V = V_;
-	auto& F = F_;
-	std::ifstream is(filename);
-	char buffer[256];
-	while (is.getline(buffer, 256)) {
-		std::strstream str;
-		str << buffer;
-		str >> buffer;
-		if (strcmp(buffer, "v") == 0) {
-			FT x, y, z;
-			str >> x >> y >> z;
-			V.push_back(Vector3(x, y, z));
+// Lines of one chunk of an OBJ file. Face corners keep their raw
+// (1-based or negative) indices until every chunk knows how many vertices
+// precede it, so chunks can be parsed independently.
+struct ObjChunk {
+	std::vector<Vector3> vertices;
+	// corners of face i are corners[face_offset[i] .. face_offset[i + 1])
+	std::vector<int> corners;
+	std::vector<int> face_offset;
+	// vertices of this chunk read before face i
+	std::vector<int> face_vertex_count;
+};
+
+static const char* SkipSpace(const char* p, const char* end) {
+	while (p < end && (*p == ' ' || *p == '\t' || *p == '\r'))
+		++p;
+	return p;
+}
+
+static void ParseOBJChunk(const char* p, const char* end, ObjChunk* chunk) {
+	chunk->face_offset.push_back(0);
+	while (p < end) {
+		const char* eol = (const char*)memchr(p, '\n', end - p);
+		if (!eol)
+			eol = end;
+		p = SkipSpace(p, eol);
+		if (eol - p > 1 && p[0] == 'v' && (p[1] == ' ' || p[1] == '\t')) {
+			// v x y z [w]; a short line is dropped instead of reading into
+			// the next one
+			FT c[3];
+			const char* q = p + 2;
+			int j = 0;
+			for (; j < 3; ++j) {
+				char* next;
+				c[j] = strtod(q, &next);
+				if (next == q || next > eol)
+					break;
+				q = next;
+			}
+			if (j == 3)
+				chunk->vertices.push_back(Vector3(c[0], c[1], c[2]));
 		}
-		else if (strcmp(buffer, "f") == 0) {
-			Eigen::Vector3i f;
-			for (int j = 0; j < 3; ++j) {
-				str >> buffer;
-				int id = 0;
-				int p = 0;
-				int l = strlen(buffer);
-				while (p < l && buffer[p] != '/') {
-					id = id * 10 + (buffer[p] - '0');
-					p += 1;
-				}
-				f[j] = id - 1;
+		else if (eol - p > 1 && p[0] == 'f' && (p[1] == ' ' || p[1] == '\t')) {
+			// f i i/t i/t/n i//n ...: only the vertex index is used, and
+			// polygons are triangulated as a fan around the first corner
+			const char* q = p + 2;
+			int num_corners = 0;
+			while (true) {
+				q = SkipSpace(q, eol);
+				if (q >= eol)
+					break;
+				char* next;
+				long id = strtol(q, &next, 10);
+				if (next == q)
+					break;
+				chunk->corners.push_back(id);
+				num_corners += 1;
+				q = next;
+				while (q < eol && *q != ' ' && *q != '\t' && *q != '\r')
+					++q;
+			}
+			if (num_corners >= 3) {
+				chunk->face_offset.push_back(chunk->corners.size());
+				chunk->face_vertex_count.push_back(chunk->vertices.size());
+			} else {
+				chunk->corners.resize(chunk->corners.size() - num_corners);
 			}
-			F.push_back(f);
 		}
+		p = eol + 1;
 	}
 }
 
-void Mesh::WriteOBJ(const char* filename, bool normalized) {
+void Mesh::ReadOBJ(const char* filename) {
 	auto& V = V_;
 	auto& F = F_;
-	std::ofstream os(filename);
-	for (int i = 0; i < V.size(); ++i) {
-		Vector3 v;
-		if (!normalized)
-			v = V[i] * scale_ + pos_;
-		else
-			v = V[i];
-		os << "v " << v[0] << " " << v[1] << " " << v[2] << "\n";
+	std::ifstream is(filename, std::ios::binary);
+	if (!is)
+		return;
+	std::string text((std::istreambuf_iterator<char>(is)),
+		std::istreambuf_iterator<char>());
+	const char* data = text.data();
+	long long length = text.size();
+
+	// chunks of at least 1MB, split at line ends
+	const long long kMinChunk = 1 << 20;
+	int num_chunks = std::max(1LL, std::min<long long>(NumThreads(0) * 4,
+		length / kMinChunk));
+	std::vector<long long> bounds(num_chunks + 1, length);
+	bounds[0] = 0;
+	for (int i = 1; i < num_chunks; ++i) {
+		long long b = std::max(bounds[i - 1], length * i / num_chunks);
+		const char* eol = (const char*)memchr(data + b, '\n', length - b);
+		bounds[i] = eol ? eol - data + 1 : length;
 	}
-	for (int i = 0; i < F.size(); ++i) {
-		os << "f " << F[i][0] + 1 << " "
-		   << F[i][1] + 1 << " "
-		   << F[i][2] + 1 << "\n";
+
+	std::vector<ObjChunk> chunks(num_chunks);
+	ParallelFor(0, num_chunks, [&](int i) {
+		ParseOBJChunk(data + bounds[i], data + bounds[i + 1], &chunks[i]);
+	});
+
+	int vertex_base = V.size();
+	for (auto& chunk : chunks) {
+		int chunk_base = V.size();
+		V.insert(V.end(), chunk.vertices.begin(), chunk.vertices.end());
+		for (int i = 0; i + 1 < (int)chunk.face_offset.size(); ++i) {
+			int num_read = chunk_base + chunk.face_vertex_count[i] - vertex_base;
+			auto corner = [&](int j) {
+				int id = chunk.corners[chunk.face_offset[i] + j];
+				return id > 0 ? vertex_base + id - 1 : vertex_base + num_read + id;
+			};
+			int num_corners = chunk.face_offset[i + 1] - chunk.face_offset[i];
+			for (int j = 1; j + 1 < num_corners; ++j)
+				F.push_back(Eigen::Vector3i(corner(0), corner(j), corner(j + 1)));
+		}
 	}
-	os.close();
+}
+
+void Mesh::WriteOBJ(const char* filename, bool normalized) {
+	auto& V = V_;
+	auto& F = F_;
+	FILE* fp = fopen(filename, "wb");
+	if (!fp)
+		return;
+
+	// lines are formatted into one buffer per block in parallel, with
+	// the same %g formatting as ostream <<, then written in order
+	const int kBlockLines = 1 << 16;
+	int num_v_blocks = (V.size() + kBlockLines - 1) / kBlockLines;
+	int num_f_blocks = (F.size() + kBlockLines - 1) / kBlockLines;
+	std::vector<std::string> blocks(num_v_blocks + num_f_blocks);
+	ParallelFor(0, blocks.size(), [&](int b) {
+		std::string& out = blocks[b];
+		char line[128];
+		if (b < num_v_blocks) {
+			int end = std::min<int>(V.size(), (b + 1) * kBlockLines);
+			for (int i = b * kBlockLines; i < end; ++i) {
+				Vector3 v;
+				if (!normalized)
+					v = V[i] * scale_ + pos_;
+				else
+					v = V[i];
+				int n = snprintf(line, sizeof(line), "v %g %g %g\n",
+					v[0], v[1], v[2]);
+				out.append(line, n);
+			}
+		} else {
+			b -= num_v_blocks;
+			int end = std::min<int>(F.size(), (b + 1) * kBlockLines);
+			for (int i = b * kBlockLines; i < end; ++i) {
+				int n = snprintf(line, sizeof(line), "f %d %d %d\n",
+					F[i][0] + 1, F[i][1] + 1, F[i][2] + 1);
+				out.append(line, n);
+			}
+		}
+	});
+	for (auto& block : blocks)
+		fwrite(block.data(), 1, block.size(), fp);
+	fclose(fp);
 }
 
 void Mesh::Normalize() {
@@ -103,22 +217,120 @@ void Mesh::ApplyTransform(const Mesh& m) {
 		v = (v - pos_) / scale_;
 	}
 }
-void Mesh::ConstructDistanceField(UniformGrid& grid) {
+
+// Splits the triangle until its bounding box is at most max_extent wide and
+// calls func(min_p, max_p) on the box of every piece, so that large faces
+// are not handled through their whole bounding box.
+template <class Func>
+static void ForEachTrianglePiece(const Vector3& a, const Vector3& b,
+	const Vector3& c, FT max_extent, const Func& func) {
+	Vector3 min_p = a.cwiseMin(b).cwiseMin(c);
+	Vector3 max_p = a.cwiseMax(b).cwiseMax(c);
+	if ((max_p - min_p).maxCoeff() <= max_extent) {
+		func(min_p, max_p);
+		return;
+	}
+	Vector3 ab = (a + b) * 0.5, bc = (b + c) * 0.5, ca = (c + a) * 0.5;
+	ForEachTrianglePiece(a, ab, ca, max_extent, func);
+	ForEachTrianglePiece(ab, b, bc, max_extent, func);
+	ForEachTrianglePiece(ca, bc, c, max_extent, func);
+	ForEachTrianglePiece(ab, bc, ca, max_extent, func);
+}
+
+static FT PointSegmentSquaredDistance(const Vector3& p, const Vector3& a,
+	const Vector3& b) {
+	Vector3 ab = b - a;
+	FT len2 = ab.squaredNorm();
+	FT t = (len2 > 0) ? (p - a).dot(ab) / len2 : 0;
+	t = std::max((FT)0, std::min((FT)1, t));
+	return (p - a - ab * t).squaredNorm();
+}
+
+// Closest point region test from Ericson, Real-Time Collision Detection.
+static FT PointTriangleSquaredDistance(const Vector3& p, const Vector3& a,
+	const Vector3& b, const Vector3& c) {
+	Vector3 ab = b - a, ac = c - a, ap = p - a;
+	FT d1 = ab.dot(ap), d2 = ac.dot(ap);
+	if (d1 <= 0 && d2 <= 0)
+		return ap.squaredNorm();
+
+	Vector3 bp = p - b;
+	FT d3 = ab.dot(bp), d4 = ac.dot(bp);
+	if (d3 >= 0 && d4 <= d3)
+		return bp.squaredNorm();
+
+	FT vc = d1 * d4 - d3 * d2;
+	if (vc <= 0 && d1 >= 0 && d3 <= 0)
+		return PointSegmentSquaredDistance(p, a, b);
+
+	Vector3 cp = p - c;
+	FT d5 = ab.dot(cp), d6 = ac.dot(cp);
+	if (d6 >= 0 && d5 <= d6)
+		return cp.squaredNorm();
+
+	FT vb = d5 * d2 - d1 * d6;
+	if (vb <= 0 && d2 >= 0 && d6 <= 0)
+		return PointSegmentSquaredDistance(p, a, c);
+
+	FT va = d3 * d6 - d5 * d4;
+	if (va <= 0 && d4 - d3 >= 0 && d5 - d6 >= 0)
+		return PointSegmentSquaredDistance(p, b, c);
+
+	FT denom = va + vb + vc;
+	if (denom <= 0) {
+		return std::min(PointSegmentSquaredDistance(p, a, b),
+			std::min(PointSegmentSquaredDistance(p, b, c),
+				PointSegmentSquaredDistance(p, c, a)));
+	}
+	FT v = vb / denom;
+	FT w = vc / denom;
+	return (ap - ab * v - ac * w).squaredNorm();
+}
+
+void Mesh::ConstructDistanceField(UniformGrid& grid, int method,
+	int num_threads) {
 	auto& V = V_;
 	auto& F = F_;
 	int grid_n = grid.Dimension();
-	MatrixX P(grid_n * grid_n * grid_n, 3);
-	int offset = 0;
+
+	// a narrow-band grid only stores (and needs) bricks near the faces
+	if (grid.IsSparse()) {
+		FT brick = FT(UniformGrid::kBlockSize) / grid_n;
+		for (int i = 0; i < F.size(); ++i) {
+			ForEachTrianglePiece(V[F[i][0]], V[F[i][1]], V[F[i][2]], brick,
+				[&](const Vector3& min_p, const Vector3& max_p) {
+					grid.AllocateBand(min_p, max_p);
+				});
+		}
+	}
+
+	if (method == JUMP_FLOODING)
+		ConstructDistanceFieldJumpFlooding(grid, num_threads);
+	else
+		ConstructDistanceFieldAABB(grid);
+}
+
+void Mesh::ConstructDistanceFieldAABB(UniformGrid& grid) {
+	auto& V = V_;
+	auto& F = F_;
+	int grid_n = grid.Dimension();
+
+	std::vector<Eigen::Vector3i> voxels;
 	for (int i = 0; i < grid_n; ++i) {
 		for (int j = 0; j < grid_n; ++j) {
 			for (int k = 0; k < grid_n; ++k) {
-				P.row(offset) = Vector3(FT(k) / grid_n,
-					FT(j) / grid_n, FT(i) / grid_n);
-				offset += 1;
+				if (grid.HasVoxel(i, j, k))
+					voxels.push_back(Eigen::Vector3i(i, j, k));
 			}
 		}
 	}
 
+	MatrixX P(voxels.size(), 3);
+	for (int i = 0; i < voxels.size(); ++i) {
+		P.row(i) = Vector3(FT(voxels[i][2]) / grid_n,
+			FT(voxels[i][1]) / grid_n, FT(voxels[i][0]) / grid_n);
+	}
+
 	MatrixX V2(V.size(), 3);
 	for (int i = 0; i < V.size(); ++i)
 		V2.row(i) = V[i];
@@ -139,16 +351,158 @@ void Mesh::ConstructDistanceField(UniformGrid& grid) {
 	MatrixX C;
 	igl::point_mesh_squared_distance(P,V2,F2,sqrD,I,C);
 
-	offset = 0;
-	for (int i = 0; i < grid_n; ++i) {
-		for (int j = 0; j < grid_n; ++j) {
-			for (int k = 0; k < grid_n; ++k) {
-				grid.SetDistance(i, j, k, sqrt(sqrD[offset]));
-				offset += 1;
+	for (int i = 0; i < voxels.size(); ++i) {
+		grid.SetDistance(voxels[i][0], voxels[i][1], voxels[i][2],
+			sqrt(sqrD[i]));
+	}
+}
+
+void Mesh::ConstructDistanceFieldJumpFlooding(UniformGrid& grid,
+	int num_threads) {
+	auto& V = V_;
+	auto& F = F_;
+	int grid_n = grid.Dimension();
+	// scratch lives only for the voxels the grid stores, in its layout;
+	// on a narrow-band grid the flood stays inside the allocated bricks
+	long long num_voxels = grid.NumStoredVoxels();
+	bool sparse = grid.IsSparse();
+	int skip = sparse ? UniformGrid::kBlockSize : 1;
+	const UniformGrid& storage = grid;
+	auto index = [=, &storage](int i, int j, int k) {
+		return sparse ? storage.StorageIndex(i, j, k)
+			: ((long long)i * grid_n + j) * grid_n + k;
+	};
+
+	auto face_distance = [&](int i, int j, int k, int f) {
+		Vector3 p(FT(k) / grid_n, FT(j) / grid_n, FT(i) / grid_n);
+		return PointTriangleSquaredDistance(p,
+			V[F[f][0]], V[F[f][1]], V[F[f][2]]);
+	};
+	// calls func(k, id) for the stored voxels of row (i, j), skipping
+	// bricks without storage as a whole
+	auto for_each_in_row = [&](int i, int j, auto func) {
+		for (int k = 0; k < grid_n; ) {
+			long long id = index(i, j, k);
+			if (id < 0) {
+				k += skip - k % skip;
+				continue;
 			}
+			func(k, id);
+			k += 1;
 		}
+	};
+
+	// closest face found so far for every voxel, and its squared distance
+	std::vector<int> seed(num_voxels, -1), next_seed(num_voxels);
+	std::vector<float> dist(num_voxels, 1e30f), next_dist(num_voxels);
+
+	// Every voxel within one voxel of a face lies in the box of one of its
+	// pieces grown by a voxel, so the shell is exact. Pieces are bucketed
+	// by slice so that each thread owns the voxels it writes.
+	struct FacePiece {
+		int face;
+		int j0, j1, k0, k1;
+	};
+	std::vector<std::vector<FacePiece> > slice_pieces(grid_n);
+	for (int f = 0; f < F.size(); ++f) {
+		ForEachTrianglePiece(V[F[f][0]], V[F[f][1]], V[F[f][2]],
+			FT(2) / grid_n,
+			[&](const Vector3& min_p, const Vector3& max_p) {
+				Eigen::Vector3i lo, hi;
+				for (int d = 0; d < 3; ++d) {
+					lo[2 - d] = std::max(0,
+						(int)std::floor(min_p[d] * grid_n) - 1);
+					hi[2 - d] = std::min(grid_n - 1,
+						(int)std::ceil(max_p[d] * grid_n) + 1);
+				}
+				FacePiece piece = {f, lo[1], hi[1], lo[2], hi[2]};
+				for (int i = lo[0]; i <= hi[0]; ++i)
+					slice_pieces[i].push_back(piece);
+			});
 	}
 
+	ParallelFor(0, grid_n, [&](int i) {
+		for (auto& piece : slice_pieces[i]) {
+			int f = piece.face;
+			for (int j = piece.j0; j <= piece.j1; ++j) {
+				for (int k = piece.k0; k <= piece.k1; ++k) {
+					long long id = index(i, j, k);
+					if (id < 0 || seed[id] == f)
+						continue;
+					float d = face_distance(i, j, k, f);
+					if (d < dist[id]) {
+						dist[id] = d;
+						seed[id] = f;
+					}
+				}
+			}
+		}
+	}, num_threads);
+
+	// jump flooding with steps n/2, n/4, ..., 1 and one extra unit step
+	std::vector<int> steps;
+	int step = 1;
+	while (step * 2 < grid_n)
+		step *= 2;
+	for (; step >= 1; step /= 2)
+		steps.push_back(step);
+	steps.push_back(1);
+
+	for (int s : steps) {
+		ParallelFor(0, grid_n, [&](int i) {
+			for (int j = 0; j < grid_n; ++j) {
+				for_each_in_row(i, j, [&](int k, long long id) {
+					int best = seed[id];
+					float best_dist = dist[id];
+					// neighbours mostly share seeds, skip repeated ones
+					int last = best;
+					for (int di = -s; di <= s; di += s) {
+						int ii = i + di;
+						if (ii < 0 || ii >= grid_n)
+							continue;
+						for (int dj = -s; dj <= s; dj += s) {
+							int jj = j + dj;
+							if (jj < 0 || jj >= grid_n)
+								continue;
+							for (int dk = -s; dk <= s; dk += s) {
+								int kk = k + dk;
+								if (kk < 0 || kk >= grid_n)
+									continue;
+								long long nid = index(ii, jj, kk);
+								if (nid < 0)
+									continue;
+								int f = seed[nid];
+								if (f < 0 || f == best || f == last)
+									continue;
+								last = f;
+								float d = face_distance(i, j, k, f);
+								if (d < best_dist) {
+									best_dist = d;
+									best = f;
+								}
+							}
+						}
+					}
+					next_seed[id] = best;
+					next_dist[id] = best_dist;
+				});
+			}
+		}, num_threads);
+		std::swap(seed, next_seed);
+		std::swap(dist, next_dist);
+	}
+
+	// recompute the final distances in full precision
+	FT* voxels = grid.MutableVoxels();
+	ParallelFor(0, grid_n, [&](int i) {
+		for (int j = 0; j < grid_n; ++j) {
+			for_each_in_row(i, j, [&](int k, long long id) {
+				int f = seed[id];
+				if (f >= 0)
+					voxels[id] = sqrt(face_distance(i, j, k, f));
+			});
+		}
+	}, num_threads);
 }
 
 void Mesh::FromDistanceField(UniformGrid& grid) {
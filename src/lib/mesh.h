@@ -20,7 +20,18 @@ public:
 	void ApplyTransform(const Mesh& m);
 
 	// Conversion between Distance Field
-	void ConstructDistanceField(UniformGrid& grid);
+	// AABB_DISTANCE queries the closest point of every voxel with igl.
+	// JUMP_FLOODING computes exact distances within one voxel of the faces
+	// and propagates the closest face outwards by jump flooding, which
+	// runs on num_threads threads (all hardware threads if <= 0). On a
+	// narrow-band grid it only visits, and keeps scratch for, the
+	// allocated bricks.
+	enum DistanceMethod {
+		AABB_DISTANCE = 0,
+		JUMP_FLOODING = 1
+	};
+	void ConstructDistanceField(UniformGrid& grid,
+		int method = AABB_DISTANCE, int num_threads = 0);
 	void FromDistanceField(UniformGrid& grid);
 
 	// Merge
@@ -51,6 +62,10 @@ public:
 	FT GetScale() const { return scale_; };
 
 private:
+	void ConstructDistanceFieldAABB(UniformGrid& grid);
+	void ConstructDistanceFieldJumpFlooding(UniformGrid& grid,
+		int num_threads);
+
 	std::vector<Vector3> V_;
 	std::vector<Eigen::Vector3i> F_;
 
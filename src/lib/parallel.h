@@ -0,0 +1,56 @@
+#ifndef SHAPEDEFORM_PARALLEL_H_
+#define SHAPEDEFORM_PARALLEL_H_
+
+#include <algorithm>
+#include <atomic>
+#include <thread>
+#include <vector>
+
+// Source of the thread count NumThreads uses for num_threads <= 0. The
+// Python module points it at the torch intra-op pool so that every loop
+// honours torch.set_num_threads; unset (or returning <= 0), all hardware
+// threads are used.
+typedef int (*DefaultNumThreadsFunc)();
+
+inline DefaultNumThreadsFunc& DefaultNumThreads() {
+	static DefaultNumThreadsFunc func = nullptr;
+	return func;
+}
+
+inline int NumThreads(int num_threads) {
+	if (num_threads > 0)
+		return num_threads;
+	if (DefaultNumThreads()) {
+		int threads = DefaultNumThreads()();
+		if (threads > 0)
+			return threads;
+	}
+	int hardware = std::thread::hardware_concurrency();
+	return hardware > 0 ? hardware : 1;
+}
+
+// Calls func(i) for every i in [begin, end) on up to num_threads threads
+// (all hardware threads if num_threads <= 0). Indices are handed out one
+// at a time, so uneven work per index is balanced across the threads.
+template <class Func>
+void ParallelFor(int begin, int end, const Func& func, int num_threads = 0) {
+	int threads = std::min(NumThreads(num_threads), end - begin);
+	if (threads <= 1) {
+		for (int i = begin; i < end; ++i)
+			func(i);
+		return;
+	}
+	std::atomic<int> next(begin);
+	auto worker = [&]() {
+		for (int i = next++; i < end; i = next++)
+			func(i);
+	};
+	std::vector<std::thread> pool;
+	for (int t = 1; t < threads; ++t)
+		pool.push_back(std::thread(worker));
+	worker();
+	for (auto& thread : pool)
+		thread.join();
+}
+
+#endif
@@ -0,0 +1,177 @@
+#include "point_index.h"
+
+#include <algorithm>
+#include <cmath>
+
+#include "parallel.h"
+
+constexpr FT PointIndex::kFarDistance;
+
+// Queries are handed to the threads in blocks of this size.
+static const int kQueryBlock = 256;
+
+PointIndex::PointIndex(FT max_displacement)
+: max_displacement_(max_displacement), displacement_(0), cell_size_(1),
+  min_(0, 0, 0), num_builds_(0), num_refits_(0)
+{
+	dims_[0] = dims_[1] = dims_[2] = 1;
+}
+
+template <class T>
+void PointIndex::Build(const T* points, int num_points) {
+	points_.resize(num_points);
+	for (int i = 0; i < num_points; ++i) {
+		points_[i] = Vector3(points[i * 3], points[i * 3 + 1],
+			points[i * 3 + 2]);
+	}
+	Rebuild();
+}
+
+template <class T>
+bool PointIndex::Refit(const T* points, int num_points) {
+	if (num_points != (int)points_.size()) {
+		Build(points, num_points);
+		return true;
+	}
+	FT limit = max_displacement_ > 0 ? max_displacement_ : cell_size_ * 0.5;
+	FT displacement = 0;
+	for (int i = 0; i < num_points; ++i) {
+		points_[i] = Vector3(points[i * 3], points[i * 3 + 1],
+			points[i * 3 + 2]);
+		displacement = std::max(displacement,
+			(points_[i] - built_points_[i]).squaredNorm());
+	}
+	displacement = std::sqrt(displacement);
+	if (displacement > limit) {
+		Rebuild();
+		return true;
+	}
+	displacement_ = displacement;
+	num_refits_ += 1;
+	return false;
+}
+
+void PointIndex::Rebuild() {
+	int num_points = points_.size();
+	built_points_ = points_;
+	displacement_ = 0;
+	num_builds_ += 1;
+
+	Vector3 max_corner(0, 0, 0);
+	min_ = Vector3(0, 0, 0);
+	if (num_points > 0) {
+		min_ = points_[0];
+		max_corner = points_[0];
+	}
+	for (auto& p : points_) {
+		min_ = min_.cwiseMin(p);
+		max_corner = max_corner.cwiseMax(p);
+	}
+	// About two points per cell if they filled the bounding box; flat
+	// extents are padded so the cells stay bounded in number.
+	Vector3 extent = max_corner - min_;
+	FT padding = std::max(extent.maxCoeff() * 1e-3, (FT)1e-9);
+	FT volume = 1;
+	for (int i = 0; i < 3; ++i)
+		volume *= std::max(extent[i], padding);
+	cell_size_ = std::cbrt(volume * 2 / std::max(num_points, 1));
+	for (int i = 0; i < 3; ++i)
+		dims_[i] = std::max(1, (int)std::ceil(extent[i] / cell_size_));
+
+	// Counting sort of the points by cell.
+	int num_cells = dims_[0] * dims_[1] * dims_[2];
+	std::vector<int> point_cell(num_points);
+	cell_offset_.assign(num_cells + 1, 0);
+	for (int i = 0; i < num_points; ++i) {
+		auto& p = points_[i];
+		int c = (Cell(p[2], 2) * dims_[1] + Cell(p[1], 1)) * dims_[0]
+			+ Cell(p[0], 0);
+		point_cell[i] = c;
+		cell_offset_[c + 1] += 1;
+	}
+	for (int c = 0; c < num_cells; ++c)
+		cell_offset_[c + 1] += cell_offset_[c];
+	cell_points_.resize(num_points);
+	std::vector<int> top(cell_offset_.begin(), cell_offset_.end() - 1);
+	for (int i = 0; i < num_points; ++i)
+		cell_points_[top[point_cell[i]]++] = i;
+}
+
+int PointIndex::NearestPoint(const Vector3& q, FT* squared_distance) const {
+	int best = -1;
+	FT best_distance = kFarDistance;
+	int center[3];
+	for (int i = 0; i < 3; ++i)
+		center[i] = Cell(q[i], i);
+	for (int ring = 0; ; ++ring) {
+		int lo[3], hi[3];
+		for (int i = 0; i < 3; ++i) {
+			lo[i] = std::max(center[i] - ring, 0);
+			hi[i] = std::min(center[i] + ring, dims_[i] - 1);
+		}
+		for (int z = lo[2]; z <= hi[2]; ++z) {
+			bool z_shell = std::abs(z - center[2]) == ring;
+			for (int y = lo[1]; y <= hi[1]; ++y) {
+				bool shell = z_shell || std::abs(y - center[1]) == ring;
+				// inside the shell only the two x ends are new
+				int step = shell ? 1 : std::max(hi[0] - lo[0], 1);
+				for (int x = lo[0]; x <= hi[0]; x += step) {
+					if (!shell && std::abs(x - center[0]) != ring)
+						continue;
+					int c = (z * dims_[1] + y) * dims_[0] + x;
+					for (int j = cell_offset_[c]; j < cell_offset_[c + 1]; ++j) {
+						int p = cell_points_[j];
+						FT d = (points_[p] - q).squaredNorm();
+						if (d < best_distance || (d == best_distance && p < best)) {
+							best_distance = d;
+							best = p;
+						}
+					}
+				}
+			}
+		}
+		// The cells not searched yet lie beyond the faces of the searched
+		// block, and their points at most displacement_ further in.
+		FT bound = kFarDistance;
+		for (int i = 0; i < 3; ++i) {
+			if (lo[i] > 0)
+				bound = std::min(bound, q[i] - (min_[i] + lo[i] * cell_size_));
+			if (hi[i] < dims_[i] - 1) {
+				bound = std::min(bound,
+					min_[i] + (hi[i] + 1) * cell_size_ - q[i]);
+			}
+		}
+		if (bound == kFarDistance)
+			break;
+		bound -= displacement_;
+		if (best >= 0 && bound > 0 && best_distance < bound * bound)
+			break;
+	}
+	*squared_distance = best_distance;
+	return best;
+}
+
+template <class T>
+void PointIndex::Query(const T* queries, int num_queries, int* indices,
+	T* distances, int num_threads) const {
+	int num_blocks = (num_queries + kQueryBlock - 1) / kQueryBlock;
+	ParallelFor(0, num_blocks, [&](int block) {
+		int end = std::min(num_queries, (block + 1) * kQueryBlock);
+		for (int i = block * kQueryBlock; i < end; ++i) {
+			Vector3 q(queries[i * 3], queries[i * 3 + 1], queries[i * 3 + 2]);
+			FT d;
+			indices[i] = NearestPoint(q, &d);
+			if (distances)
+				distances[i] = d;
+		}
+	}, num_threads);
+}
+
+template void PointIndex::Build<float>(const float*, int);
+template void PointIndex::Build<double>(const double*, int);
+template bool PointIndex::Refit<float>(const float*, int);
+template bool PointIndex::Refit<double>(const double*, int);
+template void PointIndex::Query<float>(const float*, int, int*, float*,
+	int) const;
+template void PointIndex::Query<double>(const double*, int, int*, double*,
+	int) const;
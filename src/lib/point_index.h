@@ -0,0 +1,67 @@
+#ifndef SHAPEDEFORM_POINT_INDEX_H_
+#define SHAPEDEFORM_POINT_INDEX_H_
+
+#include <vector>
+
+#include "types.h"
+
+// Exact nearest neighbor index over a moving point set. Points are bucketed
+// into a uniform grid over their bounding box, about two per cell. Refit
+// moves the points without rebucketing them as long as none has moved more
+// than max_displacement since the last build; queries then widen their
+// search by that displacement. Otherwise Refit rebuilds the grid.
+class PointIndex
+{
+public:
+	// max_displacement <= 0 means half a cell.
+	explicit PointIndex(FT max_displacement = 0);
+
+	template <class T>
+	void Build(const T* points, int num_points);
+
+	// Returns true if the grid had to be rebuilt.
+	template <class T>
+	bool Refit(const T* points, int num_points);
+
+	// Index of and squared distance to the nearest point of each query,
+	// on num_threads threads (all hardware threads if <= 0). -1 and
+	// kFarDistance if the index is empty.
+	template <class T>
+	void Query(const T* queries, int num_queries, int* indices, T* distances,
+		int num_threads = 0) const;
+
+	int NumPoints() const { return points_.size(); }
+	long long NumBuilds() const { return num_builds_; }
+	long long NumRefits() const { return num_refits_; }
+	FT CellSize() const { return cell_size_; }
+
+	static constexpr FT kFarDistance = 1e30;
+
+private:
+	void Rebuild();
+
+	int Cell(FT x, int axis) const {
+		int c = (x - min_[axis]) / cell_size_;
+		return c < 0 ? 0 : (c >= dims_[axis] ? dims_[axis] - 1 : c);
+	}
+
+	int NearestPoint(const Vector3& q, FT* squared_distance) const;
+
+	FT max_displacement_;
+	FT displacement_;
+	FT cell_size_;
+	Vector3 min_;
+	int dims_[3];
+
+	std::vector<Vector3> points_;
+	// positions the grid was built from
+	std::vector<Vector3> built_points_;
+	// points of cell c are cell_points_[cell_offset_[c] .. cell_offset_[c + 1])
+	std::vector<int> cell_offset_;
+	std::vector<int> cell_points_;
+
+	long long num_builds_;
+	long long num_refits_;
+};
+
+#endif
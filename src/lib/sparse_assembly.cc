@@ -0,0 +1,98 @@
+#include "sparse_assembly.h"
+
+#include <algorithm>
+#include <cassert>
+
+SparseAssembly::SparseAssembly(int n)
+: n_(n), A_(n, n)
+{
+	cols_.reserve(n);
+	rows_.reserve(n);
+	for (int i = 0; i < n; ++i) {
+		cols_.push_back(i);
+		rows_.push_back(i);
+	}
+}
+
+void SparseAssembly::AddEdge(int v0, int v1) {
+	cols_.push_back(v0);
+	rows_.push_back(v1);
+	cols_.push_back(v1);
+	rows_.push_back(v0);
+}
+
+void SparseAssembly::AddFaceEdges(const std::vector<Eigen::Vector3i>& F) {
+	cols_.reserve(cols_.size() + F.size() * 6);
+	rows_.reserve(rows_.size() + F.size() * 6);
+	for (auto& f : F) {
+		for (int j = 0; j < 3; ++j)
+			AddEdge(f[j], f[(j + 1) % 3]);
+	}
+}
+
+void SparseAssembly::AddClique(const std::vector<int>& indices) {
+	for (auto i : indices) {
+		for (auto j : indices) {
+			cols_.push_back(i);
+			rows_.push_back(j);
+		}
+	}
+}
+
+void SparseAssembly::Compress() {
+	// bucket the rows by column, then sort and deduplicate every column
+	std::vector<int> offset(n_ + 1, 0);
+	for (auto c : cols_)
+		offset[c + 1] += 1;
+	for (int i = 0; i < n_; ++i)
+		offset[i + 1] += offset[i];
+	std::vector<int> rows(rows_.size());
+	std::vector<int> fill(offset.begin(), offset.end() - 1);
+	for (int i = 0; i < cols_.size(); ++i)
+		rows[fill[cols_[i]]++] = rows_[i];
+
+	int* outer = A_.outerIndexPtr();
+	diagonal_.resize(n_);
+	int nnz = 0;
+	outer[0] = 0;
+	for (int i = 0; i < n_; ++i) {
+		auto begin = rows.begin() + offset[i];
+		auto end = rows.begin() + offset[i + 1];
+		std::sort(begin, end);
+		end = std::unique(begin, end);
+		diagonal_[i] = std::lower_bound(begin, end, i) - begin + nnz;
+		// columns only move towards the front, and not at all until a
+		// duplicate was dropped; std::copy needs them to move
+		auto first = rows.begin() + nnz;
+		if (first != begin)
+			std::copy(begin, end, first);
+		nnz += end - begin;
+		outer[i + 1] = nnz;
+	}
+
+	A_.resizeNonZeros(nnz);
+	std::copy(rows.begin(), rows.begin() + nnz, A_.innerIndexPtr());
+	std::fill(A_.valuePtr(), A_.valuePtr() + nnz, FT(0));
+
+	cols_.clear();
+	cols_.shrink_to_fit();
+	rows_.clear();
+	rows_.shrink_to_fit();
+}
+
+int SparseAssembly::Offset(int row, int col) const {
+	const int* inner = A_.innerIndexPtr();
+	const int* begin = inner + A_.outerIndexPtr()[col];
+	const int* end = inner + A_.outerIndexPtr()[col + 1];
+	const int* pos = std::lower_bound(begin, end, row);
+	// lower_bound lands on a neighbouring entry for one outside the pattern
+	assert(pos != end && *pos == row);
+	return pos - inner;
+}
+
+void SparseAssembly::AddLaplacian(int v0, int v1, FT w, FT* values) const {
+	values[diagonal_[v0]] += w;
+	values[Offset(v0, v1)] -= w;
+	values[Offset(v1, v0)] -= w;
+	values[diagonal_[v1]] += w;
+}
@@ -0,0 +1,60 @@
+#ifndef SHAPEDEFORM_SPARSE_ASSEMBLY_H_
+#define SHAPEDEFORM_SPARSE_ASSEMBLY_H_
+
+#include <vector>
+
+#include <Eigen/Sparse>
+
+#include "types.h"
+
+// The sparsity pattern of a symmetric n x n system, collected from the
+// couplings of its terms (the diagonal is always present) and compressed
+// once into a matrix of explicit zeros. Terms are then accumulated into
+// the value array of that matrix, or into any array of Matrix().nonZeros()
+// values sharing its pattern, at Offset(row, col) instead of through
+// triplets or a hash map.
+class SparseAssembly
+{
+public:
+	explicit SparseAssembly(int n);
+
+	// Couples v0 and v1 in both directions.
+	void AddEdge(int v0, int v1);
+	// Couples the vertices of every edge of F.
+	void AddFaceEdges(const std::vector<Eigen::Vector3i>& F);
+	// Couples every pair of indices, including each with itself.
+	void AddClique(const std::vector<int>& indices);
+
+	// Builds Matrix() from the couplings added so far; no coupling can be
+	// added afterwards.
+	void Compress();
+
+	// Position of (row, col) in the value array; the entry must be part
+	// of the pattern.
+	int Offset(int row, int col) const;
+
+	FT& Entry(int row, int col) {
+		return A_.valuePtr()[Offset(row, col)];
+	}
+
+	// Adds the Laplacian terms of edge (v0, v1) with weight w to values.
+	void AddLaplacian(int v0, int v1, FT w, FT* values) const;
+
+	void AddLaplacian(int v0, int v1, FT w) {
+		AddLaplacian(v0, v1, w, A_.valuePtr());
+	}
+
+	const SpMat& Matrix() const { return A_; }
+	SpMat& Matrix() { return A_; }
+
+private:
+	int n_;
+	// column and row of every coupling, with duplicates
+	std::vector<int> cols_;
+	std::vector<int> rows_;
+	SpMat A_;
+	// Offset(i, i) of every i
+	std::vector<int> diagonal_;
+};
+
+#endif
@@ -1,5 +1,6 @@
 #include "subdivision.h"
 
+#include <algorithm>
 #include <iostream>
 #include <fstream>
 #include <queue>
@@ -11,6 +12,7 @@
 
 #include "delaunay.h"
 #include "linear.h"
+#include "parallel.h"
 
 Subdivision::Subdivision()
 {
@@ -25,7 +27,8 @@ void Subdivision::ApplyTransform(const Mesh& mesh) {
 	}
 }
 
-void Subdivision::Subdivide(const Mesh& mesh, double len_thres)
+void Subdivision::Subdivide(const Mesh& mesh, double len_thres,
+	int num_threads)
 {
 	subdivide_mesh_ = mesh;
 
@@ -90,16 +93,26 @@ void Subdivision::Subdivide(const Mesh& mesh, double len_thres)
 
 	int v_num = V.size();
 	int vsize = 0x7fffffff;
+	int num_faces = faces_buffer.size();
+
+	// The interior points of a face only depend on its corners.
+	std::vector<std::vector<Vector3> > interior_points(num_faces);
+	ParallelFor(0, num_faces, [&](int i) {
+		InteriorPoints(V, faces_buffer[i], len_thres, &interior_points[i]);
+	}, num_threads);
 
+	// Number the new vertices in face order, the new boundary vertices of
+	// a face followed by its interior ones, like a serial pass would.
 	std::unordered_map<long long, std::vector<int> > edge_subdivision_indices;
-	for (int i = 0; i < faces_buffer.size(); ++i) {
-		long long hash[3];
+	std::vector<std::vector<int> > boundary_indices(num_faces * 3);
+	std::vector<int> first_interior(num_faces);
+	for (int i = 0; i < num_faces; ++i) {
 		for (int j = 0; j < 3; ++j) {
 			int v0 = faces_buffer[i][j];
 			int v1 = faces_buffer[i][(j + 1) % 3];
 			auto h = EdgeHash(v0, v1, vsize);
-			hash[j] = h;
-			if (edge_subdivision_indices.count(h) == 0) {
+			auto it = edge_subdivision_indices.find(h);
+			if (it == edge_subdivision_indices.end()) {
 				Vector3 diff = V[v1] - V[v0];
 				int num_splits = diff.norm() / len_thres + 1;
 				diff /= (FT)num_splits;
@@ -111,16 +124,27 @@ void Subdivision::Subdivide(const Mesh& mesh, double len_thres)
 					V.push_back(V[v0] + diff * j);
 				}
 				vindices.push_back(v1);
-				edge_subdivision_indices[h] = vindices;
+				it = edge_subdivision_indices.insert(
+					std::make_pair(h, vindices)).first;
 			}
+			boundary_indices[i * 3 + j] = it->second;
 		}
-		std::vector<int> boundary_indices[3];
-		for (int j = 0; j < 3; ++j) {
-			boundary_indices[j] = edge_subdivision_indices[hash[j]];
-		}
-		DelaunaySubdivision(boundary_indices, V, F, faces_buffer[i], len_thres);
+		first_interior[i] = V.size();
+		V.insert(V.end(), interior_points[i].begin(),
+			interior_points[i].end());
 	}
 
+	// Faces are triangulated independently into their own buffers, which
+	// are concatenated in face order.
+	std::vector<std::vector<Eigen::Vector3i> > face_buffers(num_faces);
+	ParallelFor(0, num_faces, [&](int i) {
+		DelaunaySubdivision(&boundary_indices[i * 3], V, faces_buffer[i],
+			first_interior[i], interior_points[i].size(), len_thres,
+			&face_buffers[i]);
+	}, num_threads);
+	for (auto& faces : face_buffers)
+		F.insert(F.end(), faces.begin(), faces.end());
+
 	internal_vertices_.resize(V.size(), 0);
 	for (int i = v_num; i < V.size(); ++i) {
 		if (!boundary_vertices.count(i))
@@ -128,42 +152,16 @@ void Subdivision::Subdivide(const Mesh& mesh, double len_thres)
 	}
 }
 
-void Subdivision::DelaunaySubdivision(
-	std::vector<int>* boundary_indices,
-	std::vector<Vector3>& V,
-	std::vector<Eigen::Vector3i>& F,
-	Eigen::Vector3i& face,
-	double len_thres) {
-
+// Normal and in-plane axes of a face.
+static void FaceFrame(const std::vector<Vector3>& V,
+	const Eigen::Vector3i& face,
+	Vector3* pn, Vector3* ptx, Vector3* pty) {
 	Eigen::Vector3d v0 = V[face[0]];
 	Eigen::Vector3d v1 = V[face[1]];
 	Eigen::Vector3d v2 = V[face[2]];
 
 	Eigen::Vector3d n = (v1 - v0).cross(v2 - v0);
 	n /= n.norm();
-	std::unordered_set<int> merged_indices;
-	std::unordered_map<int, Eigen::Vector3d> curved_point;
-	for (int i = 0; i < 3; ++i) {
-		Eigen::Vector3d x = V[face[i]];
-		Eigen::Vector3d y = V[face[(i+1)%3]];
-		Eigen::Vector3d dir = n.cross(y - x);
-		dir /= dir.norm();
-		Eigen::Vector3d c = (y + x) * 0.5 + 1e3 * dir;
-		double len = (c - x).norm();
-		for (auto& p : boundary_indices[i]) {
-			merged_indices.insert(p);
-			Eigen::Vector3d diff = V[p] - c;
-			diff = diff / diff.norm() * len + c;
-			curved_point[p] = diff;
-		}
-	}
-
-	std::vector<int> vindices;
-	std::vector<Eigen::Vector3d> points;
-	auto c = (v0 + v1 + v2) / 3.0;
-
-	double max_len = std::max((c - v0).norm(),
-		std::max((c - v1).norm(), (c - v2).norm()));
 
 	int min_axis = 0;
 	for (int i = 1; i < 3; ++i) {
@@ -175,16 +173,22 @@ void Subdivision::DelaunaySubdivision(
 	tx[min_axis] = 1;
 	tx = tx.cross(n);
 	tx /= tx.norm();
-	Vector3 ty = n.cross(tx);
+	*pn = n;
+	*ptx = tx;
+	*pty = n.cross(tx);
+}
 
-	for (auto p : merged_indices) {
-		auto v = V[p];
-		vindices.push_back(p);
-		Eigen::Vector3d diff = v - c;
-		diff = diff / diff.norm() * max_len + c;
-		//points.push_back(v);
-		points.push_back(curved_point[p]);
-	}
+void Subdivision::InteriorPoints(
+	const std::vector<Vector3>& V,
+	const Eigen::Vector3i& face,
+	double len_thres,
+	std::vector<Vector3>* points) {
+	Eigen::Vector3d v0 = V[face[0]];
+	Eigen::Vector3d v1 = V[face[1]];
+	Eigen::Vector3d v2 = V[face[2]];
+
+	Vector3 n, tx, ty;
+	FaceFrame(V, face, &n, &tx, &ty);
 
 	double v0x = 0;
 	double v0y = 0;
@@ -198,7 +202,6 @@ void Subdivision::DelaunaySubdivision(
 	int maxX = (std::max(v0x, std::max(v1x, v2x))) + 0.999999f;
 	int maxY = (std::max(v0y, std::max(v1y, v2y))) + 0.999999f;
 
-	int count = 0;
 	for (int py = minY; py <= maxY; ++py) {
 		for (int px = minX; px <= maxX; ++px) {
 			double w1, w2, w3;
@@ -211,14 +214,57 @@ void Subdivision::DelaunaySubdivision(
 				Vector3 rand_p = v0
 							   + tx * (px * len_thres)
 							   + ty * (py * len_thres);
-				vindices.push_back(V.size());
-				V.push_back(rand_p);
-				points.push_back(rand_p);
-				count += 1;
+				points->push_back(rand_p);
 			}
 		}
 	}
+}
 
+void Subdivision::DelaunaySubdivision(
+	const std::vector<int>* boundary_indices,
+	const std::vector<Vector3>& V,
+	const Eigen::Vector3i& face,
+	int first_interior,
+	int num_interior,
+	double len_thres,
+	std::vector<Eigen::Vector3i>* F) {
+
+	Eigen::Vector3d v0 = V[face[0]];
+	Eigen::Vector3d v1 = V[face[1]];
+	Eigen::Vector3d v2 = V[face[2]];
+
+	Vector3 n, tx, ty;
+	FaceFrame(V, face, &n, &tx, &ty);
+
+	std::unordered_set<int> merged_indices;
+	std::unordered_map<int, Eigen::Vector3d> curved_point;
+	for (int i = 0; i < 3; ++i) {
+		Eigen::Vector3d x = V[face[i]];
+		Eigen::Vector3d y = V[face[(i+1)%3]];
+		Eigen::Vector3d dir = n.cross(y - x);
+		dir /= dir.norm();
+		Eigen::Vector3d c = (y + x) * 0.5 + 1e3 * dir;
+		double len = (c - x).norm();
+		for (auto& p : boundary_indices[i]) {
+			merged_indices.insert(p);
+			Eigen::Vector3d diff = V[p] - c;
+			diff = diff / diff.norm() * len + c;
+			curved_point[p] = diff;
+		}
+	}
+
+	std::vector<int> vindices;
+	std::vector<Eigen::Vector3d> points;
+
+	for (auto p : merged_indices) {
+		vindices.push_back(p);
+		points.push_back(curved_point[p]);
+	}
+
+	for (int i = 0; i < num_interior; ++i) {
+		vindices.push_back(first_interior + i);
+		points.push_back(V[first_interior + i]);
+	}
 
 	Eigen::MatrixXd V2D(vindices.size(), 2);
 	for (int i = 0; i < vindices.size(); ++i) {
@@ -244,21 +290,92 @@ void Subdivision::DelaunaySubdivision(
 			}
 		}
 		if (!boundary_triangle) {
-			F.push_back(Eigen::Vector3i(v[0], v[1], v[2]));
+			F->push_back(Eigen::Vector3i(v[0], v[1], v[2]));
 		}
 	}
 }
 
-void Subdivision::ComputeGeometryNeighbors(double thres) {
+// Packs integer cell coordinates into 64-bit keys relative to their
+// bounding box, so that sorting the keys orders the cells like
+// (x, (y, z)) pairs.
+static void PackCellKeys(const std::vector<Eigen::Vector3i>& cells,
+	std::vector<unsigned long long>* keys) {
+	Eigen::Vector3i min_c(0, 0, 0), max_c(0, 0, 0);
+	if (!cells.empty())
+		min_c = max_c = cells[0];
+	for (auto& c : cells) {
+		min_c = min_c.cwiseMin(c);
+		max_c = max_c.cwiseMax(c);
+	}
+	unsigned long long dy = max_c[1] - min_c[1] + 1;
+	unsigned long long dz = max_c[2] - min_c[2] + 1;
+	keys->resize(cells.size());
+	for (int i = 0; i < cells.size(); ++i) {
+		Eigen::Vector3i c = cells[i] - min_c;
+		(*keys)[i] = ((unsigned long long)c[0] * dy + c[1]) * dz + c[2];
+	}
+}
+
+// Groups items by key with a counting sort: cell c holds
+// cell_items[cell_offset[c] .. cell_offset[c + 1]), cells are ordered by
+// key and items keep their input order. Repeated entries of an item in
+// one cell are dropped, which requires the entries of each item to be
+// consecutive in the input.
+static void BucketByKey(const std::vector<unsigned long long>& keys,
+	const std::vector<int>& items,
+	std::vector<int>* cell_offset,
+	std::vector<int>* cell_items) {
+	std::vector<unsigned long long> cells(keys);
+	std::sort(cells.begin(), cells.end());
+	cells.erase(std::unique(cells.begin(), cells.end()), cells.end());
+
+	std::vector<int> cell_of(keys.size());
+	std::vector<int> offset(cells.size() + 1, 0);
+	for (int i = 0; i < keys.size(); ++i) {
+		cell_of[i] = std::lower_bound(cells.begin(), cells.end(), keys[i])
+			- cells.begin();
+		offset[cell_of[i] + 1] += 1;
+	}
+	for (int c = 0; c < cells.size(); ++c)
+		offset[c + 1] += offset[c];
+
+	std::vector<int> sorted(keys.size());
+	std::vector<int> top(offset.begin(), offset.end() - 1);
+	for (int i = 0; i < keys.size(); ++i)
+		sorted[top[cell_of[i]]++] = items[i];
+
+	cell_offset->assign(1, 0);
+	cell_items->clear();
+	cell_items->reserve(sorted.size());
+	for (int c = 0; c < cells.size(); ++c) {
+		for (int j = offset[c]; j < offset[c + 1]; ++j) {
+			if (j > offset[c] && sorted[j] == sorted[j - 1])
+				continue;
+			cell_items->push_back(sorted[j]);
+		}
+		cell_offset->push_back(cell_items->size());
+	}
+}
+
+// Adds the (v1 < v2) pairs to the sorted unique edge list.
+static void MergeEdges(std::vector<std::pair<int, int> >& pairs,
+	std::vector<std::pair<int, int> >* edges) {
+	pairs.insert(pairs.end(), edges->begin(), edges->end());
+	std::sort(pairs.begin(), pairs.end());
+	pairs.erase(std::unique(pairs.begin(), pairs.end()), pairs.end());
+	pairs.shrink_to_fit();
+	edges->swap(pairs);
+}
+
+void Subdivision::ComputeGeometryNeighbors(double thres, int num_threads) {
 	auto& subdivide_mesh = subdivide_mesh_;
 	auto& vertices = subdivide_mesh.GetV();
 	auto& faces = subdivide_mesh.GetF();
 
 	double step = thres;
 
-	auto make_key = [&](const Vector3& v) {
-		return std::make_pair(int(v[0]/step),
-			std::make_pair(int(v[1]/step), int(v[2]/step)));
+	auto make_cell = [&](const Vector3& v) {
+		return Eigen::Vector3i(int(v[0]/step), int(v[1]/step), int(v[2]/step));
 	};
 
 	Vector3 diff[8] = {Vector3(0,0,0),
@@ -270,132 +387,123 @@ void Subdivision::ComputeGeometryNeighbors(double thres) {
 		Vector3(step,step,0),
 		Vector3(step,step,step)};
 
-	std::map<std::pair<int, std::pair<int, int> >,
-		std::unordered_set<int> > grids;
-
+	// every vertex goes to the eight cells around it
+	std::vector<Eigen::Vector3i> cells(vertices.size() * 8);
+	std::vector<int> items(vertices.size() * 8);
 	for (int i = 0; i < vertices.size(); ++i) {
 		for (int j = 0; j < 8; ++j) {
-			auto v = vertices[i] + diff[j];
-			auto key = make_key(v);
-			auto it = grids.find(key);
-			if (it == grids.end()) {
-				std::unordered_set<int> m;
-				m.insert(i);
-				grids[key] = m;
-			} else {
-				it->second.insert(i);
-			}
+			cells[i * 8 + j] = make_cell(vertices[i] + diff[j]);
+			items[i * 8 + j] = i;
 		}
 	}
-
-	std::vector<std::unordered_set<int> > links(vertices.size());
-	int count = 0;
-	for (auto& info : grids) {
-		auto& l = info.second;
-		if (l.size() < 1)
-			continue;
-		if (l.size() == 2) {
-			auto it = l.begin();
-			it++;
-			int v1 = *l.begin(), v2 = *it;
-			if (v1 > v2)
-				std::swap(v1, v2);
-			if (v1 == v2)
-				continue;
-			count += 1;
-			geometry_neighbor_pairs_.insert(std::make_pair(v1, v2));
-			continue;
-		}
-		Eigen::MatrixXd gridV(l.size(), 3);
-		int top = 0;
-		std::vector<int> vindices(l.size());
-		for (auto p : l) {
-			vindices[top] = p;
-			gridV.row(top++) = vertices[p];
+	std::vector<unsigned long long> keys;
+	PackCellKeys(cells, &keys);
+	std::vector<Eigen::Vector3i>().swap(cells);
+	std::vector<int> cell_offset, cell_vertices;
+	BucketByKey(keys, items, &cell_offset, &cell_vertices);
+	std::vector<unsigned long long>().swap(keys);
+	std::vector<int>().swap(items);
+
+	// cells are triangulated in parallel into their own buffers, merged
+	// in cell order below. Points reach Delaunay3D in ascending vertex
+	// order, which maps the edges of coincident vertices to the highest
+	// index of them, where the former unordered_set cells used whichever
+	// came last in the set.
+	int num_cells = cell_offset.size() - 1;
+	std::vector<std::vector<std::pair<int, int> > > cell_pairs(num_cells);
+	ParallelFor(0, num_cells, [&](int c) {
+		const int* l = cell_vertices.data() + cell_offset[c];
+		int l_size = cell_offset[c + 1] - cell_offset[c];
+		if (l_size < 2)
+			return;
+		auto& out = cell_pairs[c];
+		if (l_size == 2) {
+			out.push_back(std::make_pair(l[0], l[1]));
+			return;
 		}
+		Eigen::MatrixXd gridV(l_size, 3);
+		for (int j = 0; j < l_size; ++j)
+			gridV.row(j) = vertices[l[j]];
 
 		std::vector<std::pair<int, int> > gridE;
 		Delaunay3D(gridV, gridE);
-		count += gridE.size();
-		for (auto& e : gridE) {
-			int v1 = vindices[e.first];
-			int v2 = vindices[e.second];
-			if (v1 > v2)
-				std::swap(v1, v2);
-			if (v1 == v2)
-				continue;
-			geometry_neighbor_pairs_.insert(std::make_pair(v1, v2));
-		}
+		out.reserve(gridE.size());
+		for (auto& e : gridE)
+			out.push_back(std::make_pair(l[e.first], l[e.second]));
+	}, num_threads);
+
+	std::vector<std::pair<int, int> > pairs;
+	auto add_pair = [&](int v1, int v2) {
+		if (v1 > v2)
+			std::swap(v1, v2);
+		if (v1 != v2)
+			pairs.push_back(std::make_pair(v1, v2));
+	};
+	for (auto& cell : cell_pairs) {
+		for (auto& e : cell)
+			add_pair(e.first, e.second);
+		std::vector<std::pair<int, int> >().swap(cell);
 	}
 	for (int i = 0; i < faces.size(); ++i) {
-		for (int j = 0; j < 3; ++j) {
-			int v1 = faces[i][j];
-			int v2 = faces[i][(j + 1) % 3];
-			if (v1 > v2)
-				std::swap(v1, v2);
-			if (v1 == v2)
-				continue;
-			geometry_neighbor_pairs_.insert(std::make_pair(v1, v2));
-		}
+		for (int j = 0; j < 3; ++j)
+			add_pair(faces[i][j], faces[i][(j + 1) % 3]);
 	}
+	MergeEdges(pairs, &geometry_neighbor_pairs_);
 }
 
 void Subdivision::ComputeRepresentativeGraph(double thres) {
 	double step = thres;
 
-	auto make_key = [&](const Vector3& v) {
-		return std::make_pair(int(v[0]/step),
-			std::make_pair(int(v[1]/step), int(v[2]/step)));
-	};
-	std::map<std::pair<int, std::pair<int, int> >,
-		std::unordered_set<int> > grids;
-
 	auto& V = subdivide_mesh_.GetV();
 	auto& F = subdivide_mesh_.GetF();
+
+	std::vector<Eigen::Vector3i> cells(V.size());
+	std::vector<int> items(V.size());
 	for (int i = 0; i < V.size(); ++i) {
-		auto k = make_key(V[i]);
-		auto it = grids.find(k);
-		if (it != grids.end()) {
-			it->second.insert(i);
-		} else {
-			std::unordered_set<int> u;
-			u.insert(i);
-			grids[k] = u;
-		}
+		cells[i] = Eigen::Vector3i(int(V[i][0]/step), int(V[i][1]/step),
+			int(V[i][2]/step));
+		items[i] = i;
 	}
-
-	representative_vertices_.reserve(grids.size());
+	std::vector<unsigned long long> keys;
+	PackCellKeys(cells, &keys);
+	std::vector<int> cell_offset, cell_vertices;
+	BucketByKey(keys, items, &cell_offset, &cell_vertices);
+
+	// one representative per cell, at the mean of its vertices; a second
+	// call replaces the graph of the first
+	int num_cells = cell_offset.size() - 1;
+	representative_vertices_.clear();
+	representative_edges_.clear();
+	representative_vertices_.reserve(num_cells);
 	representative_reference_.resize(V.size());
-	for (auto& info : grids) {
+	for (int c = 0; c < num_cells; ++c) {
 		Vector3 p(0, 0, 0);
-		for (auto& id : info.second) {
+		for (int j = cell_offset[c]; j < cell_offset[c + 1]; ++j) {
+			int id = cell_vertices[j];
 			p += V[id];
 			representative_reference_[id] = representative_vertices_.size();
 		}
-		p /= (double)info.second.size();
+		p /= (double)(cell_offset[c + 1] - cell_offset[c]);
 		representative_vertices_.push_back(p);
 	}
-	for (auto& info : geometry_neighbor_pairs_) {
-		int v0 = representative_reference_[info.first];
-		int v1 = representative_reference_[info.second];
-		if (v0 == v1)
-			continue;
+
+	std::vector<std::pair<int, int> > edges;
+	edges.reserve(geometry_neighbor_pairs_.size() + F.size() * 3);
+	auto add_edge = [&](int v0, int v1) {
+		v0 = representative_reference_[v0];
+		v1 = representative_reference_[v1];
 		if (v0 > v1)
 			std::swap(v0, v1);
-		representative_edges_.insert(std::make_pair(v0, v1));
-	}
+		if (v0 != v1)
+			edges.push_back(std::make_pair(v0, v1));
+	};
+	for (auto& info : geometry_neighbor_pairs_)
+		add_edge(info.first, info.second);
 	for (int i = 0; i < F.size(); ++i) {
-		for (int j = 0; j < 3; ++j) {
-			int v0 = representative_reference_[F[i][j]];
-			int v1 = representative_reference_[F[i][(j + 1) % 3]];
-			if (v0 == v1)
-				continue;
-			if (v0 > v1)
-				std::swap(v0, v1);
-			representative_edges_.insert(std::make_pair(v0, v1));
-		}
+		for (int j = 0; j < 3; ++j)
+			add_edge(F[i][j], F[i][(j + 1) % 3]);
 	}
-
+	MergeEdges(edges, &representative_edges_);
 }
 
 long long Subdivision::EdgeHash(int v1, int v2, int vsize) {
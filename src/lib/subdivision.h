@@ -10,15 +10,21 @@ class Subdivision
 {
 public:
 	Subdivision();
-	void Subdivide(const Mesh& mesh, double len_thres);
+	// Subdivide triangulates the faces and ComputeGeometryNeighbors the
+	// grid cells on num_threads threads (all hardware threads if <= 0);
+	// the result does not depend on the number of threads.
+	void Subdivide(const Mesh& mesh, double len_thres, int num_threads = 0);
 	void ApplyTransform(const Mesh& mesh);
-	void ComputeGeometryNeighbors(double len_thres);
+	void ComputeGeometryNeighbors(double len_thres, int num_threads = 0);
+	// One graph vertex per grid cell of size len_thres, at the mean of the
+	// mesh vertices in it (see Vertex2Graph); replaces any previous graph.
 	void ComputeRepresentativeGraph(double len_thres);
 
 	void LinearSolve();
 	void SmoothInternal();
 	Mesh& GetMesh() { return subdivide_mesh_; }
-	const std::set<std::pair<int, int> >& Neighbors() const {
+	// Neighbors and GraphE are sorted (v1 < v2) pairs without duplicates.
+	const std::vector<std::pair<int, int> >& Neighbors() const {
 		return geometry_neighbor_pairs_;
 	}
 	std::vector<int>& Vertex2Graph() {
@@ -27,17 +33,29 @@ public:
 	std::vector<Vector3>& GraphV() {
 		return representative_vertices_;
 	}
-	std::set<std::pair<int, int> >& GraphE() {
+	std::vector<std::pair<int, int> >& GraphE() {
 		return representative_edges_;
 	}
 
 protected:
+	// Grid points of spacing len_thres strictly inside the face.
+	void InteriorPoints(
+		const std::vector<Vector3>& V,
+		const Eigen::Vector3i& face,
+		double len_thres,
+		std::vector<Vector3>* points);
+
+	// Triangulates the face from the vertices splitting its three edges and
+	// the num_interior vertices starting at first_interior, appending the
+	// triangles to F. Only reads V, so faces can be processed in parallel.
 	void DelaunaySubdivision(
-		std::vector<int>* boundary_indices,
-		std::vector<Vector3>& V,
-		std::vector<Eigen::Vector3i>& F,
-		Eigen::Vector3i& face,
-		double len_thres);
+		const std::vector<int>* boundary_indices,
+		const std::vector<Vector3>& V,
+		const Eigen::Vector3i& face,
+		int first_interior,
+		int num_interior,
+		double len_thres,
+		std::vector<Eigen::Vector3i>* F);
 
 	long long EdgeHash(int v1, int v2, int vsize = -1);
 
@@ -55,12 +73,12 @@ protected:
 private:
 	Mesh subdivide_mesh_;
 
-	std::set<std::pair<int, int> > geometry_neighbor_pairs_;
+	std::vector<std::pair<int, int> > geometry_neighbor_pairs_;
 	std::vector<int> internal_vertices_;
 
 	std::vector<int> representative_reference_;
 	std::vector<Vector3> representative_vertices_;
-	std::set<std::pair<int, int> > representative_edges_;
+	std::vector<std::pair<int, int> > representative_edges_;
 
 
 };
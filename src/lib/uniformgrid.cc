@@ -1,20 +1,235 @@
 #include "uniformgrid.h"
 
+#include <fcntl.h>
+#include <sys/mman.h>
+#include <sys/stat.h>
+#include <unistd.h>
+
+#include <cmath>
+#include <cstring>
+#include <fstream>
+
 #include <ceres/ceres.h>
 
+#include "file_util.h"
+
+// On-disk layout of a grid file. The header is followed by the voxels of
+// a dense grid, or by the brick table (padded to 8 bytes) and the bricks
+// of a sparse one, so everything stays aligned when memory-mapped.
+struct GridFileHeader {
+	char magic[8];
+	int version;
+	int dimension;
+	double scale;
+	double trans[3];
+	int block_size;
+	int num_bricks;
+	double band;
+};
+
+static const char kGridMagic[8] = {'M','O','D','E','G','R','I','D'};
+static const int kGridVersion = 2;
+
+constexpr FT UniformGrid::kFarDistance;
+
 UniformGrid::UniformGrid()
-: grid_dimension_(0)
+: grid_dimension_(0), block_dimension_(0), band_(0),
+  mapped_voxels_(0), mapped_blocks_(0)
 {}
 
-UniformGrid::UniformGrid(int grid_dimension) {
-	grid_dimension_ = grid_dimension;
-	voxel_distance_.resize(grid_dimension);
-	for (auto& d : voxel_distance_) {
-		d.resize(grid_dimension);
-		for (auto& v : d)
-			v.resize(grid_dimension, 1e30);
+UniformGrid::UniformGrid(int grid_dimension)
+: grid_dimension_(grid_dimension), block_dimension_(0), band_(0),
+  mapped_voxels_(0), mapped_blocks_(0)
+{
+	voxel_distance_.resize(
+		(long long)grid_dimension * grid_dimension * grid_dimension,
+		kFarDistance);
+}
+
+UniformGrid::UniformGrid(int grid_dimension, FT band)
+: grid_dimension_(grid_dimension), block_dimension_(0), band_(band),
+  mapped_voxels_(0), mapped_blocks_(0)
+{
+	block_dimension_ = (grid_dimension + kBlockSize - 1) / kBlockSize;
+	block_index_.resize((long long)block_dimension_ * block_dimension_
+		* block_dimension_, -1);
+}
+
+void UniformGrid::AllocateBand(const Vector3& min_p, const Vector3& max_p) {
+	if (!IsSparse())
+		return;
+	if (mapped_)
+		Unmap();
+	int lo[3], hi[3];
+	for (int j = 0; j < 3; ++j) {
+		// voxel v sits at v / n
+		lo[j] = std::max(0, (int)std::floor((min_p[j] - band_)
+			* grid_dimension_) >> kBlockShift);
+		hi[j] = std::min(block_dimension_ - 1, (int)std::ceil((max_p[j] + band_)
+			* grid_dimension_) >> kBlockShift);
+	}
+	// (i, j, k) = (z, y, x)
+	for (int i = lo[2]; i <= hi[2]; ++i) {
+		for (int j = lo[1]; j <= hi[1]; ++j) {
+			for (int k = lo[0]; k <= hi[0]; ++k) {
+				int& block = block_index_[((long long)i * block_dimension_ + j)
+					* block_dimension_ + k];
+				if (block >= 0)
+					continue;
+				block = voxel_distance_.size() / kBlockVoxels;
+				voxel_distance_.resize(voxel_distance_.size() + kBlockVoxels,
+					kFarDistance);
+			}
+		}
+	}
+}
+
+long long UniformGrid::NumVoxels() const {
+	if (!IsSparse())
+		return Index(grid_dimension_, 0, 0);
+	long long num_bricks = 0;
+	const int* blocks = Blocks();
+	long long num_blocks = (long long)block_dimension_ * block_dimension_
+		* block_dimension_;
+	for (long long i = 0; i < num_blocks; ++i)
+		num_bricks += (blocks[i] >= 0);
+	return num_bricks * kBlockVoxels;
+}
+
+long long UniformGrid::MemoryUsage() const {
+	long long num_blocks = IsSparse() ? (long long)block_dimension_
+		* block_dimension_ * block_dimension_ : 0;
+	return NumVoxels() * sizeof(FT) + num_blocks * sizeof(int);
+}
+
+FT* UniformGrid::MutableVoxels() {
+	if (mapped_)
+		Unmap();
+	return voxel_distance_.data();
+}
+
+void UniformGrid::Unmap() {
+	const FT* data = Data();
+	voxel_distance_.assign(data, data + NumVoxels());
+	if (IsSparse()) {
+		const int* blocks = Blocks();
+		block_index_.assign(blocks, blocks + (long long)block_dimension_
+			* block_dimension_ * block_dimension_);
+	}
+	mapped_.reset();
+}
+
+bool UniformGrid::Save(const char* filename, FT scale,
+	const Vector3& trans) const {
+	GridFileHeader header;
+	memset(&header, 0, sizeof(header));
+	memcpy(header.magic, kGridMagic, sizeof(kGridMagic));
+	header.version = kGridVersion;
+	header.dimension = grid_dimension_;
+	header.scale = scale;
+	for (int j = 0; j < 3; ++j)
+		header.trans[j] = trans[j];
+	header.block_size = IsSparse() ? kBlockSize : 0;
+	header.num_bricks = IsSparse() ? NumVoxels() / kBlockVoxels : 0;
+	header.band = band_;
+
+	// write to a temporary file of our own first so that a concurrent
+	// reader never maps a partially written grid, and concurrent writers
+	// of the same grid never interleave
+	std::string tmp_filename;
+	if (!CreateTempFile(filename, &tmp_filename))
+		return false;
+	std::ofstream os(tmp_filename, std::ios::binary);
+	if (!os) {
+		unlink(tmp_filename.c_str());
+		return false;
+	}
+	os.write((const char*)&header, sizeof(header));
+	if (IsSparse()) {
+		long long num_blocks = (long long)block_dimension_ * block_dimension_
+			* block_dimension_;
+		os.write((const char*)Blocks(), num_blocks * sizeof(int));
+		if (num_blocks % 2)
+			os.write("\0\0\0\0", 4);
+	}
+	os.write((const char*)Data(), NumVoxels() * sizeof(FT));
+	os.close();
+	if (!os) {
+		unlink(tmp_filename.c_str());
+		return false;
+	}
+	if (rename(tmp_filename.c_str(), filename) != 0) {
+		unlink(tmp_filename.c_str());
+		return false;
+	}
+	return true;
+}
+
+bool UniformGrid::Load(const char* filename, FT* scale, Vector3* trans) {
+	int fd = open(filename, O_RDONLY);
+	if (fd < 0)
+		return false;
+
+	struct stat st;
+	if (fstat(fd, &st) != 0 || st.st_size < (off_t)sizeof(GridFileHeader)) {
+		close(fd);
+		return false;
+	}
+
+	size_t length = st.st_size;
+	void* base = mmap(0, length, PROT_READ, MAP_SHARED, fd, 0);
+	close(fd);
+	if (base == MAP_FAILED)
+		return false;
+
+	const GridFileHeader* header = (const GridFileHeader*)base;
+	long long n = header->dimension;
+	long long num_blocks = 0;
+	long long num_voxels = n * n * n;
+	if (header->block_size == kBlockSize) {
+		long long nb = (n + kBlockSize - 1) / kBlockSize;
+		num_blocks = nb * nb * nb;
+		num_voxels = (long long)header->num_bricks * kBlockVoxels;
 	}
+	long long blocks_bytes = (num_blocks + num_blocks % 2) * sizeof(int);
+	if (memcmp(header->magic, kGridMagic, sizeof(kGridMagic)) != 0
+		|| header->version != kGridVersion
+		|| header->dimension <= 0 || header->num_bricks < 0
+		|| (header->block_size != 0 && header->block_size != kBlockSize)
+		|| length != sizeof(GridFileHeader) + blocks_bytes
+			+ num_voxels * sizeof(FT)) {
+		munmap(base, length);
+		return false;
+	}
+
+	// a stale or corrupt brick table would send lookups outside the bricks
+	const int* blocks = (const int*)((const char*)base
+		+ sizeof(GridFileHeader));
+	for (long long i = 0; i < num_blocks; ++i) {
+		if (blocks[i] < -1 || blocks[i] >= header->num_bricks) {
+			munmap(base, length);
+			return false;
+		}
+	}
+
+	grid_dimension_ = header->dimension;
+	block_dimension_ = header->block_size ? (n + kBlockSize - 1) / kBlockSize
+		: 0;
+	band_ = header->band;
+	*scale = header->scale;
+	*trans = Vector3(header->trans[0], header->trans[1], header->trans[2]);
+
+	voxel_distance_.clear();
+	voxel_distance_.shrink_to_fit();
+	block_index_.clear();
+	block_index_.shrink_to_fit();
+	mapped_blocks_ = sizeof(GridFileHeader);
+	mapped_voxels_ = sizeof(GridFileHeader) + blocks_bytes;
+	mapped_ = std::shared_ptr<const char>((const char*)base,
+		[length](const char* p) { munmap((void*)p, length); });
+	return true;
 }
+
 template <class T>
 T UniformGrid::distance(const T* const p) const {
 	int px = *(double*)&p[0] * grid_dimension_;
@@ -51,29 +266,32 @@ T UniformGrid::distance(const T* const p) const {
 	T wy = p[1] * (T)grid_dimension_ - (T)py;
 	T wz = p[2] * (T)grid_dimension_ - (T)pz;
 
+	FT c[8];
+	Corners(pz, py, px, c);
+
 	T w0 = ((T)1 - wx) * ((T)1 - wy) * ((T)1 - wz) *
-			(T)voxel_distance_[pz    ][py    ][px    ];
+			(T)c[0];
 
 	T w1 = wx 		   * ((T)1 - wy) * ((T)1 - wz) *
-			(T)voxel_distance_[pz    ][py    ][px + 1];
+			(T)c[1];
 
 	T w2 = ((T)1 - wx) * wy 		 * ((T)1 - wz) *
-			(T)voxel_distance_[pz    ][py + 1][px    ];
+			(T)c[2];
 
 	T w3 = wx 		   * wy 		 * ((T)1 - wz) *
-			(T)voxel_distance_[pz    ][py + 1][px + 1];
+			(T)c[3];
 
 	T w4 = ((T)1 - wx) * ((T)1 - wy) * wz 		   *
-			(T)voxel_distance_[pz + 1][py    ][px    ];
+			(T)c[4];
 
 	T w5 = wx 		   * ((T)1 - wy) * wz 		   *
-			(T)voxel_distance_[pz + 1][py    ][px + 1];
+			(T)c[5];
 
 	T w6 = ((T)1 - wx) * wy 		 * wz		   *
-			(T)voxel_distance_[pz + 1][py + 1][px    ];
+			(T)c[6];
 
 	T w7 = wx 		   * wy 		 * wz 		   *
-			(T)voxel_distance_[pz + 1][py + 1][px + 1];
+			(T)c[7];
 
 	T res = w0 + w1 + w2 + w3 + w4 + w5 + w6 + w7;
 
@@ -118,29 +336,32 @@ T UniformGrid::DistanceFloat(const T* const p) const {
 	T wy = p[1] * (T)grid_dimension_ - (T)py;
 	T wz = p[2] * (T)grid_dimension_ - (T)pz;
 
+	FT c[8];
+	Corners(pz, py, px, c);
+
 	T w0 = ((T)1 - wx) * ((T)1 - wy) * ((T)1 - wz) *
-			(T)voxel_distance_[pz    ][py    ][px    ];
+			(T)c[0];
 
 	T w1 = wx 		   * ((T)1 - wy) * ((T)1 - wz) *
-			(T)voxel_distance_[pz    ][py    ][px + 1];
+			(T)c[1];
 
 	T w2 = ((T)1 - wx) * wy 		 * ((T)1 - wz) *
-			(T)voxel_distance_[pz    ][py + 1][px    ];
+			(T)c[2];
 
 	T w3 = wx 		   * wy 		 * ((T)1 - wz) *
-			(T)voxel_distance_[pz    ][py + 1][px + 1];
+			(T)c[3];
 
 	T w4 = ((T)1 - wx) * ((T)1 - wy) * wz 		   *
-			(T)voxel_distance_[pz + 1][py    ][px    ];
+			(T)c[4];
 
 	T w5 = wx 		   * ((T)1 - wy) * wz 		   *
-			(T)voxel_distance_[pz + 1][py    ][px + 1];
+			(T)c[5];
 
 	T w6 = ((T)1 - wx) * wy 		 * wz		   *
-			(T)voxel_distance_[pz + 1][py + 1][px    ];
+			(T)c[6];
 
 	T w7 = wx 		   * wy 		 * wz 		   *
-			(T)voxel_distance_[pz + 1][py + 1][px + 1];
+			(T)c[7];
 
 	T res = w0 + w1 + w2 + w3 + w4 + w5 + w6 + w7;
 
@@ -149,6 +370,88 @@ T UniformGrid::DistanceFloat(const T* const p) const {
 	return res;
 }
 
+template <class T>
+T UniformGrid::DistanceWithGradient(const T* const p, T* gradient) const {
+	int px = p[0] * grid_dimension_;
+	int py = p[1] * grid_dimension_;
+	int pz = p[2] * grid_dimension_;
+	gradient[0] = (T)0;
+	gradient[1] = (T)0;
+	gradient[2] = (T)0;
+	if (px < 0 || py < 0 || pz < 0
+		|| px >= grid_dimension_ - 1
+		|| py >= grid_dimension_ - 1
+		|| pz >= grid_dimension_ - 1) {
+
+		T l = (T)0;
+		T n = (T)grid_dimension_;
+		if (px < 0) {
+			l = l + -p[0] * n;
+			gradient[0] = -n;
+		}
+		else if (px >= grid_dimension_) {
+			l = l + (p[0] * n - (T)(grid_dimension_ - 1 - 1e-3));
+			gradient[0] = n;
+		}
+
+		if (py < 0) {
+			l = l + -p[1] * n;
+			gradient[1] = -n;
+		}
+		else if (py >= grid_dimension_) {
+			l = l + (p[1] * n - (T)(grid_dimension_ - 1 - 1e-3));
+			gradient[1] = n;
+		}
+
+		if (pz < 0) {
+			l = l + -p[2] * n;
+			gradient[2] = -n;
+		}
+		else if (pz >= grid_dimension_) {
+			l = l + (p[2] * n - (T)(grid_dimension_ - 1 - 1e-3));
+			gradient[2] = n;
+		}
+
+		return l;
+	}
+	T wx = p[0] * (T)grid_dimension_ - (T)px;
+	T wy = p[1] * (T)grid_dimension_ - (T)py;
+	T wz = p[2] * (T)grid_dimension_ - (T)pz;
+
+	FT c[8];
+	Corners(pz, py, px, c);
+
+	T c0 = (T)c[0];
+	T c1 = (T)c[1];
+	T c2 = (T)c[2];
+	T c3 = (T)c[3];
+	T c4 = (T)c[4];
+	T c5 = (T)c[5];
+	T c6 = (T)c[6];
+	T c7 = (T)c[7];
+
+	T ux = (T)1 - wx;
+	T uy = (T)1 - wy;
+	T uz = (T)1 - wz;
+
+	T res = ux * uy * uz * c0 + wx * uy * uz * c1
+		  + ux * wy * uz * c2 + wx * wy * uz * c3
+		  + ux * uy * wz * c4 + wx * uy * wz * c5
+		  + ux * wy * wz * c6 + wx * wy * wz * c7;
+
+	if (res > (T)0.2)
+		return T(0);
+
+	T n = (T)grid_dimension_;
+	gradient[0] = n * (uy * uz * (c1 - c0) + wy * uz * (c3 - c2)
+		+ uy * wz * (c5 - c4) + wy * wz * (c7 - c6));
+	gradient[1] = n * (ux * uz * (c2 - c0) + wx * uz * (c3 - c1)
+		+ ux * wz * (c6 - c4) + wx * wz * (c7 - c5));
+	gradient[2] = n * (ux * uy * (c4 - c0) + wx * uy * (c5 - c1)
+		+ ux * wy * (c6 - c2) + wx * wy * (c7 - c3));
+	return res;
+}
+
 template double UniformGrid::distance<double>(const double* const) const;
 template ceres::Jet<double, 3> UniformGrid::distance<ceres::Jet<double, 3> >(
 	const ceres::Jet<double, 3>* const) const;
@@ -156,3 +459,8 @@ template ceres::Jet<double, 3> UniformGrid::distance<ceres::Jet<double, 3> >(
 template float UniformGrid::DistanceFloat<float>(const float* const) const;
 template ceres::Jet<float, 3> UniformGrid::DistanceFloat<ceres::Jet<float, 3> >(
 	const ceres::Jet<float, 3>* const) const;
+
+template float UniformGrid::DistanceWithGradient<float>(
+	const float* const, float*) const;
+template double UniformGrid::DistanceWithGradient<double>(
+	const double* const, double*) const;
@@ -1,6 +1,7 @@
 #ifndef SHAPEDEFORM_UNIFORM_GRID_H_
 #define SHAPEDEFORM_UNIFORM_GRID_H_
 
+#include <memory>
 #include <vector>
 
 #include "types.h"
@@ -10,6 +11,13 @@ class UniformGrid
 public:
 	UniformGrid();
 	UniformGrid(int grid_dimension);
+
+	// Narrow-band grid: voxels are stored in 8^3 bricks, and only bricks
+	// within band of the surface are allocated (see AllocateBand). All
+	// other voxels read as far away, which the lookups clamp to zero just
+	// like distances above 0.2. A band of at least 0.2 + 2 * sqrt(3) / n
+	// gives the same lookups as the dense grid.
+	UniformGrid(int grid_dimension, FT band);
 	
 	template <class T>
 	T distance(const T* const p) const;
@@ -17,20 +25,147 @@ public:
 	template <class T>
 	T DistanceFloat(const T* const p) const;
 
+	// Same value as distance/DistanceFloat, together with its analytic
+	// gradient with respect to p, from a single set of voxel fetches.
+	template <class T>
+	T DistanceWithGradient(const T* const p, T* gradient) const;
+
 	int Dimension() const {
 		return grid_dimension_;
 	}
 
+	bool IsSparse() const {
+		return block_dimension_ > 0;
+	}
+
+	FT Band() const {
+		return band_;
+	}
+
+	// Allocates every brick overlapping the box [min_p, max_p] grown by
+	// the band, in normalized coordinates. No-op for dense grids.
+	void AllocateBand(const Vector3& min_p, const Vector3& max_p);
+
+	// Whether voxel (i, j, k) has storage; always true for dense grids.
+	bool HasVoxel(int i, int j, int k) const {
+		return !IsSparse() || BlockOf(i, j, k) >= 0;
+	}
+
+	// Writes to voxels without storage are dropped.
 	void SetDistance(int i, int j, int k, FT distance) {
-		voxel_distance_[i][j][k] = distance;
+		if (mapped_)
+			Unmap();
+		long long index = VoxelIndex(i, j, k);
+		if (index >= 0)
+			voxel_distance_[index] = distance;
 	}
 
 	FT GetDistance(int i, int j, int k) const {
-		return voxel_distance_[i][j][k];
+		long long index = VoxelIndex(i, j, k);
+		return index >= 0 ? Data()[index] : kFarDistance;
+	}
+
+	// Number of voxels with storage, and the position of voxel (i, j, k)
+	// among them (-1 without storage), so that construction code can keep
+	// per-voxel scratch in the same layout and only for stored voxels.
+	long long NumStoredVoxels() const {
+		return NumVoxels();
+	}
+
+	long long StorageIndex(int i, int j, int k) const {
+		return VoxelIndex(i, j, k);
 	}
+
+	// The stored voxels in StorageIndex order, for writing; a loaded grid
+	// is copied out of its mapping first.
+	FT* MutableVoxels();
+
+	// Binary file holding the dimension, the normalization (scale, trans)
+	// and the voxels in the same layout as memory. Load memory-maps the
+	// file instead of reading it; returns false if it is missing or not a
+	// valid grid file.
+	bool Save(const char* filename, FT scale, const Vector3& trans) const;
+	bool Load(const char* filename, FT* scale, Vector3* trans);
+
+	// Bytes held by the voxels and the brick table, mapped or not.
+	long long MemoryUsage() const;
+
+	static const int kBlockShift = 3;
+	static const int kBlockSize = 1 << kBlockShift;
+	static constexpr FT kFarDistance = 1e30;
+
 private:
+	static const int kBlockMask = kBlockSize - 1;
+	static const int kBlockVoxels = kBlockSize * kBlockSize * kBlockSize;
+
+	// Dense: voxel (i, j, k) = (z, y, x) is stored at (i * n + j) * n + k.
+	// Sparse: the brick containing it is looked up in a dense table of
+	// bricks, and the voxel is stored at the same z-major offset inside.
+	long long Index(int i, int j, int k) const {
+		return ((long long)i * grid_dimension_ + j) * grid_dimension_ + k;
+	}
+
+	int BlockOf(int i, int j, int k) const {
+		return Blocks()[((long long)(i >> kBlockShift) * block_dimension_
+			+ (j >> kBlockShift)) * block_dimension_ + (k >> kBlockShift)];
+	}
+
+	long long VoxelIndex(int i, int j, int k) const {
+		if (!IsSparse())
+			return Index(i, j, k);
+		int block = BlockOf(i, j, k);
+		if (block < 0)
+			return -1;
+		return (long long)block * kBlockVoxels
+			+ ((((i & kBlockMask) << kBlockShift) + (j & kBlockMask))
+				<< kBlockShift) + (k & kBlockMask);
+	}
+
+	// Distances at the corners of the cell (i, j, k), ordered as
+	// (x, y, z) = 000, 100, 010, 110, 001, 101, 011, 111.
+	void Corners(int i, int j, int k, FT* c) const {
+		if (!IsSparse()) {
+			const long long sy = grid_dimension_;
+			const long long sz = sy * grid_dimension_;
+			const FT* v = Data() + Index(i, j, k);
+			c[0] = v[0];
+			c[1] = v[1];
+			c[2] = v[sy];
+			c[3] = v[sy + 1];
+			c[4] = v[sz];
+			c[5] = v[sz + 1];
+			c[6] = v[sz + sy];
+			c[7] = v[sz + sy + 1];
+			return;
+		}
+		for (int t = 0; t < 8; ++t)
+			c[t] = GetDistance(i + (t >> 2), j + ((t >> 1) & 1), k + (t & 1));
+	}
+
+	const FT* Data() const {
+		return mapped_ ? (const FT*)(mapped_.get() + mapped_voxels_)
+			: voxel_distance_.data();
+	}
+
+	const int* Blocks() const {
+		return mapped_ ? (const int*)(mapped_.get() + mapped_blocks_)
+			: block_index_.data();
+	}
+
+	long long NumVoxels() const;
+
+	void Unmap();
+
 	int grid_dimension_;
-	std::vector<std::vector<std::vector<FT> > > voxel_distance_;
+	int block_dimension_;
+	FT band_;
+	std::vector<FT> voxel_distance_;
+	std::vector<int> block_index_;
+
+	// when loaded from a file, voxels and bricks live in the mapping
+	std::shared_ptr<const char> mapped_;
+	long long mapped_voxels_;
+	long long mapped_blocks_;
 };
 
-#endif
\ No newline at end of file
+#endif
@@ -20,6 +20,8 @@ parser.add_argument('--source', default='../data/cad-source.obj')
 parser.add_argument('--target', default='../data/cad-target.obj')
 parser.add_argument('--output', default='./cad-output.obj')
 parser.add_argument('--rigidity', default='1')
+parser.add_argument('--grid_cache', default='')
+parser.add_argument('--grid_cache_bytes', default='0')
 
 args = parser.parse_args()
 
@@ -27,6 +29,10 @@ source_path = args.source
 reference_path = args.target
 output_path = args.output
 rigidity = float(args.rigidity)
+
+if args.grid_cache != '':
+	pyDeform.SetGridCache(args.grid_cache, int(args.grid_cache_bytes))
+
 src_V, src_F, src_E, src_to_graph, graph_V, graph_E\
 	= pyDeform.LoadCadMesh(source_path)
 
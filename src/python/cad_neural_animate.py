@@ -26,6 +26,14 @@ parser.add_argument('--output_folder', default='./animation')
 parser.add_argument('--rigidity', default='0.1')
 parser.add_argument('--device', default='cuda')
 parser.add_argument('--resume_path', default='./cad-output.ckpt')
+# directory of preprocessed LoadCadMesh results, none if empty
+parser.add_argument('--mesh_cache', default='')
+# direct, adjoint or checkpoint, see NeuralODE
+parser.add_argument('--backprop', default='direct')
+# vertices integrated at once when exporting frames, all if 0
+parser.add_argument('--chunk_size', default='0')
+# evaluate the flow through a TorchScript trace when exporting frames
+parser.add_argument('--script', action='store_true')
 
 args = parser.parse_args()
 
@@ -37,8 +45,10 @@ resume_path = args.resume_path
 device = torch.device(args.device)
 
 
-V1, F1, E1, V2G1, GV1, GE1 = pyDeform.LoadCadMesh(source_path)
-V2, F2, E2, V2G2, GV2, GE2 = pyDeform.LoadCadMesh(reference_path)
+V1, F1, E1, V2G1, GV1, GE1 = pyDeform.LoadCadMesh(source_path,
+	cache=args.mesh_cache)
+V2, F2, E2, V2G2, GV2, GE2 = pyDeform.LoadCadMesh(reference_path,
+	cache=args.mesh_cache)
 
 graph_loss = GraphLoss2Layer(V1,F1,GV1,GE1,V2,F2,GV2,GE2,rigidity,device)
 param_id1 = graph_loss.param_id1
@@ -57,7 +67,7 @@ if os.path.exists(resume_path):
 	func.func = func.func.to(device)
 	niter = 0
 else:
-	func = NeuralODE(device)
+	func = NeuralODE(device, args.backprop)
 	optimizer = optim.Adam(func.parameters(), lr=1e-3)
 	niter = 1000
 
@@ -71,8 +81,7 @@ loss_min = 1e30
 for it in range(0, niter):
 	optimizer.zero_grad()
 
-	GV1_deformed = func.forward(GV1_device)
-	GV2_deformed = func.inverse(GV2_device)
+	GV1_deformed, GV2_deformed = func.forward_inverse(GV1_device, GV2_device)
 
 	loss1_forward = graph_loss(GV1_deformed, GE1, GV2, GE2, 0)
 	loss1_backward = reverse_loss(GV1_deformed, GV2_origin, device)
@@ -105,23 +114,29 @@ V1_origin = V1_copy.clone()
 
 if not os.path.exists(output_path):
 	os.mkdir(output_path)
-for i in range(26):
-	V1_deform = V1_origin.clone()
-	V1_copy = V1_origin.clone().to(device)
-	if i != 0:
-		V1_copy = func.integrate(V1_copy, 0, i * 0.04, device)
-	V1_copy = torch.from_numpy(V1_copy.data.cpu().numpy())
-
-	src_to_src = torch.from_numpy(np.array([i for i in range(V1_origin.shape[0])]).astype('int32'))
-	E1 = np.zeros((F1.shape[0] * 3, 2), dtype='int32')
-	F1_numpy = F1.numpy()
-	E1[:F1.shape[0],:] = F1_numpy[:,0:2]
-	E1[F1.shape[0]:F1.shape[0]*2,:] = F1_numpy[:,1:3]
-	E1[F1.shape[0]*2:,0] = F1_numpy[:,2]
-	E1[F1.shape[0]*2:,1] = F1_numpy[:,0]
-	E1 = torch.from_numpy(E1)
-
-	pyDeform.SolveLinear(V1_deform, F1, E1, src_to_src, V1_copy, 1, 1)
+
+# every frame is one step from the first time, as in training
+num_frames = 26
+times = [i * 0.04 for i in range(num_frames)]
+chunk_size = int(args.chunk_size)
+
+V1_frames = func.trajectory(V1_origin.to(device), times, chunk_size,
+	args.script).cpu()
+
+src_to_src = torch.from_numpy(np.array([i for i in range(V1_origin.shape[0])]).astype('int32'))
+E1 = np.zeros((F1.shape[0] * 3, 2), dtype='int32')
+F1_numpy = F1.numpy()
+E1[:F1.shape[0],:] = F1_numpy[:,0:2]
+E1[F1.shape[0]:F1.shape[0]*2,:] = F1_numpy[:,1:3]
+E1[F1.shape[0]*2:,0] = F1_numpy[:,2]
+E1[F1.shape[0]*2:,1] = F1_numpy[:,0]
+E1 = torch.from_numpy(E1)
+
+# the frames only change the targets, so factorize the system once
+solver1 = pyDeform.LinearSolver(V1_origin, F1, E1, src_to_src, 1, 1)
+
+for i in range(num_frames):
+	V1_deform = solver1.solve(V1_frames[i].contiguous())
 	pyDeform.DenormalizeByTemplate(V1_deform, param_id2.tolist())
 	pyDeform.SaveMesh('%s/src-%02d.obj'%(output_path,i), V1_deform, F1)
 
@@ -129,15 +144,14 @@ V2_copy = V2.clone()
 pyDeform.NormalizeByTemplate(V2_copy, param_id2.tolist())
 V2_origin = V2_copy.clone()
 
-for i in range(26):
-	V2_deform = V2_origin.clone()
-	V2_copy = V2_origin.clone().to(device)
-	if i != 25:
-		V2_copy = func.integrate(V2_copy, 1, i * 0.04, device)
-	V2_copy = torch.from_numpy(V2_copy.data.cpu().numpy())
+# the target flows backwards, from t = 1 of the last frame
+V2_frames = func.trajectory(V2_origin.to(device), times[::-1], chunk_size,
+	args.script).cpu()
 
-	src_to_src = torch.from_numpy(np.array([i for i in range(V2_origin.shape[0])]).astype('int32'))
+src_to_src = torch.from_numpy(np.array([i for i in range(V2_origin.shape[0])]).astype('int32'))
+solver2 = pyDeform.LinearSolver(V2_origin, F2, E2, src_to_src, 1, 1)
 
-	pyDeform.SolveLinear(V2_deform, F2, E2, src_to_src, V2_copy, 1, 1)
+for i in range(num_frames):
+	V2_deform = solver2.solve(V2_frames[num_frames - 1 - i].contiguous())
 	pyDeform.DenormalizeByTemplate(V2_deform, param_id2.tolist())
-	pyDeform.SaveMesh('%s/tar-%02d.obj'%(output_path,i), V2_deform, F2)
\ No newline at end of file
+	pyDeform.SaveMesh('%s/tar-%02d.obj'%(output_path,i), V2_deform, F2)
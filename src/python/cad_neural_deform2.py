@@ -27,6 +27,19 @@ parser.add_argument('--output', default='./cad-output.obj')
 parser.add_argument('--rigidity', default='0.1')
 parser.add_argument('--device', default='cuda')
 parser.add_argument('--save_path', default='./cad-output.ckpt')
+parser.add_argument('--grid_cache', default='')
+parser.add_argument('--grid_cache_bytes', default='0')
+# directory of preprocessed LoadCadMesh results, none if empty
+parser.add_argument('--mesh_cache', default='')
+# direct, adjoint or checkpoint, see NeuralODE
+parser.add_argument('--backprop', default='direct')
+# cpp: pyDeform losses on the CPU, torch: tensor ops on --device, which
+# needs a dense copy of the distance grid (narrow-band grids <= 128^3)
+parser.add_argument('--backend', default='cpp')
+# also pull each deformed graph vertex to its nearest target graph vertex
+parser.add_argument('--chamfer', action='store_true')
+# ARAP local/global iterations of the final fit of the dense mesh
+parser.add_argument('--arap_iterations', default='1')
 
 args = parser.parse_args()
 
@@ -38,18 +51,24 @@ save_path = args.save_path
 device = torch.device(args.device)
 
 
-V1, F1, E1, V2G1, GV1, GE1 = pyDeform.LoadCadMesh(source_path)
-V2, F2, E2, V2G2, GV2, GE2 = pyDeform.LoadCadMesh(reference_path)
+if args.grid_cache != '':
+	pyDeform.SetGridCache(args.grid_cache, int(args.grid_cache_bytes))
 
-graph_loss = GraphLoss2Layer(V1,F1,GV1,GE1,V2,F2,GV2,GE2,rigidity,device)
+V1, F1, E1, V2G1, GV1, GE1 = pyDeform.LoadCadMesh(source_path,
+	cache=args.mesh_cache)
+V2, F2, E2, V2G2, GV2, GE2 = pyDeform.LoadCadMesh(reference_path,
+	cache=args.mesh_cache)
+
+graph_loss = GraphLoss2Layer(V1,F1,GV1,GE1,V2,F2,GV2,GE2,rigidity,device,
+	args.backend)
 param_id1 = graph_loss.param_id1
 param_id2 = graph_loss.param_id2
 
-reverse_loss = ReverseLossLayer()
+reverse_loss = ReverseLossLayer(chamfer=args.chamfer)
 
 #func = MAF(5, 3, 256, 1, None, 'relu', 'sequential', batch_norm=False)
 #func = func.to(device)
-func = NeuralODE(device)
+func = NeuralODE(device, args.backprop)
 
 optimizer = optim.Adam(func.parameters(), lr=1e-3)
 GV1_origin = GV1.clone()
@@ -63,8 +82,7 @@ loss_min = 1e30
 for it in range(0, niter):
 	optimizer.zero_grad()
 
-	GV1_deformed = func.forward(GV1_device)
-	GV2_deformed = func.inverse(GV2_device)
+	GV1_deformed, GV2_deformed = func.forward_inverse(GV1_device, GV2_device)
 
 	loss1_forward = graph_loss(GV1_deformed, GE1, GV2, GE2, 0)
 	loss1_backward = reverse_loss(GV1_deformed, GV2_origin, device)
@@ -104,6 +122,7 @@ V1_copy = torch.from_numpy(V1_copy.data.cpu().numpy())
 
 src_to_src = torch.from_numpy(np.array([i for i in range(V1_origin.shape[0])]).astype('int32'))
 
-pyDeform.SolveLinear(V1_origin, F1, E1, src_to_src, V1_copy, 1, 1)
+pyDeform.SolveLinear(V1_origin, F1, E1, src_to_src, V1_copy, 1, 1,
+	int(args.arap_iterations))
 pyDeform.DenormalizeByTemplate(V1_origin, param_id2.tolist())
 pyDeform.SaveMesh(output_path, V1_origin, F1)
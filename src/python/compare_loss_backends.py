@@ -0,0 +1,61 @@
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(os.path.dirname(os.path.abspath(__file__)) + '/layers')
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'build')))
+
+import torch
+import pyDeform
+from layers.torch_loss import TorchGraphLoss
+
+import argparse
+
+parser = argparse.ArgumentParser(description='Compare the pyDeform and torch graph losses.')
+parser.add_argument('--source', default='../data/cad-source.obj')
+parser.add_argument('--target', default='../data/cad-target.obj')
+parser.add_argument('--noise', default='0.02')
+parser.add_argument('--device', default='cpu')
+
+args = parser.parse_args()
+device = torch.device(args.device)
+
+V1, F1, E1, V2G1, GV1, GE1 = pyDeform.LoadCadMesh(args.source)
+V2, F2, E2, V2G2, GV2, GE2 = pyDeform.LoadCadMesh(args.target)
+
+template1 = pyDeform.DeformTemplate(V1, F1, 0, 64)
+template2 = pyDeform.DeformTemplate(V2, F2, 0, 64)
+pyDeform.NormalizeByTemplate(GV1, template1.param_id)
+pyDeform.StoreGraphInformation(GV1, GE1, template1.param_id)
+
+# perturb the graph so that both the edge residuals and the distances are
+# nonzero, and push a few vertices out of the grid
+torch.manual_seed(0)
+V = GV1 + torch.randn_like(GV1) * float(args.noise)
+V[:4] = torch.tensor([[-0.1, 0.5, 0.5], [1.05, 0.5, 0.5],
+	[0.5, 1.2, -0.3], [0.999, 0.5, 0.5]])
+
+def Report(name, a, b):
+	a = a.detach().cpu().double()
+	b = b.detach().cpu().double()
+	error = (a - b).abs().max().item()
+	scale = max(a.abs().max().item(), 1e-12)
+	print('%-24s max abs %.3e  max rel %.3e' % (name, error, error / scale))
+
+lossD, lossD_gradient = pyDeform.DistanceFieldLoss_forward_backward(V,
+	template2.param_id)
+lossR = pyDeform.GraphEdgeLoss_forward(V, GE1, template1.param_id)
+lossR_gradient = pyDeform.GraphEdgeLoss_backward(V, GE1, template1.param_id)
+
+distance_loss = TorchGraphLoss(template2.param_id, device)
+edge_loss = TorchGraphLoss(template1.param_id, device)
+
+V_device = V.to(device).requires_grad_()
+torch_lossD = distance_loss.distance(V_device)
+torch_lossD_gradient, = torch.autograd.grad(torch_lossD.sum() * 0.5, V_device)
+torch_lossR = edge_loss.edge(V_device)
+torch_lossR_gradient, = torch.autograd.grad(torch_lossR.sum() * 0.5, V_device)
+
+Report('DistanceFieldLoss', lossD, torch_lossD)
+Report('DistanceFieldLoss grad', lossD_gradient, torch_lossD_gradient)
+Report('GraphEdgeLoss', lossR, torch_lossR)
+Report('GraphEdgeLoss grad', lossR_gradient, torch_lossR_gradient)
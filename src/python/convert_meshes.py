@@ -0,0 +1,49 @@
+import sys
+import os
+import multiprocessing
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'build')))
+
+import argparse
+
+parser = argparse.ArgumentParser(description='Convert OBJ meshes to binary mesh files.')
+parser.add_argument('--filelist', default='../data/filelist.txt')
+parser.add_argument('--data_dir', default='../data')
+parser.add_argument('--workers', default='0')
+parser.add_argument('--overwrite', action='store_true')
+
+# written next to the OBJ file, where deform_worker.py picks it up;
+# LoadMesh/LoadCadMesh accept either file
+def BinaryPath(path):
+	return os.path.splitext(path)[0] + '.bin'
+
+def Convert(job):
+	import pyDeform
+	obj_path, binary_path = job
+	pyDeform.ConvertToBinaryMesh(obj_path, binary_path)
+	return binary_path
+
+def main():
+	args = parser.parse_args()
+	jobs = []
+	with open(args.filelist) as f:
+		for line in f:
+			name = os.path.basename(line.strip())
+			if not name.endswith('.obj'):
+				continue
+			obj_path = os.path.join(args.data_dir, name)
+			binary_path = BinaryPath(obj_path)
+			if args.overwrite or not os.path.exists(binary_path):
+				jobs.append((obj_path, binary_path))
+
+	workers = int(args.workers)
+	if workers <= 0:
+		workers = multiprocessing.cpu_count()
+	pool = multiprocessing.Pool(max(1, workers))
+	for i, binary_path in enumerate(pool.imap_unordered(Convert, jobs)):
+		print('[%d/%d] %s' % (i + 1, len(jobs), binary_path))
+	pool.close()
+	pool.join()
+
+if __name__ == '__main__':
+	main()
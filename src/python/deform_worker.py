@@ -0,0 +1,226 @@
+import sys
+import os
+import json
+import multiprocessing
+from collections import OrderedDict
+from time import time
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(os.path.dirname(os.path.abspath(__file__)) + '/layers')
+
+import argparse
+
+parser = argparse.ArgumentParser(description='Deformation worker pool.')
+# one job per line: source target output [rigidity]
+parser.add_argument('--jobs', default='')
+# used when no job file is given: pairs NNNNN-src.obj / NNNNN-tar.obj
+parser.add_argument('--filelist', default='../data/filelist.txt')
+parser.add_argument('--data_dir', default='../data')
+parser.add_argument('--output_dir', default='./output')
+parser.add_argument('--rigidity', default='1')
+parser.add_argument('--niter', default='10000')
+parser.add_argument('--workers', default='0')
+parser.add_argument('--threads', default='0')
+parser.add_argument('--cache_size', default='8')
+parser.add_argument('--grid_cache', default='')
+parser.add_argument('--grid_cache_bytes', default='0')
+parser.add_argument('--mesh_cache', default='')
+parser.add_argument('--log', default='')
+parser.add_argument('--overwrite', action='store_true')
+
+def ReadJobs(args):
+	jobs = []
+	if args.jobs != '':
+		with open(args.jobs) as f:
+			for line in f:
+				fields = line.split()
+				if len(fields) < 3 or fields[0].startswith('#'):
+					continue
+				rigidity = float(fields[3]) if len(fields) > 3\
+					else float(args.rigidity)
+				jobs.append((fields[0], fields[1], fields[2], rigidity))
+		return jobs
+
+	pairs = OrderedDict()
+	with open(args.filelist) as f:
+		for line in f:
+			name = os.path.basename(line.strip())
+			for suffix in ['-src.obj', '-tar.obj']:
+				if name.endswith(suffix):
+					pairs.setdefault(name[:-len(suffix)], {})[suffix] = name
+	for key, pair in pairs.items():
+		if len(pair) < 2:
+			continue
+		jobs.append((os.path.join(args.data_dir, pair['-src.obj']),
+			os.path.join(args.data_dir, pair['-tar.obj']),
+			os.path.join(args.output_dir, key + '-output.obj'),
+			float(args.rigidity)))
+	return jobs
+
+class LRUCache(object):
+	def __init__(self, capacity, on_evict=None):
+		self.capacity = capacity
+		self.on_evict = on_evict
+		self.items = OrderedDict()
+		self.hits = 0
+		self.misses = 0
+
+	def get(self, key, create):
+		if key in self.items:
+			self.items.move_to_end(key)
+			self.hits += 1
+			return self.items[key]
+		self.misses += 1
+		value = create()
+		self.items[key] = value
+		while len(self.items) > max(self.capacity, 1):
+			_, evicted = self.items.popitem(last=False)
+			if self.on_evict is not None:
+				self.on_evict(evicted)
+		return value
+
+# per process state, set up once by InitWorker
+state = {}
+
+def InitWorker(options):
+	import torch
+	import pyDeform
+	torch.set_num_threads(options['threads'])
+	if options['grid_cache'] != '':
+		pyDeform.SetGridCache(options['grid_cache'],
+			int(options['grid_cache_bytes']))
+	state['options'] = options
+	state['meshes'] = LRUCache(options['cache_size'] * 2)
+	state['templates'] = LRUCache(options['cache_size'],
+		lambda template: template.release())
+
+def LoadMesh(path):
+	import pyDeform
+	# prefer the binary file written by convert_meshes.py
+	binary_path = os.path.splitext(path)[0] + '.bin'
+	if os.path.exists(binary_path):
+		path = binary_path
+	mesh = state['meshes'].get(path, lambda: pyDeform.LoadCadMesh(path,
+		cache=state['options']['mesh_cache']))
+	# the deformation normalizes and overwrites the tensors in place
+	return [t.clone() for t in mesh]
+
+def DeformPair(source_path, reference_path, output_path, rigidity):
+	import numpy as np
+	from torch import nn
+	import torch.optim as optim
+	import pyDeform
+	from layers.graph_loss_layer import GraphLossLayer, Finalize
+	from layers.reverse_loss_layer import ReverseLossLayer
+
+	src_V, src_F, src_E, src_to_graph, graph_V, graph_E\
+		= LoadMesh(source_path)
+
+	tar_V, tar_F, tar_E, tar_to_graph, graph_V_tar, graph_E_tar\
+		= LoadMesh(reference_path)
+
+	template = state['templates'].get(reference_path,
+		lambda: pyDeform.DeformTemplate(tar_V, tar_F, 0, 64))
+
+	graph_deform = GraphLossLayer(graph_V, graph_E, tar_V, tar_F, rigidity,
+		template=template)
+	param_id = graph_deform.param_id
+	reverse_deform = ReverseLossLayer()
+
+	graph_V = nn.Parameter(graph_V)
+	optimizer = optim.Adam([graph_V], lr=1e-3)
+
+	pyDeform.NormalizeByTemplate(graph_V_tar, param_id.tolist())
+	niter = int(state['options']['niter'])
+	prev_loss_src, prev_loss_tar = 1e30, 1e30
+	current_loss_src, current_loss_tar = 1e30, 1e30
+	it = -1
+	for it in range(0, niter):
+		optimizer.zero_grad()
+		loss_src2tar = graph_deform(graph_V, graph_E)
+		loss_tar2src = reverse_deform(graph_V, graph_V_tar)
+		loss = loss_src2tar / graph_V.shape[0]\
+			+ loss_tar2src / graph_V_tar.shape[0]
+		loss.backward()
+		optimizer.step()
+
+		if it % 100 == 0:
+			current_loss_src = np.sqrt(loss_src2tar.item() / graph_V.shape[0])
+			current_loss_tar = np.sqrt(loss_tar2src.item()\
+				/ graph_V_tar.shape[0])
+			if prev_loss_src - current_loss_src < 1e-6\
+				and prev_loss_tar - current_loss_tar < 1e-6:
+					break
+			prev_loss_src, prev_loss_tar = current_loss_src, current_loss_tar
+
+	Finalize(src_V, src_F, src_E, src_to_graph, graph_V, 1, param_id)
+	pyDeform.SaveMesh(output_path, src_V, src_F)
+	return {'iterations': it + 1,
+		'loss_src2tar': float(current_loss_src),
+		'loss_tar2src': float(current_loss_tar)}
+
+def RunJob(job):
+	source_path, reference_path, output_path, rigidity = job
+	result = {'source': source_path, 'target': reference_path,
+		'output': output_path, 'pid': os.getpid()}
+	start = time()
+	try:
+		result.update(DeformPair(source_path, reference_path, output_path,
+			rigidity))
+		result['status'] = 'ok'
+	except Exception as e:
+		result['status'] = 'error'
+		result['error'] = repr(e)
+	result['time'] = time() - start
+	result['mesh_cache_hits'] = state['meshes'].hits
+	result['template_cache_hits'] = state['templates'].hits
+	return result
+
+def main():
+	args = parser.parse_args()
+	jobs = ReadJobs(args)
+	if not args.overwrite:
+		jobs = [job for job in jobs if not os.path.exists(job[2])]
+	for job in jobs:
+		output_dir = os.path.dirname(os.path.abspath(job[2]))
+		if not os.path.exists(output_dir):
+			os.makedirs(output_dir)
+
+	workers = int(args.workers)
+	if workers <= 0:
+		workers = multiprocessing.cpu_count()
+	workers = max(1, min(workers, len(jobs)))
+	threads = int(args.threads)
+	if threads <= 0:
+		threads = max(1, multiprocessing.cpu_count() // workers)
+
+	options = {'threads': threads, 'niter': int(args.niter),
+		'cache_size': int(args.cache_size), 'grid_cache': args.grid_cache,
+		'grid_cache_bytes': args.grid_cache_bytes,
+		'mesh_cache': args.mesh_cache}
+
+	print('%d jobs on %d workers x %d threads' % (len(jobs), workers, threads))
+	log = open(args.log, 'a') if args.log != '' else None
+	start = time()
+	num_errors = 0
+	pool = multiprocessing.Pool(workers, initializer=InitWorker,
+		initargs=(options,))
+	for i, result in enumerate(pool.imap_unordered(RunJob, jobs)):
+		if result['status'] != 'ok':
+			num_errors += 1
+			print('[%d/%d] %s failed: %s' % (i + 1, len(jobs),
+				result['output'], result['error']))
+		else:
+			print('[%d/%d] %s %.2fs loss_src2tar=%.6f loss_tar2src=%.6f'
+				% (i + 1, len(jobs), result['output'], result['time'],
+				   result['loss_src2tar'], result['loss_tar2src']))
+		if log is not None:
+			log.write(json.dumps(result) + '\n')
+			log.flush()
+	pool.close()
+	pool.join()
+	if log is not None:
+		log.close()
+	print('%d jobs, %d failed, %.1fs' % (len(jobs), num_errors, time() - start))
+
+if __name__ == '__main__':
+	main()
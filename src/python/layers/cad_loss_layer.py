@@ -34,8 +34,8 @@ class CadLossLayer(nn.Module):
 	def __init__(self, src_V, src_F, src_E, tar_V, tar_F):
 		super(CadLossLayer, self).__init__()
 		
-		self.param_id = torch.tensor(\
-			pyDeform.InitializeDeformTemplate(tar_V, tar_F, 0, 64))
+		self.template = pyDeform.DeformTemplate(tar_V, tar_F, 0, 64)
+		self.param_id = torch.tensor(self.template.param_id)
 
 		pyDeform.NormalizeByTemplate(src_V, self.param_id.tolist())
 		pyDeform.StoreCadInformation(src_V, src_F, src_E,\
@@ -44,5 +44,8 @@ class CadLossLayer(nn.Module):
 	def forward(self, src_V, src_F, src_E):
 		return CadLossFunction.apply(src_V, src_F, src_E, self.param_id)
 
+	def release(self):
+		self.template.release()
+
 def Finalize(src_V, param_id):
 	pyDeform.DenormalizeByTemplate(src_V, param_id.tolist())
\ No newline at end of file
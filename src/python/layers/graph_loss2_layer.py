@@ -3,23 +3,31 @@ from torch import nn
 from torch.autograd import Function
 import torch
 import pyDeform
+from layers.torch_loss import TorchGraphLoss
+from layers.output_buffer import OutputBuffer
 
 device = None
 
 class GraphLoss2Function(Function):
 	@staticmethod
-	def forward(ctx, V1, E1, rigidity2, param_id1, param_id2):
+	def forward(ctx, V1, E1, rigidity2, param_id1, param_id2, buffers):
 		global device
 		pid1 = param_id1.tolist()
 		pid2 = param_id2.tolist()
 
-		test_V1 = torch.from_numpy(V1.data.cpu().numpy())
+		test_V1 = V1.detach().cpu().contiguous()
 
-		lossD1 = pyDeform.DistanceFieldLoss_forward(test_V1, int(pid2)) * 0.5
-		lossR1 = pyDeform.GraphEdgeLoss_forward(test_V1, E1, int(pid1)) * 0.5
+		lossD1, lossD1_gradient = pyDeform.DistanceFieldLoss_forward_backward(\
+			test_V1, int(pid2), loss_out=OutputBuffer(buffers, 'lossD%d' % pid2,\
+			test_V1.shape[:1], test_V1.dtype))
+		lossD1 = lossD1 * 0.5
+		lossR1 = pyDeform.GraphEdgeLoss_forward(test_V1, E1, int(pid1),\
+			out=OutputBuffer(buffers, 'lossR%d' % pid1, (E1.shape[0], 3),\
+			test_V1.dtype)) * 0.5
 
-		variables = [V1, E1, rigidity2, param_id1, param_id2]
+		variables = [V1, E1, rigidity2, param_id1, param_id2, lossD1_gradient]
 		ctx.save_for_backward(*variables)
+		ctx.buffers = buffers
 
 		return (lossD1.sum() + lossR1.sum() * rigidity2.tolist()).to(device)
 
@@ -30,31 +38,32 @@ class GraphLoss2Function(Function):
 		E1 = ctx.saved_variables[1]
 		rigidity2 = ctx.saved_variables[2]
 		param_id1 = ctx.saved_variables[3].tolist()
-		param_id2 = ctx.saved_variables[4].tolist()
+		lossD1_gradient = ctx.saved_variables[5]
 
-		test_V1 = torch.from_numpy(V1.data.cpu().numpy())
+		test_V1 = V1.detach().cpu().contiguous()
 		
-		lossD1_gradient = pyDeform.DistanceFieldLoss_backward(test_V1, param_id2)
-		lossR1_gradient = pyDeform.GraphEdgeLoss_backward(test_V1, E1, param_id1)
+		lossR1_gradient = pyDeform.GraphEdgeLoss_backward(test_V1, E1, param_id1,\
+			out=OutputBuffer(ctx.buffers, 'lossR_gradient%d' % param_id1,\
+			test_V1.shape, test_V1.dtype))
 
 		return (grad_h*(lossD1_gradient + lossR1_gradient*rigidity2.tolist())).to(device),\
-			None, None, None, None
+			None, None, None, None, None
 
 
 class GraphLoss2Layer(nn.Module):
 	def __init__(self, V1, F1, graph_V1, graph_E1,
 		V2, F2, graph_V2, graph_E2,
-		rigidity, d=torch.device('cpu')):
+		rigidity, d=torch.device('cpu'), backend='cpp'):
 		super(GraphLoss2Layer, self).__init__()
 
 		global device
 		device = d
 
-		self.param_id1 = torch.tensor(\
-			pyDeform.InitializeDeformTemplate(V1, F1, 0, 64))
+		self.template1 = pyDeform.DeformTemplate(V1, F1, 0, 64)
+		self.param_id1 = torch.tensor(self.template1.param_id)
 
-		self.param_id2 = torch.tensor(\
-			pyDeform.InitializeDeformTemplate(V2, F2, 0, 64))
+		self.template2 = pyDeform.DeformTemplate(V2, F2, 0, 64)
+		self.param_id2 = torch.tensor(self.template2.param_id)
 
 		pyDeform.NormalizeByTemplate(graph_V1, self.param_id1.tolist())
 		pyDeform.NormalizeByTemplate(graph_V2, self.param_id2.tolist())
@@ -62,14 +71,36 @@ class GraphLoss2Layer(nn.Module):
 		pyDeform.StoreGraphInformation(graph_V1, graph_E1, self.param_id1.tolist())
 		pyDeform.StoreGraphInformation(graph_V2, graph_E2, self.param_id2.tolist())
 		self.rigidity2 = torch.tensor(rigidity * rigidity)
+		self.buffers = {}
+
+		# 'cpp' evaluates the losses in pyDeform on the CPU, 'torch' with
+		# tensor ops on the device of the deformed vertices
+		self.backend = backend
+		if backend == 'torch':
+			self.torch_loss1 = TorchGraphLoss(self.param_id1.tolist(), d)
+			self.torch_loss2 = TorchGraphLoss(self.param_id2.tolist(), d)
+		elif backend != 'cpp':
+			raise ValueError('unknown backend %s' % backend)
 
 	def forward(self, V1, E1, V2, E2, direction):
+		if self.backend == 'torch':
+			if direction == 0:
+				V, edge_loss, distance_loss = V1, self.torch_loss1, self.torch_loss2
+			else:
+				V, edge_loss, distance_loss = V2, self.torch_loss2, self.torch_loss1
+			return distance_loss.distance(V).sum() * 0.5\
+				+ edge_loss.edge(V).sum() * (0.5 * self.rigidity2.item())
+
 		if direction == 0:
 			return GraphLoss2Function.apply(V1, E1,\
-				self.rigidity2, self.param_id1, self.param_id2)
+				self.rigidity2, self.param_id1, self.param_id2, self.buffers)
 
 		return GraphLoss2Function.apply(V2, E2,\
-			self.rigidity2, self.param_id2, self.param_id1)
+			self.rigidity2, self.param_id2, self.param_id1, self.buffers)
+
+	def release(self):
+		self.template1.release()
+		self.template2.release()
 
 def Finalize(src_V, src_F, src_E, src_to_graph, graph_V, rigidity, param_id):
 	pyDeform.NormalizeByTemplate(src_V, param_id.tolist())
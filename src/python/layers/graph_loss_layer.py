@@ -3,22 +3,29 @@ from torch import nn
 from torch.autograd import Function
 import torch
 import pyDeform
+from layers.output_buffer import OutputBuffer
 
 device = None
 
 class GraphLossFunction(Function):
 	@staticmethod
-	def forward(ctx, src_V, src_E, rigidity2, param_id):
+	def forward(ctx, src_V, src_E, rigidity2, param_id, buffers):
 		global device
 		pid = param_id.tolist()
 
-		test_V = torch.from_numpy(src_V.data.cpu().numpy())
-		lossD = pyDeform.DistanceFieldLoss_forward(test_V, int(pid)) * 0.5
-		lossR = pyDeform.GraphEdgeLoss_forward(test_V, src_E, int(pid)) * 0.5
+		test_V = src_V.detach().cpu().contiguous()
+		lossD, lossD_gradient = pyDeform.DistanceFieldLoss_forward_backward(\
+			test_V, int(pid), loss_out=OutputBuffer(buffers, 'lossD',\
+			test_V.shape[:1], test_V.dtype))
+		lossD = lossD * 0.5
+		lossR = pyDeform.GraphEdgeLoss_forward(test_V, src_E, int(pid),\
+			out=OutputBuffer(buffers, 'lossR', (src_E.shape[0], 3),\
+			test_V.dtype)) * 0.5
 		mask_D = lossD < (0.5 * 0.03 * 0.03)
 
-		variables = [src_V, src_E, rigidity2, param_id, mask_D]
+		variables = [src_V, src_E, rigidity2, param_id, mask_D, lossD_gradient]
 		ctx.save_for_backward(*variables)
+		ctx.buffers = buffers
 
 		return (lossD.sum() + lossR.sum() * rigidity2.tolist()).to(device)
 
@@ -33,32 +40,44 @@ class GraphLossFunction(Function):
 		mask_D = mask_D.view(mask_D.shape[0],1)
 		mask_D = torch.cat((mask_D,mask_D,mask_D),axis=1)
 
-		test_V = torch.from_numpy(src_V.data.cpu().numpy())
-		lossD_gradient = pyDeform.DistanceFieldLoss_backward(test_V, param_id)
-		lossR_gradient = pyDeform.GraphEdgeLoss_backward(test_V, src_E, param_id)
+		lossD_gradient = ctx.saved_variables[5]
 
-		lossD_gradient *= mask_D
+		test_V = src_V.detach().cpu().contiguous()
+		lossR_gradient = pyDeform.GraphEdgeLoss_backward(test_V, src_E, param_id,\
+			out=OutputBuffer(ctx.buffers, 'lossR_gradient', test_V.shape,\
+			test_V.dtype))
+
+		lossD_gradient = lossD_gradient * mask_D
 
 		return (grad_h*(lossD_gradient + lossR_gradient*rigidity2.tolist())).to(device),\
-			None, None, None
+			None, None, None, None
 
 
 class GraphLossLayer(nn.Module):
-	def __init__(self, src_V, src_E, tar_V, tar_F, rigidity, d=torch.device('cpu')):
+	def __init__(self, src_V, src_E, tar_V, tar_F, rigidity, d=torch.device('cpu'),
+		template=None):
 		super(GraphLossLayer, self).__init__()
 
 		global device
 		device = d
-		self.param_id = torch.tensor(\
-			pyDeform.InitializeDeformTemplate(tar_V, tar_F, 0, 64))
+		# an existing template of (tar_V, tar_F) may be reused; the source
+		# information stored below replaces that of its previous user
+		if template is None:
+			template = pyDeform.DeformTemplate(tar_V, tar_F, 0, 64)
+		self.template = template
+		self.param_id = torch.tensor(self.template.param_id)
 
 		pyDeform.NormalizeByTemplate(src_V, self.param_id.tolist())
 		pyDeform.StoreGraphInformation(src_V, src_E, self.param_id.tolist())
 		self.rigidity2 = torch.tensor(rigidity * rigidity)
+		self.buffers = {}
 
 	def forward(self, src_V, src_E):
 		return GraphLossFunction.apply(src_V, src_E,\
-			self.rigidity2, self.param_id)
+			self.rigidity2, self.param_id, self.buffers)
+
+	def release(self):
+		self.template.release()
 
 def Finalize(src_V, src_F, src_E, src_to_graph, graph_V, rigidity, param_id):
 	pyDeform.NormalizeByTemplate(src_V, param_id.tolist())
@@ -1,6 +1,7 @@
 import torch
 from torch import nn
-from torchdiffeq import odeint
+from torch.utils.checkpoint import checkpoint
+from torchdiffeq import odeint, odeint_adjoint
 
 import numpy as np
 
@@ -25,15 +26,72 @@ class ODEFunc(nn.Module):
                 nn.init.constant_(m.bias, val=0)
 
     def forward(self, t, y):
-        new_t = t.repeat(y.shape[0],1)
-        yt = torch.cat((y,new_t), 1)
-        res = self.net(yt - 0.5)
+        return self.evaluate(y, t - 0.5)
+
+    def evaluate(self, y, t_centered):
+        # net(cat(y, t) - 0.5) without building the [N, 4] input: the time
+        # column of the first layer only shifts its bias. t_centered is
+        # t - 0.5, either shared or one value per row.
+        first = self.net[0]
+        weight = first.weight[:, :3].t()
+        if t_centered.dim() == 0:
+            res = torch.addmm(first.bias + t_centered * first.weight[:, 3],
+                y - 0.5, weight)
+        else:
+            res = torch.addmm(first.bias, y - 0.5, weight).addr_(
+                t_centered, first.weight[:, 3])
+        for i in range(1, len(self.net)):
+            res = self.net[i](res)
         return res
-        #return self.net(yt-0.5)
+
+class ForwardInverseFunc(nn.Module):
+    # Integrates num_forward points from t = 0 to 1 and num_inverse points
+    # from t = 1 to 0 as one state over s = 0 to 1: the inverse rows see
+    # t = 1 - s and move along the negated field. Time offsets and signs
+    # are allocated once per pair of sizes.
+    def __init__(self, func, num_forward, num_inverse, device):
+        super(ForwardInverseFunc, self).__init__()
+        self.func = func
+        self.sizes = (num_forward, num_inverse)
+        self.sign = torch.ones(num_forward + num_inverse, device=device)
+        self.sign[num_forward:] = -1
+        self.offset = self.sign * -0.5
+        self.sign_column = self.sign.view(-1, 1)
+
+    def forward(self, s, y):
+        t_centered = torch.addcmul(self.offset, self.sign, s)
+        return self.func.evaluate(y, t_centered).mul_(self.sign_column)
+
+class CheckpointFunc(nn.Module):
+    # Recomputes the hidden activations of func during backward instead of
+    # storing them for every solver stage.
+    def __init__(self, func):
+        super(CheckpointFunc, self).__init__()
+        self.func = func
+
+    def forward(self, t, y):
+        return checkpoint(self.func, t, y, use_reentrant=False)
+
+BACKPROP_MODES = ('direct', 'adjoint', 'checkpoint')
 
 class NeuralODE():
-    def __init__(self, device=torch.device('cpu')):
+    # Checkpoints pickle the whole object, so attributes added later need
+    # class-level defaults for older checkpoints to load.
+    backprop = 'direct'
+    joint_func = None
+
+    # backprop: how gradients reach the solve.
+    #   direct: through every solver stage, which are all kept in memory
+    #   adjoint: by solving the adjoint ODE backwards (odeint_adjoint);
+    #     memory does not grow with the steps, about twice the compute
+    #   checkpoint: keeps only the input of every network evaluation and
+    #     reruns it during backward; exact gradients for one extra forward
+    def __init__(self, device=torch.device('cpu'), backprop='direct'):
         super(NeuralODE, self).__init__()
+        if backprop not in BACKPROP_MODES:
+            raise ValueError('backprop must be one of %s, got %s'
+                % (', '.join(BACKPROP_MODES), backprop))
+        self.backprop = backprop
         self.timing = torch.from_numpy(np.array([0, 1]).astype('float32'))
         self.timing_inv = torch.from_numpy(np.array([1, 0]).astype('float32'))
         self.timing = self.timing.to(device)
@@ -52,13 +110,58 @@ class NeuralODE():
     def parameters(self):
         return self.func.parameters()
 
+    def solve(self, func, u, timing):
+        if self.backprop == 'adjoint':
+            return odeint_adjoint(func, u, timing, method="rk4", rtol=1e-4, atol=1e-4)[1]
+        if self.backprop == 'checkpoint' and torch.is_grad_enabled():
+            func = CheckpointFunc(func)
+        return odeint(func, u, timing, method="rk4", rtol=1e-4, atol=1e-4)[1]
+
     def forward(self, u):
-        y = odeint(self.func, u, self.timing, method="rk4", rtol=1e-4, atol=1e-4)[1]
-        return y
+        return self.solve(self.func, u, self.timing)
+
+    def forward_inverse(self, u1, u2):
+        # forward(u1) and inverse(u2) as a single solve, so each stage
+        # evaluates the network once on both point sets
+        n1 = u1.shape[0]
+        n2 = u2.shape[0]
+        joint = self.joint_func
+        if joint is None or joint.sizes != (n1, n2) or\
+            joint.func is not self.func or\
+            joint.sign.device != self.timing.device:
+            joint = ForwardInverseFunc(self.func, n1, n2, self.timing.device)
+            self.joint_func = joint
+        y = self.solve(joint, torch.cat((u1, u2), 0), self.timing)
+        return y[:n1], y[n1:]
 
     def inverse(self, u):
-        return odeint(self.func, u, self.timing_inv, method="rk4", rtol=1e-4, atol=1e-4)[1]
+        return self.solve(self.func, u, self.timing_inv)
+
+    def trajectory(self, u, times, chunk_size=0, script=False):
+        # The states at all times (u being the state at times[0]) as a
+        # [len(times), N, 3] tensor. The fixed-grid rk4 steps between the
+        # times it is given, so every state is one step from times[0], the
+        # discretization forward() and inverse() are trained with; a solve
+        # through all times would end elsewhere. For inference only: no
+        # graph is recorded, and the points are integrated chunk_size at a
+        # time (all at once if <= 0). script evaluates the field through a
+        # TorchScript trace of it.
+        times = torch.tensor(times, dtype=torch.float32, device=self.timing.device)
+        if chunk_size <= 0:
+            chunk_size = max(u.shape[0], 1)
+        with torch.no_grad():
+            func = self.func
+            if script:
+                func = torch.jit.trace(self.func, (times[0], u[:1]),
+                    check_trace=False)
+            frames = [u]
+            for t in times[1:]:
+                timing = torch.stack((times[0], t))
+                frames.append(torch.cat([odeint(func, chunk, timing,
+                    method="rk4", rtol=1e-4, atol=1e-4)[1]
+                    for chunk in u.split(chunk_size)], 0))
+            return torch.stack(frames)
 
     def integrate(self, u, t1, t2, device):
         new_time = torch.from_numpy(np.array([t1,t2]).astype('float32')).to(device)
-        return odeint(self.func, u, new_time, method="rk4", rtol=1e-4, atol=1e-4)[1]
\ No newline at end of file
+        return self.solve(self.func, u, new_time)
\ No newline at end of file
@@ -0,0 +1,10 @@
+import torch
+
+def OutputBuffer(buffers, name, shape, dtype):
+	# pyDeform writes into these instead of allocating on every call; only
+	# for results that are consumed before the next call
+	buf = buffers.get(name)
+	if buf is None or buf.shape != shape or buf.dtype != dtype:
+		buf = torch.empty(shape, dtype=dtype)
+		buffers[name] = buf
+	return buf
@@ -2,25 +2,64 @@ import math
 from torch import nn
 from torch.autograd import Function
 import torch
+import pyDeform
 
-from sklearn.neighbors import NearestNeighbors
-from scipy.spatial import cKDTree
-from time import time
+class ReverseLossFunction(Function):
+	@staticmethod
+	def forward(ctx, src_V, tar_V, index, target_index, num_threads):
+		src_V_cpu = src_V.detach().cpu().contiguous()
+		tar_V_cpu = tar_V.detach().cpu().contiguous()
+
+		loss, gradient = pyDeform.ReverseLoss_forward_backward(index,\
+			src_V_cpu, tar_V_cpu, target_index, num_threads)
+
+		ctx.save_for_backward(gradient.to(src_V.device))
+		return loss.to(src_V.device)
+
+	@staticmethod
+	def backward(ctx, grad_h):
+		gradient = ctx.saved_variables[0]
+		return grad_h * gradient, None, None, None, None
 
 class ReverseLossLayer(nn.Module):
-	def __init__(self):
+	# max_displacement: how far the source may move before its index is
+	# rebuilt instead of refit (0 means half a grid cell)
+	# chamfer: also pull every source vertex to its nearest target vertex
+	def __init__(self, max_displacement=0.0, num_threads=0, chamfer=False):
 		super(ReverseLossLayer, self).__init__()
-		
-	def forward(self, src_V, tar_V, device=torch.device('cpu')):
-		src_V_numpy = src_V.data.cpu().numpy()
-		tar_V_numpy = tar_V.data.cpu().numpy()
-
-		tree = cKDTree(src_V_numpy)
-		dd, ii = tree.query(tar_V_numpy, k=1, n_jobs=4)
+		self.max_displacement = max_displacement
+		self.num_threads = num_threads
+		self.chamfer = chamfer
+		self.indices = {}
 
-		src_V_c = src_V[ii]
-		loss = src_V_c - tar_V.to(device)
+	def Indices(self, src_V, tar_V):
+		# the scripts alternate between fixed targets, each matched against
+		# its own deforming source, so keep one index pair per target. The
+		# entry holds on to the target, so that no other tensor can reuse
+		# its address while the target index is cached.
+		key = (tar_V.data_ptr(), src_V.shape[0])
+		entry = self.indices.get(key)
+		if entry is None:
+			if len(self.indices) >= 8:
+				self.indices.clear()
+			src_V_cpu = src_V.detach().cpu().contiguous()
+			tar_V_cpu = tar_V.detach().cpu().contiguous()
+			index = pyDeform.PointIndex(src_V_cpu, self.max_displacement)
+			target_index = None
+			if self.chamfer:
+				target_index = pyDeform.PointIndex(tar_V_cpu)
+			entry = (index, target_index, tar_V)
+			self.indices[key] = entry
+		return entry[:2]
 
-		loss = 0.5 * (loss * loss).sum()
+	def NearestSource(self, src_V, tar_V):
+		index = self.Indices(src_V, tar_V)[0]
+		index.refit(src_V.detach().cpu().contiguous())
+		ii, dd = index.query(tar_V.detach().cpu().contiguous(),\
+			self.num_threads)
+		return ii
 
-		return loss
\ No newline at end of file
+	def forward(self, src_V, tar_V, device=torch.device('cpu')):
+		index, target_index = self.Indices(src_V, tar_V)
+		return ReverseLossFunction.apply(src_V, tar_V.to(device), index,\
+			target_index, self.num_threads)
@@ -31,8 +31,8 @@ class RigidLossLayer(nn.Module):
 	def __init__(self, src_V, src_F, tar_V, tar_F):
 		super(RigidLossLayer, self).__init__()
 		
-		self.param_id = torch.tensor(\
-			pyDeform.InitializeDeformTemplate(tar_V, tar_F, 0, 64))
+		self.template = pyDeform.DeformTemplate(tar_V, tar_F, 0, 64)
+		self.param_id = torch.tensor(self.template.param_id)
 
 		pyDeform.NormalizeByTemplate(src_V, self.param_id.tolist())
 		pyDeform.StoreRigidityInformation(src_V, src_F, self.param_id.tolist())
@@ -40,5 +40,8 @@ class RigidLossLayer(nn.Module):
 	def forward(self, src_V, src_F):
 		return RigidLossFunction.apply(src_V, src_F, self.param_id)
 
+	def release(self):
+		self.template.release()
+
 def Finalize(src_V, param_id):
 	pyDeform.DenormalizeByTemplate(src_V, param_id.tolist())
\ No newline at end of file
@@ -0,0 +1,66 @@
+import torch
+import pyDeform
+
+# Tensor-op versions of the pyDeform graph losses. They run on the device of
+# their inputs and are differentiated by autograd, so training on the GPU
+# needs no copy to the CPU per step. Values and gradients match the C++
+# kernels up to float rounding.
+
+def DistanceFieldLoss(V, grid):
+	# Squared distance of every row of V [N, 3] to the target, read from
+	# grid [n, n, n] (pyDeform.DistanceFieldGrid) exactly like
+	# UniformGrid::DistanceFloat: trilinear inside the grid, distances
+	# above 0.2 clamped to zero, and a linear penalty outside it.
+	n = grid.shape[0]
+	P = V * n
+	cell = P.detach().long()
+	outside = ((cell < 0) | (cell >= n - 1)).any(dim=1)
+
+	penalty = torch.where(cell < 0, -P, torch.where(cell >= n,\
+		P - (n - 1 - 1e-3), torch.zeros_like(P))).sum(dim=1)
+
+	cell = cell.clamp(0, n - 2)
+	w = torch.where(outside.unsqueeze(1), torch.zeros_like(P), P - cell)
+	wx, wy, wz = w[:, 0], w[:, 1], w[:, 2]
+	ux, uy, uz = 1 - wx, 1 - wy, 1 - wz
+
+	voxels = grid.reshape(-1)
+	base = (cell[:, 2] * n + cell[:, 1]) * n + cell[:, 0]
+	c = [voxels[base + (t >> 2) * n * n + ((t >> 1) & 1) * n + (t & 1)]\
+		for t in range(8)]
+
+	d = ux * uy * uz * c[0] + wx * uy * uz * c[1]\
+		+ ux * wy * uz * c[2] + wx * wy * uz * c[3]\
+		+ ux * uy * wz * c[4] + wx * uy * wz * c[5]\
+		+ ux * wy * wz * c[6] + wx * wy * wz * c[7]
+	d = torch.where(d > 0.2, torch.zeros_like(d), d)
+
+	d = torch.where(outside, penalty, d)
+	return d * d
+
+def GraphEdgeLoss(V, edge_vertex, edge_offset, edge_lambda=None):
+	# Squared residuals (v1 - v0 - edge_offset) * edge_lambda, [E, 3], for
+	# the terms returned by pyDeform.EdgeTerms.
+	r = V[edge_vertex[:, 1]] - V[edge_vertex[:, 0]] - edge_offset
+	if edge_lambda is not None:
+		r = r * edge_lambda.unsqueeze(1)
+	return r * r
+
+class TorchGraphLoss(object):
+	# The grid and edge terms of one template, copied to device once. The
+	# edge terms are weighted if they were stored with weights
+	# (StoreCadInformation), like CadEdgeLoss.
+	def __init__(self, param_id, device):
+		self.grid = pyDeform.DistanceFieldGrid(param_id).to(device)
+		edge_vertex, edge_offset, edge_lambda = pyDeform.EdgeTerms(param_id)
+		self.edge_vertex = edge_vertex.long().to(device)
+		self.edge_offset = edge_offset.to(device)
+		self.edge_lambda = edge_lambda.to(device)\
+			if edge_lambda.numel() > 0 else None
+
+	def distance(self, V):
+		return DistanceFieldLoss(V, self.grid)
+
+	def edge(self, V):
+		return GraphEdgeLoss(V, self.edge_vertex, self.edge_offset,
+			self.edge_lambda)
@@ -0,0 +1,94 @@
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(os.path.dirname(os.path.abspath(__file__)) + '/layers')
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'build')))
+
+import multiprocessing
+import resource
+import tempfile
+from time import time
+
+import torch
+
+import argparse
+
+parser = argparse.ArgumentParser(description='Time and memory of the NeuralODE backprop modes.')
+parser.add_argument('--source', default='../data/cad-source.obj')
+parser.add_argument('--device', default='cpu')
+parser.add_argument('--iterations', default='5')
+parser.add_argument('--modes', default='direct,adjoint,checkpoint')
+# neuralode_fast (fixed-step rk4) or neuralode (adaptive dopri5)
+parser.add_argument('--solver', default='neuralode_fast')
+
+# One forward solve and backward pass per iteration, the same flow the
+# training scripts run. On CUDA the peak is what the caching allocator
+# handed out; on the CPU it is the growth of the peak resident size of a
+# fresh process, so every case runs in its own process.
+def Run(job):
+	points_path, name, mode, solver, device, iterations = job
+	import importlib
+	NeuralODE = importlib.import_module('layers.' + solver).NeuralODE
+	device = torch.device(device)
+	u = torch.load(points_path)[name].to(device)
+
+	torch.manual_seed(0)
+	func = NeuralODE(device, mode)
+	# the first backward pass of a mode loads modules and sets up its
+	# machinery, so warm up on a few points outside the measurement
+	func.forward(u[:16]).sum().backward()
+	func.func.zero_grad()
+	if device.type == 'cuda':
+		torch.cuda.synchronize()
+		torch.cuda.reset_peak_memory_stats()
+		base = torch.cuda.memory_allocated()
+	else:
+		base = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+	start = time()
+	for i in range(iterations):
+		y = func.forward(u)
+		loss = (y * y).sum()
+		loss.backward()
+	if device.type == 'cuda':
+		torch.cuda.synchronize()
+		peak = torch.cuda.max_memory_allocated() - base
+	else:
+		peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024 - base
+	seconds = (time() - start) / iterations
+
+	# numpy, since tensors would be returned through shared memory owned
+	# by the exiting worker
+	gradient = torch.cat([p.grad.flatten() for p in func.parameters()])
+	return seconds, peak, gradient.cpu().numpy()
+
+def main():
+	args = parser.parse_args()
+	import pyDeform
+	V1, F1, E1, V2G1, GV1, GE1 = pyDeform.LoadCadMesh(args.source)
+
+	points = tempfile.NamedTemporaryFile(suffix='.pt', delete=False)
+	points.close()
+	torch.save({'GV1': GV1, 'V1': V1}, points.name)
+
+	pool = multiprocessing.get_context('spawn').Pool(1, maxtasksperchild=1)
+	try:
+		for name, u in [('GV1', GV1), ('V1', V1)]:
+			reference = None
+			for mode in args.modes.split(','):
+				seconds, peak, gradient = pool.apply(Run, ((points.name, name,
+					mode, args.solver, args.device, int(args.iterations)),))
+				if reference is None:
+					reference = gradient
+				error = abs(gradient - reference).max() /\
+					max(abs(reference).max(), 1e-12)
+				print('%-4s %6d points  %-10s %8.3f s/iter %10.1f MB peak'
+					'  grad rel diff %.2e' % (name, u.shape[0], mode, seconds,
+					peak / 2.0**20, error))
+	finally:
+		pool.close()
+		pool.join()
+		os.remove(points.name)
+
+if __name__ == '__main__':
+	main()
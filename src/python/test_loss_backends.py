@@ -0,0 +1,100 @@
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'build')))
+
+import pytest
+import torch
+pyDeform = pytest.importorskip('pyDeform')
+from layers.torch_loss import TorchGraphLoss
+
+# The torch backend of the graph losses (layers/torch_loss.py) against the
+# pyDeform kernels on CPU: values and gradients must agree up to float
+# rounding. Run with python -m pytest src/python/test_loss_backends.py.
+
+DATA = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..',
+	'data')
+RTOL = 1e-4
+ATOL = 1e-5
+
+@pytest.fixture(scope='module')
+def meshes():
+	V1, F1, E1, V2G1, GV1, GE1 = pyDeform.LoadCadMesh(
+		os.path.join(DATA, 'cad-source.obj'))
+	V2, F2, E2, V2G2, GV2, GE2 = pyDeform.LoadCadMesh(
+		os.path.join(DATA, 'cad-target.obj'))
+	graph = pyDeform.DeformTemplate(V1, F1, 0, 64)
+	target = pyDeform.DeformTemplate(V2, F2, 0, 64)
+	pyDeform.NormalizeByTemplate(GV1, graph.param_id)
+	pyDeform.StoreGraphInformation(GV1, GE1, graph.param_id)
+
+	# perturb the graph so that both the edge residuals and the distances
+	# are nonzero, and push a few vertices out of the grid
+	torch.manual_seed(0)
+	V = GV1 + torch.randn_like(GV1) * 0.02
+	V[:4] = torch.tensor([[-0.1, 0.5, 0.5], [1.05, 0.5, 0.5],
+		[0.5, 1.2, -0.3], [0.999, 0.5, 0.5]])
+	yield {'V': V, 'GE1': GE1, 'V1': V1, 'F1': F1, 'E1': E1,
+		'graph': graph, 'target': target}
+	graph.release()
+	target.release()
+
+def TorchLossAndGradient(func, V):
+	V = V.clone().requires_grad_()
+	loss = func(V)
+	gradient, = torch.autograd.grad(loss.sum() * 0.5, V)
+	return loss.detach(), gradient
+
+def test_distance_field_loss(meshes):
+	V = meshes['V']
+	param_id = meshes['target'].param_id
+	loss, gradient = pyDeform.DistanceFieldLoss_forward_backward(V, param_id)
+	torch_loss, torch_gradient = TorchLossAndGradient(
+		TorchGraphLoss(param_id, torch.device('cpu')).distance, V)
+	torch.testing.assert_close(torch_loss, loss, rtol=RTOL, atol=ATOL)
+	torch.testing.assert_close(torch_gradient, gradient, rtol=RTOL, atol=ATOL)
+
+def test_graph_edge_loss(meshes):
+	V, E = meshes['V'], meshes['GE1']
+	param_id = meshes['graph'].param_id
+	loss = pyDeform.GraphEdgeLoss_forward(V, E, param_id)
+	gradient = pyDeform.GraphEdgeLoss_backward(V, E, param_id)
+	torch_loss, torch_gradient = TorchLossAndGradient(
+		TorchGraphLoss(param_id, torch.device('cpu')).edge, V)
+	torch.testing.assert_close(torch_loss, loss, rtol=RTOL, atol=ATOL)
+	torch.testing.assert_close(torch_gradient, gradient, rtol=RTOL, atol=ATOL)
+
+def test_weighted_edge_loss(meshes):
+	# the edge terms of StoreCadInformation carry edge_lambda
+	V1, F1, E1 = meshes['V1'].clone(), meshes['F1'], meshes['E1']
+	template = pyDeform.DeformTemplate(V1, F1, 0, 16)
+	try:
+		pyDeform.NormalizeByTemplate(V1, template.param_id)
+		pyDeform.StoreCadInformation(V1, F1, E1, template.param_id)
+		torch.manual_seed(1)
+		V = V1 + torch.randn_like(V1) * 0.01
+		loss = pyDeform.CadEdgeLoss_forward(V, F1, E1, template.param_id)
+		gradient = pyDeform.CadEdgeLoss_backward(V, F1, E1,
+			template.param_id)
+		torch_loss, torch_gradient = TorchLossAndGradient(
+			TorchGraphLoss(template.param_id, torch.device('cpu')).edge, V)
+	finally:
+		template.release()
+	torch.testing.assert_close(torch_loss, loss, rtol=RTOL, atol=ATOL)
+	torch.testing.assert_close(torch_gradient, gradient, rtol=RTOL, atol=ATOL)
+
+def test_restored_graph_edge_loss(meshes):
+	# StoreGraphInformation over StoreCadInformation must drop edge_lambda
+	V1, F1, E1 = meshes['V1'].clone(), meshes['F1'], meshes['E1']
+	V, E = meshes['V'], meshes['GE1']
+	template = pyDeform.DeformTemplate(V1, F1, 0, 16)
+	try:
+		pyDeform.NormalizeByTemplate(V1, template.param_id)
+		pyDeform.StoreCadInformation(V1, F1, E1, template.param_id)
+		pyDeform.StoreGraphInformation(V, E, template.param_id)
+		loss = pyDeform.GraphEdgeLoss_forward(V, E, template.param_id)
+		torch_loss, _ = TorchLossAndGradient(
+			TorchGraphLoss(template.param_id, torch.device('cpu')).edge, V)
+	finally:
+		template.release()
+	torch.testing.assert_close(torch_loss, loss, rtol=RTOL, atol=ATOL)